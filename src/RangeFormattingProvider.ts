@@ -0,0 +1,71 @@
+import * as vscode from 'vscode';
+import axios from 'axios';
+import { SERVER_URL } from './extension';
+
+interface ServerPosition {
+    line: number;
+    character: number;
+}
+
+interface RangeEdit {
+    range: { start: ServerPosition; end: ServerPosition };
+    new_text: string;
+}
+
+interface RangeFormatResponse {
+    edits: RangeEdit[];
+    errors: string[];
+}
+
+// Formats only the members around a selection, or around a typed '}' or ';'
+export class RangeFormattingProvider implements vscode.DocumentRangeFormattingEditProvider, vscode.OnTypeFormattingEditProvider {
+    constructor(private readonly getSettings: () => Promise<any>) {}
+
+    async provideDocumentRangeFormattingEdits(
+        document: vscode.TextDocument,
+        range: vscode.Range,
+        options: vscode.FormattingOptions,
+        token: vscode.CancellationToken
+    ): Promise<vscode.TextEdit[]> {
+        return this.formatRange(document, range, token);
+    }
+
+    async provideOnTypeFormattingEdits(
+        document: vscode.TextDocument,
+        position: vscode.Position,
+        ch: string,
+        options: vscode.FormattingOptions,
+        token: vscode.CancellationToken
+    ): Promise<vscode.TextEdit[]> {
+        // The typed character is right before the cursor
+        const typed = new vscode.Range(position.translate(0, -1), position);
+        return this.formatRange(document, typed, token);
+    }
+
+    private async formatRange(document: vscode.TextDocument, range: vscode.Range, token: vscode.CancellationToken): Promise<vscode.TextEdit[]> {
+        const settings = await this.getSettings();
+        if (!settings || token.isCancellationRequested) {
+            return [];
+        }
+
+        try {
+            const response = await axios.post(`${SERVER_URL}/format/range`, {
+                code: document.getText(),
+                settings: settings,
+                range: {
+                    start: { line: range.start.line, character: range.start.character },
+                    end: { line: range.end.line, character: range.end.character }
+                }
+            });
+
+            const formatResponse = response.data as RangeFormatResponse;
+            return formatResponse.edits.map(edit => vscode.TextEdit.replace(
+                new vscode.Range(edit.range.start.line, edit.range.start.character, edit.range.end.line, edit.range.end.character),
+                edit.new_text
+            ));
+        } catch (error) {
+            console.error('Error in range formatting:', error);
+            return [];
+        }
+    }
+}
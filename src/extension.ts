@@ -5,6 +5,7 @@ import axios from 'axios';
 import WebSocket from 'ws';
 import { pdfGenerator } from './pdfGenerator';
 import { InlineCompletionProvider } from "./InlineCompletionProvider";
+import { RangeFormattingProvider } from "./RangeFormattingProvider";
 import Ajv from 'ajv';
 
 interface FormatResponse {
@@ -170,6 +171,13 @@ export async function activate(context: vscode.ExtensionContext) : Promise<void>
         vscode.languages.registerInlineCompletionItemProvider( {language: 'java'}, completionProvider)
     );
 
+    // Selection and on-type formatting only reformat the members around the edit
+    const rangeFormattingProvider = new RangeFormattingProvider(() => getFormatSettings(context));
+    context.subscriptions.push(
+        vscode.languages.registerDocumentRangeFormattingEditProvider({language: 'java'}, rangeFormattingProvider),
+        vscode.languages.registerOnTypeFormattingEditProvider({language: 'java'}, rangeFormattingProvider, '}', ';')
+    );
+
 	// Register the command to format code
 	context.subscriptions.push(
 		vscode.commands.registerCommand('javacodeassistant.format', async () => {
@@ -487,7 +495,8 @@ async function formatCode(document: vscode.TextDocument, context: vscode.Extensi
         const doFormat = async () => {
             const response = await axios.post(`${SERVER_URL}/format`, {
             code: text,
-            settings: settings
+            settings: settings,
+            document_id: document.uri.toString()
             });
 
             const formatResponse = response.data as FormatResponse;
@@ -533,6 +542,17 @@ async function formatCode(document: vscode.TextDocument, context: vscode.Extensi
 	}
 }
 
+async function getFormatSettings(context: vscode.ExtensionContext) {
+    const configs = vscode.workspace.getConfiguration("javacodeassistant");
+    try {
+        const customSettings = await loadProjectSettings(configFileName, context);
+        return customSettings || JSON.parse(JSON.stringify(configs));
+    } catch (error) {
+        vscode.window.showErrorMessage(`${error}`);
+        return undefined;
+    }
+}
+
 function extractError(errorMessage: string) {
 	const regex = /Line (\d+), Column (\d+):(\w+) '([^']+)'/;
     const match = errorMessage.match(regex);
@@ -0,0 +1,181 @@
+import asyncio
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+import Metrics
+
+# Lower runs first: latency-sensitive autocomplete, then format, refine and bulk work
+PRIORITIES = {
+    "autocomplete": 0,
+    "format": 1,
+    "refine": 2,
+    "analyze": 3,
+    "format_batch": 3,
+}
+
+DEFAULT_QUEUE_LIMITS = {
+    "autocomplete": 8,
+    "format": 64,
+    "refine": 8,
+    "analyze": 32,
+    "format_batch": 32,
+}
+
+# Longest a request may wait for a slot before it is shed. Autocomplete stays under the
+# extension's 5 second request timeout; None waits as long as it takes.
+DEFAULT_MAX_WAIT = {
+    "autocomplete": 3.0,
+    "format": 30.0,
+    "refine": 60.0,
+    "analyze": None,
+    "format_batch": None,
+}
+
+queue_depth = Metrics.registry.gauge(
+    "codegator_admission_queue_depth", "Requests waiting for an admission slot", ("endpoint",))
+active_requests = Metrics.registry.gauge(
+    "codegator_admission_active", "Requests holding an admission slot", ("endpoint",))
+shed_total = Metrics.registry.counter(
+    "codegator_admission_shed_total", "Requests rejected by admission control", ("endpoint", "reason"))
+admitted_total = Metrics.registry.counter(
+    "codegator_admission_admitted_total", "Requests admitted by admission control", ("endpoint",))
+
+
+class Overloaded(Exception):
+    def __init__(self, endpoint, reason, status_code, retry_after):
+        super().__init__(f"Server overloaded ({endpoint}: {reason}), retry in {retry_after}s")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Shares a fixed number of slots between all endpoints, by priority.
+
+    Each endpoint has a bounded wait queue; a request that finds it full is
+    rejected right away (429), and one that waits longer than the endpoint's
+    max wait is rejected too (503), both with a Retry-After estimate. Free slots
+    go to the waiting request with the best priority. Refine, analyze and batch
+    formatting together may not take the last slot, so autocomplete and format
+    never wait behind them only (unless there is a single slot to share).
+    """
+    def __init__(self, slots, queue_limits=None, max_wait=None):
+        self.slots = slots
+        self.queue_limits = dict(DEFAULT_QUEUE_LIMITS, **(queue_limits or {}))
+        self.max_wait = dict(DEFAULT_MAX_WAIT, **(max_wait or {}))
+        # Slots the endpoints below format may hold between them
+        self.low_priority_slots = max(1, slots - 1)
+        self.in_use = 0
+        self.low_priority_in_use = 0
+        self.active = {endpoint: 0 for endpoint in PRIORITIES}
+        self.waiting = []
+        self._sequence = itertools.count()
+        self._service_time = {endpoint: 1.0 for endpoint in PRIORITIES}
+
+    @classmethod
+    def from_env(cls, default_slots):
+        slots = int(os.environ.get("CODEGATOR_ADMISSION_SLOTS", default_slots))
+        queue_limits = {}
+        for endpoint in PRIORITIES:
+            value = os.environ.get(f"CODEGATOR_{endpoint.upper()}_QUEUE_LIMIT")
+            if value:
+                queue_limits[endpoint] = int(value)
+        return cls(max(1, slots), queue_limits)
+
+    def _queued(self, endpoint):
+        return sum(1 for waiter in self.waiting if waiter[2] == endpoint)
+
+    @staticmethod
+    def _low_priority(endpoint):
+        return PRIORITIES[endpoint] > PRIORITIES["format"]
+
+    def _can_start(self, endpoint):
+        if self.in_use >= self.slots:
+            return False
+        return not self._low_priority(endpoint) or self.low_priority_in_use < self.low_priority_slots
+
+    def _take(self, endpoint):
+        self.in_use += 1
+        if self._low_priority(endpoint):
+            self.low_priority_in_use += 1
+        self.active[endpoint] += 1
+        active_requests.set(self.active[endpoint], endpoint=endpoint)
+        admitted_total.inc(endpoint=endpoint)
+
+    def _release(self, endpoint):
+        self.in_use -= 1
+        if self._low_priority(endpoint):
+            self.low_priority_in_use -= 1
+        self.active[endpoint] -= 1
+        active_requests.set(self.active[endpoint], endpoint=endpoint)
+        self._dispatch()
+
+    def _dispatch(self):
+        # waiting is kept sorted by (priority, arrival); skip endpoints held back from the reserved slot
+        for waiter in list(self.waiting):
+            if self.in_use >= self.slots:
+                break
+            _, _, endpoint, future = waiter
+            if future.done() or not self._can_start(endpoint):
+                continue
+            self.waiting.remove(waiter)
+            queue_depth.set(self._queued(endpoint), endpoint=endpoint)
+            self._take(endpoint)
+            future.set_result(None)
+
+    def retry_after(self, endpoint):
+        ahead = sum(1 for waiter in self.waiting if waiter[0] <= PRIORITIES[endpoint]) + self.in_use
+        return max(1, math.ceil(ahead * self._service_time[endpoint] / self.slots))
+
+    def _shed(self, endpoint, reason, status_code):
+        shed_total.inc(endpoint=endpoint, reason=reason)
+        raise Overloaded(endpoint, reason, status_code, self.retry_after(endpoint))
+
+    @asynccontextmanager
+    async def admit(self, endpoint, bounded=True):
+        """
+        Holds one slot for the duration of the block.
+
+        bounded=False skips the queue limit and max wait, for the many parts of one
+        already accepted request (e.g. the files of a batch).
+        """
+        if self._can_start(endpoint) and not any(waiter[0] <= PRIORITIES[endpoint] for waiter in self.waiting):
+            self._take(endpoint)
+        else:
+            if bounded and self._queued(endpoint) >= self.queue_limits[endpoint]:
+                self._shed(endpoint, "queue_full", 429)
+
+            future = asyncio.get_running_loop().create_future()
+            waiter = (PRIORITIES[endpoint], next(self._sequence), endpoint, future)
+            self.waiting.append(waiter)
+            self.waiting.sort(key=lambda item: item[:2])
+            queue_depth.set(self._queued(endpoint), endpoint=endpoint)
+            # Better-priority waiters may be held back from the reserved slot, in which case this one can start
+            self._dispatch()
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.max_wait[endpoint] if bounded else None)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # The slot was granted right as we gave up on it
+                    self._release(endpoint)
+                else:
+                    future.cancel()
+                    if waiter in self.waiting:
+                        self.waiting.remove(waiter)
+                    queue_depth.set(self._queued(endpoint), endpoint=endpoint)
+                if isinstance(e, asyncio.TimeoutError):
+                    self._shed(endpoint, "wait_timeout", 503)
+                raise
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Moving average of how long a slot is held, for Retry-After estimates
+            elapsed = time.perf_counter() - start
+            self._service_time[endpoint] = 0.8 * self._service_time[endpoint] + 0.2 * elapsed
+            self._release(endpoint)
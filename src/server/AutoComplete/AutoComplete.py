@@ -1,4 +1,6 @@
 from transformers import AutoModelForCausalLM, AutoTokenizer
+from Metrics import timed_stage
+from Cancellation import raise_if_cancelled, stopping_criteria
 
 checkpoint = "bigcode/santacoder"
 device = "cuda"
@@ -34,17 +36,24 @@ class AutoComplete:
 
         return prompt
         
-    def predict_completion(self, code, context):
-        prompt = self.create_prompt(context)
-        full_code = prompt + code
+    def predict_completion(self, code, context, cancel_token=None):
+        with timed_stage("autocomplete", "prompt"):
+            prompt = self.create_prompt(context)
+            full_code = prompt + code
 
-        inputs = self.tokenizer(full_code, return_tensors="pt").to(self.model.device)
-        outputs = self.model.generate(
-            **inputs,
-            max_new_tokens=32,
-            pad_token_id=self.tokenizer.eos_token_id, use_cache=True, do_sample=True, temperature=0.8, top_k=50, top_p=0.95
-        )
-        outputs = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        with timed_stage("autocomplete", "tokenize"):
+            inputs = self.tokenizer(full_code, return_tensors="pt").to(self.model.device)
+        raise_if_cancelled(cancel_token)
+        with timed_stage("autocomplete", "generate"):
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=32,
+                pad_token_id=self.tokenizer.eos_token_id, use_cache=True, do_sample=True, temperature=0.8, top_k=50, top_p=0.95,
+                stopping_criteria=stopping_criteria(cancel_token)
+            )
+        raise_if_cancelled(cancel_token)
+        with timed_stage("autocomplete", "decode"):
+            outputs = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
 
         # Remove prompt from output
         if outputs:
@@ -0,0 +1,62 @@
+import threading
+
+
+class AnalysisCancelled(Exception):
+    def __init__(self, message="Analysis cancelled"):
+        super().__init__(message)
+
+
+class CancellationToken:
+    """
+    Cancellation flag owned by a single request.
+
+    Engines receive the token of the request they are working for and check it
+    between units of work, so cancelling one request never affects another.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise AnalysisCancelled()
+
+
+def raise_if_cancelled(cancel_token):
+    """Same as cancel_token.raise_if_cancelled(), for engines called without a token."""
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+
+_stopping_criteria_class = None
+
+
+def stopping_criteria(cancel_token):
+    """
+    Returns a transformers StoppingCriteriaList that ends generate() within one
+    decoding step of the token being cancelled.
+    """
+    global _stopping_criteria_class
+    # transformers is only imported by the model engines, never by this module's other users
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    if _stopping_criteria_class is None:
+        class CancellationStoppingCriteria(StoppingCriteria):
+            def __init__(self, token):
+                self.token = token
+
+            def __call__(self, input_ids, scores, **kwargs):
+                return torch.full((input_ids.shape[0],), self.token.cancelled, dtype=torch.bool, device=input_ids.device)
+
+        _stopping_criteria_class = CancellationStoppingCriteria
+
+    if cancel_token is None:
+        return StoppingCriteriaList()
+    return StoppingCriteriaList([_stopping_criteria_class(cancel_token)])
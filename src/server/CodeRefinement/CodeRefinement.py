@@ -2,6 +2,7 @@ import CodeRefinement.ModelRunner
 import os
 import re
 import logging
+from Metrics import timed_stage
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,8 @@ class CodeRefiner:
         cleaned_code = re.sub(r'^ +', '', cleaned_code, flags=re.M)
         return cleaned_code
 
-    def start_refinement(self, code, prompt):
-        cleaned_code = self.clean_code(code)
-        refined_code = self.model.run_model(cleaned_code, prompt)
+    def start_refinement(self, code, prompt, cancel_token=None):
+        with timed_stage("refinement", "clean_code"):
+            cleaned_code = self.clean_code(code)
+        refined_code = self.model.run_model(cleaned_code, prompt, cancel_token)
         return refined_code
\ No newline at end of file
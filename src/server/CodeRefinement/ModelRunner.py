@@ -1,31 +1,31 @@
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from Metrics import timed_stage
+from Cancellation import raise_if_cancelled, stopping_criteria
 
 class ModelRunner:
     def __init__(self, model_name):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
         self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-        self.cancelled = False
 
-    def cancel(self):
-        self.cancelled = True
-
-    def run_model(self, text, prompt):
-        if self.cancelled:
-            raise Exception("Analysis cancelled")
+    def run_model(self, text, prompt, cancel_token=None):
+        raise_if_cancelled(cancel_token)
         
         text = f"refine: {prompt} <sep> {text}"
 
-        encoding = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-        encoding = {k: v.to(self.model.device) for k,v in encoding.items()}
+        with timed_stage("refinement", "tokenize"):
+            encoding = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
+            encoding = {k: v.to(self.model.device) for k,v in encoding.items()}
 
-        if self.cancelled:
-            raise Exception("Analysis cancelled")
+        raise_if_cancelled(cancel_token)
 
-        output = self.model.generate(**encoding, max_length=512, num_beams=1, do_sample=False, use_cache=True)
+        with timed_stage("refinement", "generate"):
+            output = self.model.generate(**encoding, max_length=512, num_beams=1, do_sample=False, use_cache=True,
+                                         stopping_criteria=stopping_criteria(cancel_token))
 
-        if self.cancelled:
-            raise Exception("Analysis cancelled")
+        # generate() returns early, with a truncated output, when the token is cancelled
+        raise_if_cancelled(cancel_token)
 
-        decoded_output = self.tokenizer.decode(output[0], skip_special_tokens=True)
+        with timed_stage("refinement", "decode"):
+            decoded_output = self.tokenizer.decode(output[0], skip_special_tokens=True)
 
         return decoded_output
\ No newline at end of file
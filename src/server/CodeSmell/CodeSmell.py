@@ -3,76 +3,138 @@ import CodeSmell.modelrunner
 import numpy as np
 import os
 from collections import defaultdict
+from Metrics import timed_stage
+from Cancellation import raise_if_cancelled
 
 class CodeSmellAnalyzer:
     def __init__(self):
         MODEL_PATH = "NexusrexDev/CodeGator-Smells"
         self.model = CodeSmell.modelrunner.ModelRunner(MODEL_PATH)
 
-    def start_analysis(self, code, progress_callback=None):
+    def start_analysis(self, code, progress_callback=None, cancel_token=None):
         total_smells: defaultdict = defaultdict(list)
 
-        parser = CodeSmell.classparser.ClassParser(code)
-        methods = parser.get_full_methods()
-        prototypes = parser.get_method_prototypes()
+        with timed_stage("smells", "class_parser"):
+            parser = CodeSmell.classparser.ClassParser(code)
+            methods = parser.get_full_methods()
+            prototypes = parser.get_method_prototypes()
         formatted_code = parser.code
 
         total_progress = len(methods) + len(prototypes) + 1
         current_progress = 0
 
-        try:
-            # Entire class scan
-            class_smells = self.model.run_model(formatted_code)
-            # Add class smells to the dictionary with the key 'class'
-            total_smells.setdefault('class', [])
-            total_smells['class'].append(class_smells)
-            total_smells['class'] = np.concatenate(total_smells['class'])
-            total_smells['class'] = np.unique(total_smells['class'])
-            total_smells['class'] = total_smells['class'].tolist()
+        # Entire class scan; AnalysisCancelled from the model runs ends the analysis
+        class_smells = self.model.run_model(formatted_code, cancel_token)
+        # Add class smells to the dictionary with the key 'class'
+        total_smells.setdefault('class', [])
+        total_smells['class'].append(class_smells)
+        total_smells['class'] = np.concatenate(total_smells['class'])
+        total_smells['class'] = np.unique(total_smells['class'])
+        total_smells['class'] = total_smells['class'].tolist()
 
+        current_progress += 1
+
+        if progress_callback:
+            progress_callback(int(current_progress / total_progress * 100))
+
+        for index, method in enumerate(methods):
+            method_smells = self.model.run_model(method, cancel_token)
+            total_smells.setdefault(f'{prototypes[index]}', [])
+            total_smells[f'{prototypes[index]}'].append(method_smells)
             current_progress += 1
 
             if progress_callback:
-                try:
-                    progress_callback(int(current_progress / total_progress * 100))
-                except Exception as e:
-                    if str(e) == "Analysis cancelled":
-                        self.model.cancel()  # Signal model to stop
-                        return {}  # Return empty dictionary if cancelled
-
-            for index, method in enumerate(methods):
-                method_smells = self.model.run_model(method)
-                total_smells.setdefault(f'{prototypes[index]}', [])
-                total_smells[f'{prototypes[index]}'].append(method_smells)
-                current_progress += 1
+                progress_callback(int(current_progress / total_progress * 100))
 
-                if progress_callback:
-                    try:
-                        progress_callback(int(current_progress / total_progress * 100))
-                    except Exception as e:
-                        if str(e) == "Analysis cancelled":
-                            self.model.cancel()  # Signal model to stop
-                            return {}  # Return empty dictionary if cancelled
-
-            for prototype in prototypes:
-                prototype_smells = self.model.run_model(prototype)
-                total_smells.setdefault(f'{prototype}', [])
-                total_smells[f'{prototype}'].append(prototype_smells)
-                total_smells[f'{prototype}'] = np.concatenate(total_smells[f'{prototype}'])
-                total_smells[f'{prototype}'] = np.unique(total_smells[f'{prototype}'])
-                total_smells[f'{prototype}'] = total_smells[f'{prototype}'].tolist()
-                current_progress += 1
+        for prototype in prototypes:
+            prototype_smells = self.model.run_model(prototype, cancel_token)
+            total_smells.setdefault(f'{prototype}', [])
+            total_smells[f'{prototype}'].append(prototype_smells)
+            total_smells[f'{prototype}'] = np.concatenate(total_smells[f'{prototype}'])
+            total_smells[f'{prototype}'] = np.unique(total_smells[f'{prototype}'])
+            total_smells[f'{prototype}'] = total_smells[f'{prototype}'].tolist()
+            current_progress += 1
 
+            if progress_callback:
+                progress_callback(int(current_progress / total_progress * 100))
+
+        return total_smells
+
+    @staticmethod
+    def _merge_smells(class_smells, method_smells, prototype_smells, prototypes):
+        # Same shape as start_analysis: unique class smells, and per prototype the
+        # union of its method body smells and its prototype smells
+        total_smells: defaultdict = defaultdict(list)
+        total_smells['class'] = np.unique(np.concatenate([class_smells])).tolist()
+        for index, smells in enumerate(method_smells):
+            total_smells[f'{prototypes[index]}'].append(smells)
+        for prototype, smells in zip(prototypes, prototype_smells):
+            total_smells[f'{prototype}'].append(smells)
+            total_smells[f'{prototype}'] = np.unique(np.concatenate(total_smells[f'{prototype}'])).tolist()
+        return total_smells
+
+    def start_workspace_analysis(self, files, progress_callback=None, batch_size=32, cancel_token=None, result_callback=None):
+        """
+        Analyzes many files at once, packing the units of every file into shared model batches.
+
+        files maps a path to its code. progress_callback(path, percentage) is called whenever
+        a file's progress changes, result_callback(path, smells) as soon as a file is done, and cancel_token is checked between files and batches
+        (AnalysisCancelled is raised). Returns the smells per path, and an error message per path
+        for files that could not be parsed.
+        """
+        results = {}
+        errors = {}
+        # Every unit is (path, text), kept in file order so files finish one after another
+        units = []
+        file_units = {}
+        for path, code in files.items():
+            raise_if_cancelled(cancel_token)
+            try:
+                with timed_stage("smells", "class_parser"):
+                    parser = CodeSmell.classparser.ClassParser(code)
+                    methods = parser.get_full_methods()
+                    prototypes = parser.get_method_prototypes()
+            except Exception as e:
+                errors[path] = str(e) or type(e).__name__
+                continue
+            file_units[path] = {
+                'prototypes': prototypes,
+                'methods': len(methods),
+                'start': len(units),
+                'total': len(methods) + len(prototypes) + 1,
+                'done': 0
+            }
+            units.append((path, parser.code))
+            units.extend((path, method) for method in methods)
+            units.extend((path, prototype) for prototype in prototypes)
+
+        reported = 0
+
+        def file_smells(info, predictions):
+            file_predictions = predictions[info['start']:info['start'] + info['total']]
+            method_count = info['methods']
+            return self._merge_smells(file_predictions[0],
+                                      file_predictions[1:1 + method_count],
+                                      file_predictions[1 + method_count:],
+                                      info['prototypes'])
+
+        def batch_callback(predictions):
+            nonlocal reported
+            changed = []
+            for path, _ in units[reported:len(predictions)]:
+                if not changed or changed[-1] != path:
+                    changed.append(path)
+                file_units[path]['done'] += 1
+            reported = len(predictions)
+            for path in changed:
+                info = file_units[path]
                 if progress_callback:
-                    try:
-                        progress_callback(int(current_progress / total_progress * 100))
-                    except Exception as e:
-                        if str(e) == "Analysis cancelled":
-                            self.model.cancel()  # Signal model to stop
-                            return {}  # Return empty dictionary if cancelled
-
-            return total_smells
-        except Exception as e:
-            if str(e) == "Analysis cancelled":
-                return {}
-            raise e
+                    progress_callback(path, int(info['done'] / info['total'] * 100))
+                if info['done'] == info['total']:
+                    results[path] = file_smells(info, predictions)
+                    if result_callback:
+                        result_callback(path, results[path])
+
+        self.model.run_model_batch([text for _, text in units], batch_size, batch_callback, cancel_token)
+
+        return results, errors
@@ -1,33 +1,28 @@
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
 import numpy as np
+from Metrics import timed_stage
+from Cancellation import raise_if_cancelled
 
 class ModelRunner:
     def __init__(self, model_name):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
-        self.cancelled = False
+        self.labels = ['God Class', 'Data Class', 'Long Method', 'Long Parameter List']
     
-    def cancel(self):
-        self.cancelled = True
-    
-    def run_model(self, text):
-        if self.cancelled:
-            self.cancelled = False
-            raise Exception("Analysis cancelled")
+    def run_model(self, text, cancel_token=None):
+        raise_if_cancelled(cancel_token)
             
-        encoding = self.tokenizer(text, return_tensors="pt", max_length=128, truncation=True, padding='max_length')
-        encoding = {k: v.to(self.model.device) for k,v in encoding.items()}
+        with timed_stage("smells", "tokenize"):
+            encoding = self.tokenizer(text, return_tensors="pt", max_length=128, truncation=True, padding='max_length')
+            encoding = {k: v.to(self.model.device) for k,v in encoding.items()}
 
-        if self.cancelled:
-            self.cancelled = False
-            raise Exception("Analysis cancelled")
+        raise_if_cancelled(cancel_token)
 
-        output = self.model(**encoding)
+        with timed_stage("smells", "forward"):
+            output = self.model(**encoding)
 
-        if self.cancelled:
-            self.cancelled = False
-            raise Exception("Analysis cancelled")
+        raise_if_cancelled(cancel_token)
 
         logits = output.logits
 
@@ -37,12 +32,39 @@ class ModelRunner:
         predictions = np.zeros(probs.shape)
         predictions[np.where(probs >= 0.5)] = 1
 
-        if self.cancelled:
-            self.cancelled = False
-            raise Exception("Analysis cancelled")
+        raise_if_cancelled(cancel_token)
 
-        labels= ['God Class', 'Data Class', 'Long Method', 'Long Parameter List']
-        labels = np.array(labels)
+        labels = np.array(self.labels)
         labels = labels[predictions.astype(bool)]
 
-        return labels.tolist()
\ No newline at end of file
+        return labels.tolist()
+
+    def run_model_batch(self, texts, batch_size=32, batch_callback=None, cancel_token=None):
+        """
+        Runs the classifier over many texts, batch_size texts per forward pass.
+
+        Returns one label list per text, in order. batch_callback(results) is called after
+        every batch with the label lists of all texts processed so far. cancel_token is
+        checked between batches.
+        """
+        labels = np.array(self.labels)
+        results = []
+        for start in range(0, len(texts), batch_size):
+            raise_if_cancelled(cancel_token)
+
+            batch = texts[start:start + batch_size]
+            with timed_stage("smells", "tokenize"):
+                encoding = self.tokenizer(batch, return_tensors="pt", max_length=128, truncation=True, padding='max_length')
+                encoding = {k: v.to(self.model.device) for k,v in encoding.items()}
+
+            with timed_stage("smells", "forward"), torch.no_grad():
+                output = self.model(**encoding)
+
+            probs = torch.sigmoid(output.logits.cpu()).numpy()
+            for row in probs >= 0.5:
+                results.append(labels[row].tolist())
+
+            if batch_callback:
+                batch_callback(results)
+
+        return results
\ No newline at end of file
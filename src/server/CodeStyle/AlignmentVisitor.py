@@ -1,90 +1,29 @@
 from typing import Optional
 from CodeStyle.JavaParser import JavaParser
 from CodeStyle.JavaParserVisitor import JavaParserVisitor
-from antlr4.TokenStreamRewriter import TokenStreamRewriter
+from CodeStyle.EditBuffer import EditBuffer
+from CodeStyle.TokenPositions import TokenPositions
+from CodeStyle.LineWrapper import LineWrapper
 from antlr4.Token import CommonToken
+from antlr4.tree.Tree import TerminalNode
 from functools import wraps
 from CodeStyle.ConfigClass import ConfigClass
 
+# Binary operators a line may break before; not assignments, which bind the whole right side
+WRAP_OPERATORS = frozenset((
+    JavaParser.MUL, JavaParser.DIV, JavaParser.MOD, JavaParser.ADD, JavaParser.SUB,
+    JavaParser.LT, JavaParser.GT, JavaParser.LE, JavaParser.GE, JavaParser.EQUAL, JavaParser.NOTEQUAL,
+    JavaParser.BITAND, JavaParser.CARET, JavaParser.BITOR, JavaParser.AND, JavaParser.OR,
+))
+
 class AlignmentVisitor(JavaParserVisitor):
     def __init__(self, tokens, config: ConfigClass):
-        self.rewriter : TokenStreamRewriter = TokenStreamRewriter(tokens)
+        self.rewriter : EditBuffer = EditBuffer(tokens)
+        self.positions: TokenPositions = TokenPositions(tokens)
         self.config:ConfigClass = config
         self.indent_level: int = 0
-    
-    def _apply_max_line_length_line(self, line: str) -> str:
-        if len(line) <= self.config.max_line_length:
-            return line
-
-        indent = ''
-        for char in line:
-            if char == " " or char == "\t":
-                indent += char
-            else:
-                break
-
-        if '"' in line or "'" in line:
-            in_string = False
-            string_type = None
-            string_positions = []
-            string_start = -1
-
-            for i, char in enumerate(line):
-                if not in_string and (char == '"' or char == "'"):
-                    in_string = True
-                    string_type = char
-                    string_start = i
-                elif in_string and char == string_type and line[i-1] != '\\':
-                    in_string = False
-                    string_positions.append((string_start, i))
-
-            if in_string:
-                string_positions.append((string_start, len(line) - 1))
-
-            if string_positions:
-                start, end = string_positions[0]
-                before_string = line[:start]
-                string_literal = line[start:end+1]
-                after_string = line[end+1:]
-
-                if len(string_literal) > self.config.max_line_length:
-                    string_content = string_literal[1:-1]  # Remove quotes
-                    split_strings = []
-                    current_part = ''
-
-                    for word in string_content.split(" "):
-                        if len(before_string) + len(current_part.strip()) + len(word) + 3 > self.config.max_line_length:  # 3 accounts for '" + "'
-                            split_strings.append(current_part)
-                            current_part = word
-                        else:
-                            if current_part:
-                                current_part += ' '
-                            current_part += word
-
-                    if current_part:
-                        split_strings.append(current_part)
-
-                    formatted_string = f'{string_type}\n {indent}    + {string_type}'.join(split_strings)
-                    new_line = f"{before_string}{string_type}{formatted_string}{string_type}{after_string}"
-                    return new_line
-
-        line = line[len(indent):]
-        words = line.split(" ")
-        new_line = ''
-        current_line = ''
-        for word in words:
-            if len(current_line) + len(word) > self.config.max_line_length:
-                new_line += current_line + "\n" + indent
-                current_line = word + " "
-            else:
-                current_line += word + " "
-        new_line += current_line.strip()
-        return indent + new_line
-
-    def _apply_max_line_length(self, text: str) -> str:
-        if self.config.max_line_length == -1:
-            return text
-        return "\n".join([self._apply_max_line_length_line(line) for line in text.split("\n")])
+        self.wrapper: LineWrapper = LineWrapper(tokens, config.max_line_length, config.indent_unit, config.indents['size'])
+        self.wrap_depth: int = 0
 
     @staticmethod
     def handle_indentation(method):
@@ -113,7 +52,88 @@ class AlignmentVisitor(JavaParserVisitor):
     def visitClassDeclaration(self, ctx):
         if ctx.classBody():
             self.indent_level += 1
-        return self.visitChildren(ctx)
+        return self._visit_wrap_group(ctx, self._before_keywords(ctx.EXTENDS(), ctx.IMPLEMENTS(), ctx.PERMITS()))
+
+    def visitInterfaceDeclaration(self, ctx: JavaParser.InterfaceDeclarationContext):
+        return self._visit_wrap_group(ctx, self._before_keywords(ctx.EXTENDS(), ctx.PERMITS()))
+
+    def visitEnumDeclaration(self, ctx: JavaParser.EnumDeclarationContext):
+        return self._visit_wrap_group(ctx, self._before_keywords(ctx.IMPLEMENTS()))
+
+    def visitRecordDeclaration(self, ctx: JavaParser.RecordDeclarationContext):
+        return self._visit_wrap_group(ctx, self._before_keywords(ctx.IMPLEMENTS()))
+
+    def visitConstructorDeclaration(self, ctx: JavaParser.ConstructorDeclarationContext):
+        return self._visit_wrap_group(ctx, self._before_keywords(ctx.THROWS()))
+
+    def visitInterfaceCommonBodyDeclaration(self, ctx: JavaParser.InterfaceCommonBodyDeclarationContext):
+        return self._visit_wrap_group(ctx, self._before_keywords(ctx.THROWS()))
+
+    def _visit_wrap_group(self, ctx, break_tokens, nested=True):
+        """Visits ctx with break points before break_tokens, one level deeper than its parent group unless not nested."""
+        if nested:
+            self.wrap_depth += 1
+        for token in break_tokens:
+            self.wrapper.add_break(token, self.wrap_depth)
+        try:
+            return self.visitChildren(ctx)
+        finally:
+            if nested:
+                self.wrap_depth -= 1
+
+    def _after_commas(self, ctx):
+        children = list(ctx.getChildren())
+        return [children[i + 1].start for i, child in enumerate(children[:-1])
+                if isinstance(child, TerminalNode) and child.getSymbol().type == JavaParser.COMMA]
+
+    def _before_keywords(self, *keywords):
+        """The extends, implements, permits or throws keywords of a declaration that it has."""
+        return [keyword.getSymbol() for keyword in keywords if keyword is not None]
+
+    def visitExpressionList(self, ctx: JavaParser.ExpressionListContext):
+        return self._visit_wrap_group(ctx, self._after_commas(ctx))
+
+    def visitTypeList(self, ctx: JavaParser.TypeListContext):
+        return self._visit_wrap_group(ctx, self._after_commas(ctx))
+
+    def visitQualifiedNameList(self, ctx: JavaParser.QualifiedNameListContext):
+        return self._visit_wrap_group(ctx, self._after_commas(ctx))
+
+    def visitFormalParameterList(self, ctx: JavaParser.FormalParameterListContext):
+        return self._visit_wrap_group(ctx, self._after_commas(ctx))
+
+    def visitBinaryOperatorExpression(self, ctx: JavaParser.BinaryOperatorExpressionContext):
+        if ctx.bop is None or ctx.bop.type not in WRAP_OPERATORS:
+            return self.visitChildren(ctx)
+        return self._visit_wrap_group(ctx, [ctx.bop], self._starts_group(ctx))
+
+    def visitTernaryExpression(self, ctx: JavaParser.TernaryExpressionContext):
+        return self._visit_wrap_group(ctx, [ctx.QUESTION().getSymbol(), ctx.COLON().getSymbol()])
+
+    def visitMemberReferenceExpression(self, ctx: JavaParser.MemberReferenceExpressionContext):
+        if not self._chains_call(ctx):
+            return self.visitChildren(ctx)
+        return self._visit_wrap_group(ctx, [ctx.bop], self._starts_group(ctx))
+
+    @staticmethod
+    def _is_call(ctx):
+        """Whether ctx is a method call, as f() or a.f()."""
+        return isinstance(ctx, JavaParser.MethodCallExpressionContext) \
+            or (isinstance(ctx, JavaParser.MemberReferenceExpressionContext) and ctx.methodCall() is not None)
+
+    def _chains_call(self, ctx):
+        """
+        Whether ctx calls a method on what another call returns, as .c() in a.b().c(), so a
+        line can break before its dot. Qualified names and fields, as System.out, stay whole.
+        """
+        return ctx.methodCall() is not None and self._is_call(ctx.expression())
+
+    def _starts_group(self, ctx):
+        """Whether ctx is not the left operand of the same operator, as a + b in a + b + c, or a call chain link."""
+        parent = ctx.parentCtx
+        return not (type(parent) is type(ctx) and parent.getChild(0) is ctx
+                    and getattr(parent, "bop", None) is not None and parent.bop.type == ctx.bop.type
+                    and (not isinstance(parent, JavaParser.MemberReferenceExpressionContext) or parent.methodCall() is not None))
 
     def visitMethodDeclaration(self, ctx):
         arguments : JavaParser.formalParameters = ctx.formalParameters()
@@ -125,10 +145,10 @@ class AlignmentVisitor(JavaParserVisitor):
             if parameters:
                 parameter_size = int((parameters.getChildCount() + 1) / 2)
 
-                if parameter_size > 1 and self.config.aligns['after_open_bracket'] != False:
+                if self.aligns_parameters(self.config.aligns, parameter_size):
                     self._apply_bracket_alignment(open_paren, parameters, close_paren, parameter_size)
 
-        return self.visitChildren(ctx)
+        return self._visit_wrap_group(ctx, self._before_keywords(ctx.THROWS()))
 
     def visitMethodCall(self, ctx: JavaParser.MethodCallContext):
         arguments : JavaParser.ArgumentsContext = ctx.arguments()
@@ -141,11 +161,21 @@ class AlignmentVisitor(JavaParserVisitor):
             
             parameter_size = int((parameters.getChildCount() + 1) / 2) # Getting the actual number of parameters
             
-            if parameter_size > 1 and self.config.aligns['after_open_bracket'] != False:
+            if self.aligns_parameters(self.config.aligns, parameter_size):
                 self._apply_bracket_alignment(open_paren, parameters, close_paren, parameter_size)
 
         return self.visitChildren(ctx)
 
+    @staticmethod
+    def aligns_parameters(aligns, parameter_size):
+        """Whether the after_open_bracket alignment of aligns breaks a list of parameter_size parameters or arguments."""
+        match aligns['after_open_bracket']:
+            case 'align' | 'dont_align':
+                return parameter_size > 1 and parameter_size > aligns['parameters_before_align']
+            case 'always_break' | 'block_indent' | 'all_parameters_on_new_line':
+                return parameter_size > 1
+        return False
+
     def _apply_bracket_alignment(self, open_paren, parameters, close_paren, parameter_size):
         match self.config.aligns['after_open_bracket']:
             case 'align':
@@ -190,26 +220,15 @@ class AlignmentVisitor(JavaParserVisitor):
                     self.rewriter.insertBeforeToken(parameter.start, f"\n{align_spaces}")
 
     def _get_align_spaces(self, open_paren):
-        token_stream = self.rewriter.getTokenStream()
-        token_index = open_paren.tokenIndex
-        spacer_length = 0
-        while token_stream.get(token_index).line == open_paren.line:
-            spacer_length += len(token_stream.get(token_index).text)
-            token_index -= 1
-
+        spacer_length = self.positions.line_width(open_paren.tokenIndex)
         return " " * (spacer_length + (self.indent_level * self.config.indents['size']))   
 
     def _get_indent(self):
-        match self.config.indents['type']:
-            case "spaces":
-                return " " * (self.indent_level * self.config.indents['size'])
-            # may it appear as 8 spaces but it is actually configurable
-            # in text editors so it should be as a size of indent_size
-            case "tabs":
-                return "\t" * self.indent_level
+        return self.config.indent(self.indent_level)
     
     def get_formatted_code(self, tree):
         self.visit(tree)
 
-        formatted_code = self.rewriter.getDefaultText()
-        return self._apply_max_line_length(formatted_code)
\ No newline at end of file
+        owners = []
+        parts = self.rewriter.getParts(owners)
+        return self.wrapper.wrap(parts, owners)
\ No newline at end of file
@@ -0,0 +1,209 @@
+import re
+from antlr4 import CommonTokenStream, InputStream, Token
+from CodeStyle.JavaLexer import JavaLexer
+
+LINE_COMMENT_MARKER = "LINE_COMMENT:"
+COMMENT_TYPES = (JavaLexer.COMMENT, JavaLexer.LINE_COMMENT)
+# Whitespace right before a comment, from the last line break on
+HIDDEN_BEFORE_PATTERN = re.compile(r'[\n\r][ \t]*$')
+SPACES_PATTERN = re.compile(r' {2,}')
+LINE_BREAKS = str.maketrans("", "", "\t\n\r")
+# Characters that lex into one token when the whitespace between them goes away
+OPERATOR_CHARACTERS = frozenset("=><!~?:&|+-*/^%.@")
+QUOTES = frozenset("\"'")
+
+
+class CleanedCode:
+    def __init__(self, code, tokens, line_comments, positions=None):
+        self.code = code
+        # The tokens of code, ready for the parser, or None when code has to be lexed
+        self.tokens = tokens
+        # How many line comments were turned into block comments
+        self.line_comments = line_comments
+        # (line, column) of every default channel token in the code before cleaning, when asked for
+        self.positions = positions
+
+
+def _word(character):
+    return character.isalnum() or character in "_$"
+
+
+def joins(left, right):
+    """Whether two token texts could lex differently once nothing separates them."""
+    a, b = left[-1], right[0]
+    return ((_word(a) or a == ".") and (_word(b) or b == ".")) \
+        or (a in OPERATOR_CHARACTERS and b in OPERATOR_CHARACTERS) \
+        or (a in QUOTES and b in QUOTES)
+
+
+def _clean(text):
+    text = text.translate(LINE_BREAKS)
+    return SPACES_PATTERN.sub(" ", text) if "  " in text else text
+
+
+def _line_comment_to_block(comment):
+    # Escapes '*/' so the block comment does not end early
+    comment_text = comment[2:].strip().replace('*/', '*\\/')
+    return f"/* {LINE_COMMENT_MARKER} {comment_text} */"
+
+
+def _indent_block_comment(comment, base_indent):
+    lines = comment.split('\n')
+    return '\n'.join([lines[0].strip()] + [base_indent + line.strip() for line in lines[1:]])
+
+
+def _clean_code_part(texts, output, first, last, cut):
+    """Cleans texts[first:last], one piece of code between comments, into output."""
+    strip = True
+    for index in range(first, last):
+        text = texts[index]
+        if index == last - 1 and cut:
+            text = text[:-cut]
+        if "\t" in text and text.isspace():
+            # Tabs between tokens separate them like spaces do, where tab indentation would glue them together
+            text = text.replace("\t", " ")
+        text = _clean(text)
+        if strip:
+            # Only the start of the piece loses its spaces
+            text = text.lstrip(' ')
+            strip = not text
+        output[index] = text
+
+
+def clean_code(code, indents, keep_positions=False):
+    """
+    Prepares code for parsing: collapses whitespace onto one line, turns line comments
+    into block comments marked with LINE_COMMENT_MARKER and indents every comment on a
+    line of its own by the braces opened since the previous comment.
+
+    Comments are found by lexing code once, as the hidden channel tokens they are, so
+    the work does not grow with the number of comments. The lexed tokens are moved
+    onto the cleaned code and returned with it, so the parser does not lex it again,
+    unless removing whitespace joined two tokens into something else. keep_positions
+    also returns where the tokens were in code before they moved.
+    """
+    lexer = JavaLexer(InputStream(code))
+    stream = CommonTokenStream(lexer)
+    stream.fill()
+
+    # Characters the lexer could not match stay in place as code without a token
+    items = []
+    texts = []
+    position = 0
+    for token in stream.tokens:
+        end = len(code) if token.type == Token.EOF else token.start
+        if end > position:
+            items.append(None)
+            texts.append(code[position:end])
+        if token.type == Token.EOF:
+            break
+        position = token.stop + 1
+        items.append(token)
+        texts.append(code[token.start:position])
+    positions = [(token.line, token.column) for token in stream.tokens
+                 if token.channel == Token.DEFAULT_CHANNEL and token.type != Token.EOF] if keep_positions else None
+
+    indent_unit = ' ' * indents['size'] if indents['type'] == 'spaces' else '\t'
+    output = [None] * len(texts)
+    part_start = 0
+    # Where the current piece of code starts in code with its line comments converted
+    converted_position = 0
+    part_length = 0
+    braces = 0
+    indent_level = 0
+    line_comments = 0
+    for index, token in enumerate(items):
+        if token is None or token.type not in COMMENT_TYPES:
+            part_length += len(texts[index])
+            if token is not None:
+                if token.type == JavaLexer.LBRACE:
+                    braces += 1
+                elif token.type == JavaLexer.RBRACE:
+                    braces -= 1
+            continue
+
+        if token.type == JavaLexer.LINE_COMMENT:
+            comment = _line_comment_to_block(texts[index])
+            line_comments += 1
+        else:
+            comment = texts[index]
+        if index > part_start:
+            hidden = HIDDEN_BEFORE_PATTERN.search(texts[index - 1])
+            hidden_before = hidden.group(0) if hidden else ''
+            # A comment on its own line is indented by the braces opened since the previous comment
+            indent_level = max(0, braces) if hidden_before else 0
+            # Only the whitespace that fits before the converted piece is cut from it
+            cut = max(0, len(hidden_before) - converted_position) if hidden_before else 0
+            _clean_code_part(texts, output, part_start, index, cut)
+            if hidden_before:
+                if LINE_COMMENT_MARKER in comment:
+                    indent_level += 1
+                output[index - 1] += ("\n" if hidden_before[0] == "\n" else "") + indent_unit * indent_level
+        converted_position += part_length + len(comment)
+        if LINE_COMMENT_MARKER not in comment:
+            comment = _indent_block_comment(comment, indent_unit * indent_level + ' ')
+        output[index] = comment
+        part_start = index + 1
+        part_length = 0
+        braces = 0
+    _clean_code_part(texts, output, part_start, len(texts), 0)
+
+    cleaned = ''.join(output)
+    return CleanedCode(cleaned, _move_tokens(lexer, stream, items, texts, output, cleaned), line_comments, positions)
+
+
+def _move_tokens(lexer, stream, items, texts, output, cleaned):
+    """Gives the tokens the text and positions they have in cleaned, if lexing cleaned would give the same tokens."""
+    kept = []
+    dropped = False
+    for token, original, text in zip(items, texts, output):
+        if token is None:
+            return None
+        if token.type == JavaLexer.WS and not text:
+            dropped = True
+            continue
+        if dropped and kept and joins(kept[-1][1], text):
+            return None
+        dropped = False
+        if text != original:
+            if token.type in COMMENT_TYPES:
+                if not text.startswith("/*") or text.find("*/", 2) != len(text) - 2:
+                    return None
+            elif token.type != JavaLexer.STRING_LITERAL and token.type != JavaLexer.WS:
+                return None
+        kept.append((token, text))
+
+    source = (lexer, InputStream(cleaned))
+    offset = 0
+    line = 1
+    line_start = 0
+    tokens = []
+    for index, (token, text) in enumerate(kept):
+        if token.type == JavaLexer.LINE_COMMENT:
+            token.type = JavaLexer.COMMENT
+        token.source = source
+        token.tokenIndex = index
+        token.start = offset
+        token.line = line
+        token.column = offset - line_start
+        # Only whitespace and comments can still span lines
+        if "\n" in text:
+            line += text.count("\n")
+            line_start = offset + text.rindex("\n") + 1
+        offset += len(text)
+        token.stop = offset - 1
+        tokens.append(token)
+
+    eof = stream.tokens[-1]
+    eof.source = source
+    eof.tokenIndex = len(tokens)
+    eof.start = offset
+    eof.stop = offset - 1
+    eof.line = line
+    eof.column = offset - line_start
+    tokens.append(eof)
+
+    moved = CommonTokenStream(lexer)
+    moved.tokens = tokens
+    moved.fetchedEOF = True
+    return moved
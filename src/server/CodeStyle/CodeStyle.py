@@ -1,13 +1,33 @@
 from antlr4 import *
-from torch.distributions import continuous_bernoulli
+from antlr4.Token import CommonToken
+from antlr4.error.ErrorStrategy import DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
 from CodeStyle.JavaLexer import JavaLexer
 from CodeStyle.JavaParser import JavaParser
 from CodeStyle.FormattingVisitor import FormattingVisitor
 from CodeStyle.AlignmentVisitor import AlignmentVisitor
 from CodeStyle.ErrorLogger import ErrorLogger
-from CodeStyle.ConfigClass import ConfigClass
+from CodeStyle.StyleCheck import StyleCheck, changes_within
+from CodeStyle.ConfigClass import ConfigClass, compile_config
+from CodeStyle import CodeCleaner
+from CodeStyle import DFASnapshot
+import Metrics
+from Metrics import timed_stage
 import re
 
+# CommonToken uses __slots__, so remapped tokens are copied field by field
+TOKEN_ATTRIBUTES = ("source", "type", "channel", "start", "stop", "tokenIndex", "line", "column", "_text")
+# What the lexer's WS tokens are made of
+WHITESPACE = " \t\r\n\f"
+
+remap_fallbacks = Metrics.registry.counter(
+    "codegator_format_remap_fallback_total", "Formatting passes that had to parse their input again", ("stage",))
+parses_total = Metrics.registry.counter(
+    "codegator_format_parse_total", "Java parses by the prediction mode that produced the tree", ("prediction",))
+
+# New processes start from the DFAs an earlier process saved, instead of from empty ones
+DFASnapshot.load(DFASnapshot.default_path())
+
 class CodeStyleFormatter:
     def __init__(self, config_path=None):
         self.configs = ConfigClass(config_path) if config_path else None
@@ -16,180 +36,432 @@ class CodeStyleFormatter:
         self.configs = ConfigClass(config_path)
         return self.configs
 
-    def parse_java_code(self, code):
-        lexer = JavaLexer(InputStream(code))
-        tokens = CommonTokenStream(lexer)
+    def parse_java_code(self, code, tokens=None):
+        """Parses code, or tokens when they are the already lexed tokens of code."""
+        if tokens is None:
+            tokens = CommonTokenStream(JavaLexer(InputStream(code)))
         parser = JavaParser(tokens)
-        tree = parser.compilationUnit()
+        if self.configs is not None and self.configs.parse_mode == "ll":
+            tree = parser.compilationUnit()
+            parses_total.inc(prediction="ll")
+        else:
+            tree = self._parse_two_stage(parser, tokens)
+        self.syntax_errors = parser.getNumberOfSyntaxErrors()
         return tree, tokens
 
+    def _parse_two_stage(self, parser, tokens):
+        """
+        Parses with SLL prediction first, which is enough for almost all code, and only
+        parses again with full LL when SLL hits a syntax error. That error is either a
+        real one, reported by the LL parse, or an input SLL cannot decide.
+        """
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        try:
+            tree = parser.compilationUnit()
+            parses_total.inc(prediction="sll")
+            return tree
+        except ParseCancellationException:
+            pass
+
+        tokens.seek(0)
+        parser.reset()
+        parser._interp.predictionMode = PredictionMode.LL
+        parser._errHandler = DefaultErrorStrategy()
+        tree = parser.compilationUnit()
+        parses_total.inc(prediction="ll_fallback")
+        return tree
+
+    def remap_tokens(self, code, tokens):
+        """
+        Moves the tokens of an already parsed tree onto code, a rewritten version of the
+        same source, so the tree can be reused without parsing code again.
+
+        The formatting passes only change whitespace and comments and reorder modifiers
+        and imports, so code lexes to the same default channel tokens, possibly permuted
+        inside those lists. Every tree token takes over the text and position of the
+        token at the same place in code. Returns the token stream of code, or None when
+        the tokens do not line up and code has to be parsed again.
+        """
+        if self.syntax_errors:
+            return None
+        new_tokens = CommonTokenStream(JavaLexer(InputStream(code)))
+        new_tokens.fill()
+        old = [token for token in tokens.tokens if token.channel == Token.DEFAULT_CHANNEL]
+        new = [token for token in new_tokens.tokens if token.channel == Token.DEFAULT_CHANNEL]
+        if len(old) != len(new) or sorted(token.type for token in old) != sorted(token.type for token in new):
+            return None
+        for old_token, new_token in zip(old, new):
+            for attribute in TOKEN_ATTRIBUTES:
+                setattr(old_token, attribute, getattr(new_token, attribute))
+            new_tokens.tokens[new_token.tokenIndex] = old_token
+        return new_tokens
+
+    def move_tokens(self, parts, owners, tokens):
+        """
+        Does what remap_tokens() does for the code an EditBuffer over tokens renders, from
+        the parts and owners of its getParts(), without lexing all of that code again.
+
+        The tokens of unedited parts move to where their part ends up, whitespace that
+        ends up together becomes one token, as the lexer makes it, and only the edited
+        texts are lexed, all of them at once. Returns None when tokens that were apart end
+        up next to each other where they could lex differently, or when the tokens do not
+        line up, for remap_tokens() to find out.
+        """
+        if self.syntax_errors:
+            return None
+        old_tokens = tokens.tokens
+        lexer = tokens.tokenSource
+        code = "".join(parts)
+        source = (lexer, InputStream(code))
+
+        # The edited texts that are more than whitespace, lexed together a line break apart
+        edited = [index for index, owner in enumerate(owners) if owner is None and parts[index].strip(WHITESPACE)]
+        lexed = {index: [] for index in edited}
+        if edited:
+            joined = "\n".join(parts[index] for index in edited)
+            stream = CommonTokenStream(JavaLexer(InputStream(joined)))
+            stream.fill()
+            position = 0
+            start = 0
+            end = len(parts[edited[0]])
+            for token in stream.tokens:
+                if token.type == JavaLexer.WS or token.type == Token.EOF:
+                    continue
+                while token.start > end:
+                    position += 1
+                    start = end + 1
+                    end = start + len(parts[edited[position]])
+                if token.stop >= end:
+                    return None
+                lexed[edited[position]].append((token.start - start, token.type, token.channel, token.text))
+
+        moved = []
+        # (type, text, start, line, column, index in moved) of the default channel tokens, in the order they end up in
+        defaults = []
+        offset = 0
+        line = 1
+        line_start = 0
+        # Where the whitespace since the last other token starts, as (offset, line, column)
+        blank = None
+        # Text and (part, old token index) of the last other token, to tell whether it was lexed next to the next one
+        previous = None
+
+        def add(token_type, channel, text, origin):
+            nonlocal offset, line, line_start, blank, previous
+            if blank is not None:
+                token = CommonToken(source, JavaLexer.WS, Token.HIDDEN_CHANNEL, blank[0], offset - 1)
+                token.line, token.column, token.tokenIndex = blank[1], blank[2], len(moved)
+                moved.append(token)
+                blank = None
+            elif previous is not None and not adjacent(previous[1], origin) and CodeCleaner.joins(previous[0], text):
+                return False
+            previous = (text, origin)
+            if channel == Token.DEFAULT_CHANNEL:
+                defaults.append((token_type, text, offset, line, offset - line_start, len(moved)))
+                moved.append(None)
+            else:
+                token = CommonToken(source, token_type, channel, offset, offset + len(text) - 1)
+                token.line, token.column, token.tokenIndex = line, offset - line_start, len(moved)
+                moved.append(token)
+            advance(text)
+            return True
+
+        def adjacent(before, after):
+            # Tokens of the same edited text were lexed together, like those next to each other in tokens
+            if before[1] is None:
+                return after == before
+            return after[1] is not None and after[1] == before[1] + 1
+
+        def advance(text):
+            nonlocal offset, line, line_start
+            if "\n" in text:
+                line += text.count("\n")
+                line_start = offset + text.rindex("\n") + 1
+            offset += len(text)
+
+        def space(text):
+            nonlocal blank
+            if blank is None:
+                blank = (offset, line, offset - line_start)
+            advance(text)
+
+        for index, text in enumerate(parts):
+            owner = owners[index]
+            if owner is not None:
+                token = old_tokens[owner]
+                if token.type == JavaLexer.WS:
+                    space(text)
+                elif not add(token.type, token.channel, text, (index, owner)):
+                    return None
+                continue
+            if index not in lexed:
+                space(text)
+                continue
+            position = 0
+            for start, token_type, channel, token_text in lexed[index]:
+                if start > position:
+                    if text[position:start].strip(WHITESPACE):
+                        return None
+                    space(text[position:start])
+                if not add(token_type, channel, token_text, (index, None)):
+                    return None
+                position = start + len(token_text)
+            if position < len(text):
+                if text[position:].strip(WHITESPACE):
+                    return None
+                space(text[position:])
+        if blank is not None:
+            token = CommonToken(source, JavaLexer.WS, Token.HIDDEN_CHANNEL, blank[0], offset - 1)
+            token.line, token.column, token.tokenIndex = blank[1], blank[2], len(moved)
+            moved.append(token)
+        defaults.append((Token.EOF, None, offset, line, offset - line_start, len(moved)))
+        moved.append(None)
+
+        old = [token for token in old_tokens if token.channel == Token.DEFAULT_CHANNEL]
+        if len(old) != len(defaults):
+            return None
+        types = [token.type for token in old]
+        new_types = [default[0] for default in defaults]
+        if types != new_types and sorted(types) != sorted(new_types):
+            return None
+        for token, (token_type, text, start, token_line, column, index) in zip(old, defaults):
+            token.source = source
+            token.type = token_type
+            token.start = start
+            token.stop = start + len(text) - 1 if text is not None else start - 1
+            token.line = token_line
+            token.column = column
+            token.tokenIndex = index
+            token._text = text
+            moved[index] = token
+
+        stream = CommonTokenStream(lexer)
+        stream.tokens = moved
+        stream.fetchedEOF = True
+        return stream
+
+    def _move_or_parse(self, stage, parts, owners, tree, tokens):
+        moved = self.move_tokens(parts, owners, tokens)
+        if moved is not None:
+            return tree, moved
+        return self._remap_or_parse(stage, "".join(parts), tree, tokens)
+
+    def _remap_or_parse(self, stage, code, tree, tokens):
+        remapped = self.remap_tokens(code, tokens)
+        if remapped is not None:
+            return tree, remapped
+        remap_fallbacks.inc(stage=stage)
+        return self.parse_java_code(code)
+
     def clean_code(self, code):
-        # Convert line comments to block comments with a special marker
-        def convert_line_to_block(match):
-            comment = match.group(0)
-            # Remove the // and convert to block comment format
-            comment_text = comment[2:].strip()
-            # Escape any '*/' sequences in the comment text
-            comment_text = comment_text.replace('*/', '*\\/')
-            return f"/* LINE_COMMENT: {comment_text} */"
-
-        # Replace line comments with block comments
-        code = re.sub(r'//[^\n]*', convert_line_to_block, code)
-        
-        # Split the code into comments and non-comments
-        parts = []
-        current_pos = 0
-        for match in re.finditer(r'/\*.*?\*/', code, re.DOTALL):
-            # Get the code before the comment
-            if match.start() > current_pos:
-                code_part = code[current_pos:match.start()]
-                # Extract hidden tokens (newlines and spaces) before the comment
-                hidden_tokens = re.search(r'[\n\r][ \t]*$', code_part)
-                hidden_before = hidden_tokens.group(0) if hidden_tokens else ''
-                
-                # Calculate indentation level from the code structure
-                indent_level = 0
-                if hidden_before:
-                    # Get the code before the last newline
-                    code_before_newline = code_part[:match.start() - len(hidden_before)]
-                    # Count opening and closing braces to determine nesting level
-                    # Only count braces that are not inside string literals or comments
-                    brace_count = 0
-                    in_string = False
-                    in_char = False
-                    escape_next = False
-                    
-                    for char in code_before_newline:
-                        if escape_next:
-                            escape_next = False
-                            continue
-                            
-                        if char == '\\':
-                            escape_next = True
-                            continue
-                            
-                        if char == '"' and not in_char:
-                            in_string = not in_string
-                            continue
-                            
-                        if char == "'" and not in_string:
-                            in_char = not in_char
-                            continue
-                            
-                        if not in_string and not in_char:
-                            if char == '{':
-                                brace_count += 1
-                            elif char == '}':
-                                brace_count -= 1
-                    
-                    indent_level = max(0, brace_count)
-                
-                # Clean the code part without the hidden tokens
-                code_part = code_part[:match.start() - len(hidden_before)]
-                code_part = re.sub(r'[\t\n\r]+', '', code_part)
-                code_part = re.sub(r' {2,}', ' ', code_part)
-                code_part = re.sub(r'^ +', '', code_part, flags=re.M)
-                
-                # Add the cleaned code
-                parts.append(code_part)
-                
-                if hidden_before:
-                    # Split by newlines and rejoin with proper indentation
-                    lines = hidden_before.split('\n')
-                    indented_lines = []
-                    indent_level = indent_level+1 if 'LINE_COMMENT:' in match.group(0) else indent_level
-                    for i, line in enumerate(lines):
-                        if i == len(lines) - 1:  # Last line (before comment)
-                            if self.configs.indents['type'] == 'spaces':
-                                indented_lines.append(' ' * (indent_level  * self.configs.indents['size']))
-                            else:  # tabs
-                                indented_lines.append('\t' * indent_level )
-                        else:
-                            indented_lines.append(line)
-                    parts.append('\n'.join(indented_lines))
-            
-            # comment block (the original one)
-            comment = match.group(0)
-            if 'LINE_COMMENT:' not in comment:
-                # This is a regular block comment, ensure consistent indentation
-                comment_lines = comment.split('\n')
-                indented_comment_lines = []
-                
-                # Calculate base indentation for the comment block
-                if self.configs.indents['type'] == 'spaces':
-                    base_indent = ' ' * (indent_level * self.configs.indents['size'])
-                else:  # tabs
-                    base_indent = '\t' * indent_level
-                
-                base_indent += ' '
-                for i, line in enumerate(comment_lines):
-                    if i == 0:  # First line with /*
-                        indented_comment_lines.append(line.strip())
-                    elif i == len(comment_lines) - 1:  # Last line with */
-                        indented_comment_lines.append(base_indent + line.strip())
-                    else:  # Middle lines
-                        indented_comment_lines.append(base_indent + line.strip())
-                
-                comment = '\n'.join(indented_comment_lines)
-            
-            parts.append(comment)
-            current_pos = match.end()
-        
-        # Add any remaining code
-        if current_pos < len(code):
-            remaining_code = code[current_pos:]
-            remaining_code = re.sub(r'[\t\n\r]+', '', remaining_code)
-            remaining_code = re.sub(r' {2,}', ' ', remaining_code)
-            remaining_code = re.sub(r'^ +', '', remaining_code, flags=re.M)
-            parts.append(remaining_code)
-
-        return ''.join(parts)
+        return CodeCleaner.clean_code(code, self.configs.indents).code
 
     def restore_line_comments(self, code):
         # Convert block comments back to line comments
         def convert_block_to_line(match):
-            comment = match.group(0)
+            comment = match.group('comment')
             # Extract the comment text and convert it back to line comment format
             comment_text = comment[2:-2].strip()  # Remove /* and */
             # Remove 'LINE_COMMENT:' prefix without adding extra space
             comment_text = comment_text.replace('LINE_COMMENT:', '', 1).strip()
             # Unescape any '*/' sequences in the comment text
             comment_text = comment_text.replace('*\\/', '*/')
-            return f"//{comment_text}"
+            if match.group('code') is None:
+                return f"//{comment_text}"
+            # Code after the comment on its line would be commented out, so it goes on the next line, as indented
+            line_start = code.rfind("\n", 0, match.start()) + 1
+            line = code[line_start:match.start()]
+            indentation = line[:len(line) - len(line.lstrip(" \t"))]
+            return f"//{comment_text}\n{indentation}"
 
-        # Replace block comments with line comments using non-greedy match
-        restored_code = re.sub(r'/\* LINE_COMMENT: .*?\*/', convert_block_to_line, code, flags=re.DOTALL)
+        # Replace block comments with line comments using non-greedy match, along with the spaces before any code after them
+        restored_code = re.sub(r'(?P<comment>/\* LINE_COMMENT: .*?\*/)(?P<code>[ \t]*(?=\S))?', convert_block_to_line, code, flags=re.DOTALL)
 
         return restored_code
 
     def format_code(self, tree, tokens):
-        formatter = FormattingVisitor(tokens, self.configs)
-        first_code_pass = formatter.get_formatted_code(tree)
+        return self._format(tree, tokens)[0]
 
-        lexer = JavaLexer(InputStream(first_code_pass))
-        tokens = CommonTokenStream(lexer)
-        parser = JavaParser(tokens)
-        tree = parser.compilationUnit()
+    def _format(self, tree, tokens, engine="format", indent_level=0):
+        """Runs both formatting passes, returning the code along with the tree and tokens it was aligned with."""
+        parts, owners, _ = self._first_pass(tree, tokens, engine, indent_level)
+        return self._align(parts, owners, tree, tokens, engine, indent_level)
 
-        aligner = AlignmentVisitor(tokens, self.configs)
-        second_code_pass = aligner.get_formatted_code(tree)
+    def _first_pass(self, tree, tokens, engine, indent_level=0):
+        """Runs the FormattingVisitor, returning its parts and owners, as EditBuffer.getParts() gives them, and itself."""
+        with timed_stage(engine, "formatting_visitor"):
+            formatter = FormattingVisitor(tokens, self.configs)
+            formatter.indent_level = indent_level
+            owners = []
+            parts = formatter.get_formatted_parts(tree, owners)
+        return parts, owners, formatter
 
-        return second_code_pass
+    def _align(self, parts, owners, tree, tokens, engine, indent_level=0):
+        """Runs the AlignmentVisitor over the first pass, returning the code along with the tree and tokens it was aligned with."""
+        with timed_stage(engine, "remap"):
+            tree, tokens = self._move_or_parse("alignment", parts, owners, tree, tokens)
+
+        with timed_stage(engine, "alignment_visitor"):
+            aligner = AlignmentVisitor(tokens, self.configs)
+            aligner.indent_level = indent_level
+            second_code_pass = aligner.get_formatted_code(tree)
+
+        return second_code_pass, tree, tokens
 
     def get_errors(self, tree):
         error_visitor = ErrorLogger(self.configs)
         errors = error_visitor.find_errors(tree)
         return errors
 
-    def start_formatting(self, code, settings=None):
-        if settings:
-            self.configs = ConfigClass(settings)
-        code = self.clean_code(code)
-        tree, tokens = self.parse_java_code(code)
-        formatted_code = self.format_code(tree, tokens)
-        formatted_code = self.restore_line_comments(formatted_code)
+    def _use_settings(self, settings):
+        if isinstance(settings, ConfigClass):
+            self.configs = settings
+        elif settings:
+            self.configs = compile_config(settings)
+
+    def _parse_document(self, code, engine, keep_positions=False):
+        """Cleans and parses code, returning its CleanedCode and the tree and tokens of the cleaned code."""
+        with timed_stage(engine, "clean_code"):
+            cleaned = CodeCleaner.clean_code(code, self.configs.indents, keep_positions)
+        with timed_stage(engine, "parse"):
+            tree, tokens = self.parse_java_code(cleaned.code, cleaned.tokens)
+        # Those of the code itself; syntax_errors ends up with those of the last parse
+        self.input_syntax_errors = self.syntax_errors
+        return cleaned, tree, tokens
+
+    def _format_document(self, code, engine, indent_level=0):
+        """Formats code, returning its CleanedCode, the formatted code and the tree and tokens it was aligned with."""
+        cleaned, tree, tokens = self._parse_document(code, engine)
+        formatted_code, tree, tokens = self._format(tree, tokens, engine, indent_level)
+        if cleaned.line_comments:
+            with timed_stage(engine, "restore_line_comments"):
+                formatted_code = self.restore_line_comments(formatted_code)
+        return cleaned, formatted_code, tree, tokens
+
+    def start_formatting(self, code, settings=None, indent_level=0):
+        # indent_level is where the visitors start, for code that goes on after as many classes as indent them
+        self._use_settings(settings)
+        cleaned, formatted_code, tree, tokens = self._format_document(code, "format", indent_level)
+
+        # Naming diagnostics report positions in the final code, so the tree is moved onto it once more
+        with timed_stage("format", "lint_remap"):
+            tree, _ = self._remap_or_parse("lint", formatted_code, tree, tokens)
+        with timed_stage("format", "lint"):
+            errors = self.get_errors(tree)
+
+        return formatted_code, errors
+
+    def check_formatting(self, code, settings=None):
+        """
+        Checks whether code already matches the style, returning a StyleCheck with the
+        first position formatting would change and the naming errors of code.
+
+        The alignment pass leaves the lines before the first one it may change as the
+        first pass renders them, so code is compared with those first, apart from
+        whitespace at the end of lines. A difference there is the first one, found
+        without moving the tokens onto the first pass or aligning it, and the StyleCheck
+        then has no formatted code. Only code that matches up to there, as code that
+        conforms does, goes through the alignment pass and is compared as a whole.
+        Naming errors report positions in code rather than in the formatted code, which
+        are the same ones for code that conforms. The tree's tokens are code's own, moved
+        by clean_code(), so they are moved back instead of lexing code again.
+        """
+        self._use_settings(settings)
+        cleaned, tree, tokens = self._parse_document(code, "check", keep_positions=True)
+        parts, owners, formatter = self._first_pass(tree, tokens, "check")
+
+        with timed_stage("check", "compare_first_pass"):
+            first_code_pass = "".join(parts)
+            settled = self._settled_length(first_code_pass, parts, owners, tokens, formatter.first_reordered)
+            formatted_code = first_code_pass
+            settled_code = first_code_pass[:settled or 0]
+            if cleaned.line_comments:
+                # Restoring only changes text inside a line, so the settled lines restore on their own
+                formatted_code = self.restore_line_comments(formatted_code)
+                settled_code = self.restore_line_comments(settled_code)
+            stopped = bool(settled) and changes_within(code, settled_code)
+        if settled is not None and not stopped:
+            formatted_code, tree, tokens = self._align(parts, owners, tree, tokens, "check")
+            if cleaned.line_comments:
+                with timed_stage("check", "restore_line_comments"):
+                    formatted_code = self.restore_line_comments(formatted_code)
+
+        with timed_stage("check", "lint_remap"):
+            tree = self._move_to_positions(code, cleaned.positions, tree, tokens)
+        with timed_stage("check", "lint"):
+            errors = self.get_errors(tree)
+        with timed_stage("check", "compare"):
+            return StyleCheck(code, formatted_code, errors, final=not stopped)
+
+    def _settled_length(self, first_code_pass, parts, owners, tokens, first_reordered):
+        """
+        The length of the lines at the start of first_code_pass, the FormattingVisitor's
+        parts and owners over tokens, that the alignment pass leaves as they are, or None
+        when it leaves all of them.
+
+        It only breaks lines longer than max_line_length and the lines of the parameters
+        and arguments it aligns, which are on or after the line of their opening
+        parenthesis. Lists are sized by their commas, never fewer than their parameters.
+        Modifiers or imports the first pass reorders, by the ranks, are a difference
+        before the line of the next unedited token, so no later line is needed.
+        """
+        if self.syntax_errors:
+            return 0
+        # The number of lines that are settled
+        settled = None
+        if self.configs.max_line_length != -1:
+            tab_width = self.configs.indents['size']
+            for number, line in enumerate(first_code_pass.split("\n")):
+                if len(line) + line.count("\t") * (tab_width - 1) > self.configs.max_line_length:
+                    settled = number
+                    break
+
+        # The line every unedited token ends up on, counted from 0
+        token_lines = [None] * len(tokens.tokens)
+        line = 0
+        for text, owner in zip(parts, owners):
+            if owner is not None:
+                token_lines[owner] = line
+            line += text.count("\n")
+        if first_reordered is not None:
+            following = next((line for line in token_lines[first_reordered:] if line is not None), line)
+            settled = following + 1 if settled is None else min(settled, following + 1)
+        # Edited tokens are on the line of the last unedited token before them or later
+        line = 0
+        for index, token_line in enumerate(token_lines):
+            if token_line is None:
+                token_lines[index] = line
+            else:
+                line = token_line
 
-        new_tree, new_tokens = self.parse_java_code(formatted_code)
-        errors = self.get_errors(new_tree)
+        aligns = self.configs.aligns
+        opened = []
+        for token in tokens.tokens:
+            if token.type == JavaLexer.LPAREN:
+                opened.append([token.tokenIndex, 1])
+            elif token.type == JavaLexer.COMMA and opened:
+                opened[-1][1] += 1
+            elif token.type == JavaLexer.RPAREN and opened:
+                index, size = opened.pop()
+                if AlignmentVisitor.aligns_parameters(aligns, size) and (settled is None or token_lines[index] < settled):
+                    settled = token_lines[index]
+        if settled is None:
+            return None
+        end = 0
+        for _ in range(settled):
+            end = first_code_pass.find("\n", end) + 1
+            if not end:
+                return len(first_code_pass)
+        return end
 
-        return formatted_code, errors
\ No newline at end of file
+    def _move_to_positions(self, code, positions, tree, tokens):
+        """Moves the tree's tokens to positions, those of the tokens of code, falling back to lexing code."""
+        # Formatting only reorders modifiers and imports, so every other token keeps its place among them
+        tree_tokens = [token for token in tokens.tokens if token.channel == Token.DEFAULT_CHANNEL and token.type != Token.EOF]
+        if len(tree_tokens) != len(positions):
+            return self._remap_or_parse("check", code, tree, tokens)[0]
+        for token, (line, column) in zip(tree_tokens, positions):
+            token.line = line
+            token.column = column
+        return tree
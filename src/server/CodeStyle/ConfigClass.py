@@ -1,12 +1,112 @@
+import copy
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from CodeStyle.FormatCache import FormatCache
+from CodeStyle.NamingRules import NamingRules
+import Metrics
+
+MAX_COMPILED_CONFIGS = 64
+# Indent strings are precomputed up to this level, deeper ones are made on demand
+PRECOMPUTED_INDENT_LEVELS = 32
+
+compiled_total = Metrics.registry.counter(
+    "codegator_config_compile_total", "Settings looked up in the compiled config cache", ("outcome",))
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def compile_config(settings, settings_hash=None):
+    """
+    Returns the shared, frozen ConfigClass for settings, compiling it on first use.
+
+    Configs are keyed by the canonical settings hash, FormatCache.settings_hash(),
+    which callers that already have it can pass. Equal settings map to the same
+    object however their keys are ordered. The most recently used
+    MAX_COMPILED_CONFIGS stay compiled.
+    """
+    if settings_hash is None:
+        settings_hash = FormatCache.settings_hash(settings)
+    with _compiled_lock:
+        configs = _compiled.get(settings_hash)
+        if configs is not None:
+            _compiled.move_to_end(settings_hash)
+    if configs is not None:
+        compiled_total.inc(outcome="hit")
+        return configs
+
+    compiled_total.inc(outcome="miss")
+    # A copy, so later changes to the caller's settings cannot reach the shared config
+    configs = ConfigClass(copy.deepcopy(settings))
+    configs.settings_hash = settings_hash
+    configs.freeze()
+    with _compiled_lock:
+        # Another thread may have compiled the same settings meanwhile
+        configs = _compiled.setdefault(settings_hash, configs)
+        _compiled.move_to_end(settings_hash)
+        while len(_compiled) > MAX_COMPILED_CONFIGS:
+            _compiled.popitem(last=False)
+    return configs
+
+
+def _read_only(value):
+    """value with its dicts made read-only views and its lists tuples, all the way down."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _read_only(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_read_only(item) for item in value)
+    return value
+
+
+def _writable(value):
+    """A copy of value with its read-only views and tuples plain dicts and lists again, for pickling."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: _writable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_writable(item) for item in value]
+    return value
+
+
+def _modifier_ranks(order):
+    """Rank of each modifier by where it first appears in order; modifiers not in it rank len(ranks)."""
+    ranks = {}
+    for modifier in order:
+        ranks.setdefault(modifier, len(ranks))
+    return ranks
+
+
 class ConfigClass:
     def __init__(self, config_dict):
+        self._frozen = False
         self.config_dict = config_dict
+        self.settings_hash = None
 
         self.default_config()
 
         if config_dict:
             self.parse_config()
 
+        self.precompute()
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"Compiled configs are shared and cannot be changed, '{name}' was set")
+        super().__setattr__(name, value)
+
+    def __reduce_ex__(self, protocol):
+        # Process pool workers get the settings and look up their own compiled config
+        if self._frozen:
+            return compile_config, (_writable(self.config_dict), self.settings_hash)
+        return super().__reduce_ex__(protocol)
+
+    def freeze(self):
+        """Makes this config and every dict and list in it read-only, before it is shared."""
+        for name, value in vars(self).items():
+            if isinstance(value, (dict, list)):
+                super().__setattr__(name, _read_only(value))
+        self._frozen = True
+
     def default_config(self):
         self.brace_style = 'break'
         self.space_around_operator = True
@@ -33,6 +133,7 @@ class ConfigClass:
             'after_open_bracket': 'align', # false, 'align', 'dont_align', 'always_break', 'block_indent'
             'parameters_before_align': 2 # How many parameters before breaking if 'after_open_bracket' is 'align' or 'dont_align'
         }
+        self.parse_mode = 'two_stage' # 'two_stage' (SLL, falling back to LL) or 'll'
 
     def parse_config(self):
         self.brace_style = self.config_dict['braceStyle']
@@ -48,4 +149,23 @@ class ConfigClass:
         self.indents['switch_case_labels'] = self.config_dict['indents']['switchCaseLabels']
 
         self.aligns['after_open_bracket'] = self.config_dict['aligns']['afterOpenBracket']
-        self.aligns['parameters_before_align'] = self.config_dict['aligns']['parametersBeforeAlignment']
\ No newline at end of file
+        self.aligns['parameters_before_align'] = self.config_dict['aligns']['parametersBeforeAlignment']
+
+        # Older settings files have no parse mode
+        self.parse_mode = self.config_dict.get('parseMode', self.parse_mode)
+
+    def precompute(self):
+        """Derives what the visitors look up over and over from the parsed settings."""
+        self.indent_unit = " " * self.indents['size'] if self.indents['type'] == 'spaces' else "\t"
+        self.indent_strings = [self.indent_unit * level for level in range(PRECOMPUTED_INDENT_LEVELS)]
+        self.class_modifier_ranks = _modifier_ranks(self.class_modifier_order)
+        self.method_modifier_ranks = _modifier_ranks(self.method_modifier_order)
+        # Compiled once per config, for every lint pass that uses it
+        self.naming_rules = NamingRules(self.naming_conventions)
+        self.naming_rules.precompile()
+
+    def indent(self, level):
+        """The indentation string for level."""
+        if 0 <= level < PRECOMPUTED_INDENT_LEVELS:
+            return self.indent_strings[level]
+        return self.indent_unit * level
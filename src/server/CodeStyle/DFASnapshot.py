@@ -0,0 +1,290 @@
+import hashlib
+import io
+import logging
+import os
+import pickle
+import sys
+import time
+from importlib.metadata import version
+from antlr4.PredictionContext import PredictionContext, SingletonPredictionContext, ArrayPredictionContext
+from antlr4.atn.ATN import ATN
+from antlr4.atn.ATNState import ATNState
+from antlr4.atn.SemanticContext import SemanticContext
+from antlr4.atn.LexerAction import LexerSkipAction, LexerMoreAction, LexerPopModeAction
+from antlr4.atn.LexerActionExecutor import LexerActionExecutor
+from antlr4.atn.LexerATNSimulator import LexerATNSimulator
+from antlr4.atn.ParserATNSimulator import ParserATNSimulator
+from antlr4.dfa.DFAState import DFAState
+from CodeStyle import JavaLexer, JavaParser
+
+logger = logging.getLogger(__name__)
+
+RECOGNIZERS = {
+    "lexer": JavaLexer.JavaLexer,
+    "parser": JavaParser.JavaParser,
+}
+
+# Objects the runtime compares by identity, so a snapshot refers to them instead of copying them
+SINGLETONS = {
+    "empty_context": PredictionContext.EMPTY,
+    "no_semantic_context": SemanticContext.NONE,
+    "lexer_error": LexerATNSimulator.ERROR,
+    "parser_error": ParserATNSimulator.ERROR,
+    "skip": LexerSkipAction.INSTANCE,
+    "more": LexerMoreAction.INSTANCE,
+    "pop_mode": LexerPopModeAction.INSTANCE,
+}
+SINGLETON_NAMES = {id(value): name for name, value in SINGLETONS.items()}
+
+DFA_STATE_FIELDS = ("stateNumber", "configs", "isAcceptState", "prediction",
+                    "lexerActionExecutor", "requiresFullContext", "predicates")
+
+
+def grammar_version():
+    """Identifies the generated lexer and parser and the runtime that built their DFAs."""
+    digest = hashlib.sha256()
+    for module in (JavaLexer, JavaParser):
+        digest.update(repr(module.serializedATN()).encode("ascii"))
+    digest.update(version("antlr4-python3-runtime").encode("ascii"))
+    return digest.hexdigest()[:16]
+
+
+def _context_parents(context):
+    return context.parents if isinstance(context, ArrayPredictionContext) else [context.parentCtx]
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """
+    Pickles the DFAs with their prediction contexts replaced by indexes into
+    self.contexts, which lists every context after its parents, each with its
+    parents as indexes too. Pickling contexts as objects would recurse once per
+    parent, deeper than the recursion limit for long chains.
+    """
+    def __init__(self, file, protocol=None):
+        super().__init__(file, protocol)
+        self.contexts = []
+        self.context_indexes = {}
+
+    def context_reference(self, context):
+        """What stands in for context in self.contexts: its index, a singleton name or None."""
+        if context is None:
+            return None
+        if id(context) in SINGLETON_NAMES:
+            return SINGLETON_NAMES[id(context)]
+        pending = [context]
+        while pending:
+            top = pending[-1]
+            if id(top) in self.context_indexes:
+                pending.pop()
+                continue
+            parents = [parent for parent in _context_parents(top) if parent is not None
+                       and id(parent) not in SINGLETON_NAMES and id(parent) not in self.context_indexes]
+            if parents:
+                pending.extend(parents)
+                continue
+            pending.pop()
+            parents = [self.context_reference(parent) for parent in _context_parents(top)]
+            if isinstance(top, ArrayPredictionContext):
+                self.contexts.append((True, parents, list(top.returnStates)))
+            else:
+                self.contexts.append((False, parents[0], top.returnState))
+            self.context_indexes[id(top)] = len(self.contexts) - 1
+        return self.context_indexes[id(context)]
+
+    def persistent_id(self, obj):
+        if id(obj) in SINGLETON_NAMES:
+            return ("singleton", SINGLETON_NAMES[id(obj)])
+        if isinstance(obj, PredictionContext):
+            return ("context", self.context_reference(obj))
+        if isinstance(obj, ATNState):
+            for name, recognizer in RECOGNIZERS.items():
+                if obj.atn is recognizer.atn:
+                    return ("state", name, obj.stateNumber)
+        if isinstance(obj, ATN):
+            for name, recognizer in RECOGNIZERS.items():
+                if obj is recognizer.atn:
+                    return ("atn", name)
+        return None
+
+    def reducer_override(self, obj):
+        # These cache hashes of strings, which differ between processes, so they are rebuilt on load
+        if isinstance(obj, LexerActionExecutor):
+            return LexerActionExecutor, (obj.lexerActions,)
+        return NotImplemented
+
+
+def _load_contexts(encoded_contexts):
+    """Rebuilds the contexts _SnapshotPickler listed, parents first, which also computes their hashes again."""
+    contexts = []
+
+    def resolve(reference):
+        if reference is None:
+            return None
+        if isinstance(reference, str):
+            return SINGLETONS[reference]
+        return contexts[reference]
+
+    for is_array, parents, return_states in encoded_contexts:
+        if is_array:
+            contexts.append(ArrayPredictionContext([resolve(parent) for parent in parents], return_states))
+        else:
+            contexts.append(SingletonPredictionContext(resolve(parents), return_states))
+    return contexts
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, contexts):
+        super().__init__(file)
+        self.contexts = contexts
+
+    def persistent_load(self, pid):
+        match pid:
+            case ("singleton", name):
+                return SINGLETONS[name]
+            case ("context", index):
+                return self.contexts[index]
+            case ("state", recognizer, state_number):
+                return RECOGNIZERS[recognizer].atn.states[state_number]
+            case ("atn", recognizer):
+                return RECOGNIZERS[recognizer].atn
+        raise pickle.UnpicklingError(f"Unknown persistent id {pid}")
+
+
+def _dump_dfa(dfa):
+    # Edges are stored as state indexes: pickling the state graph itself recurses once per edge
+    states = []
+    index = {}
+
+    def state_index(state):
+        if state is None:
+            return None
+        if id(state) in SINGLETON_NAMES:
+            return SINGLETON_NAMES[id(state)]
+        if id(state) not in index:
+            index[id(state)] = len(states)
+            states.append(state)
+        return index[id(state)]
+
+    s0 = state_index(dfa.s0)
+    for state in dfa._states:
+        state_index(state)
+    encoded = []
+    position = 0
+    while position < len(states):
+        state = states[position]
+        edges = None if state.edges is None else [state_index(target) for target in state.edges]
+        encoded.append(tuple(getattr(state, field) for field in DFA_STATE_FIELDS) + (edges,))
+        position += 1
+    return {"s0": s0, "in_dfa": [index[id(state)] for state in dfa._states], "states": encoded}
+
+
+def _load_dfa(dfa, data):
+    states = []
+    for encoded in data["states"]:
+        state = DFAState(configs=None)
+        for field, value in zip(DFA_STATE_FIELDS, encoded):
+            setattr(state, field, value)
+        if state.configs is not None:
+            # The set's hash was cached in the process that wrote the snapshot
+            state.configs.cachedHashCode = -1
+        states.append(state)
+
+    def resolve(target):
+        if target is None:
+            return None
+        if isinstance(target, str):
+            return SINGLETONS[target]
+        return states[target]
+
+    for state, encoded in zip(states, data["states"]):
+        edges = encoded[-1]
+        state.edges = None if edges is None else [resolve(target) for target in edges]
+    dfa._states = {}
+    for position in data["in_dfa"]:
+        dfa._states[states[position]] = states[position]
+    dfa.s0 = resolve(data["s0"])
+
+
+def save(path):
+    """Writes the DFAs built so far by JavaLexer and JavaParser in this process to path."""
+    start = time.perf_counter()
+    snapshot = {"version": grammar_version()}
+    for name, recognizer in RECOGNIZERS.items():
+        snapshot[name] = [_dump_dfa(dfa) for dfa in recognizer.decisionsToDFA]
+    dfas = io.BytesIO()
+    pickler = _SnapshotPickler(dfas, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dump(snapshot)
+    # The contexts go first, for the DFAs to refer to once they are loaded
+    buffer = io.BytesIO()
+    pickle.dump({"version": snapshot["version"], "contexts": pickler.contexts}, buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    buffer.write(dfas.getvalue())
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as snapshot_file:
+            snapshot_file.write(buffer.getvalue())
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save DFA snapshot to {path}: {e}")
+        return False
+    logger.info(f"Saved DFA snapshot ({len(buffer.getvalue()) // 1024} KiB) to {path} "
+                f"in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def load(path):
+    """
+    Fills the empty JavaLexer and JavaParser DFAs from a snapshot written by save().
+
+    Snapshots of another grammar or runtime version are ignored, as are DFAs that
+    already hold states. Only load snapshots this server wrote itself: they are pickles.
+    """
+    if not path or not os.path.exists(path):
+        return False
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as snapshot_file:
+            header = pickle.load(snapshot_file)
+            if header.get("version") != grammar_version() or "contexts" not in header:
+                logger.info("DFA snapshot was written for a different grammar version or snapshot format, ignoring it")
+                return False
+            snapshot = _SnapshotUnpickler(snapshot_file, _load_contexts(header["contexts"])).load()
+    except Exception as e:
+        logger.warning(f"Could not load DFA snapshot from {path}: {e}")
+        return False
+    for name, recognizer in RECOGNIZERS.items():
+        if len(snapshot[name]) != len(recognizer.decisionsToDFA):
+            logger.warning(f"DFA snapshot does not match the {name}, ignoring it")
+            return False
+    for name, recognizer in RECOGNIZERS.items():
+        for dfa, data in zip(recognizer.decisionsToDFA, snapshot[name]):
+            if not dfa._states:
+                _load_dfa(dfa, data)
+    logger.info(f"Loaded DFA snapshot from {path} in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def default_path():
+    return os.environ.get("CODEGATOR_DFA_SNAPSHOT_PATH")
+
+
+def main(argv):
+    """Builds a snapshot from the warm-up corpus and any Java files given: DFASnapshot.py <path> [files...]"""
+    from CodeStyle.FormatterPool import warm_up
+    from CodeStyle.CodeStyle import CodeStyleFormatter
+    from CodeStyle.ConfigClass import ConfigClass
+
+    if not argv:
+        print("usage: python -m CodeStyle.DFASnapshot <snapshot path> [java files...]")
+        return 1
+    formatter = CodeStyleFormatter()
+    formatter.configs = ConfigClass(None)
+    warm_up(formatter)
+    for file_path in argv[1:]:
+        with open(file_path, "r", encoding="utf-8") as java_file:
+            formatter.start_formatting(java_file.read())
+    return 0 if save(argv[0]) else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
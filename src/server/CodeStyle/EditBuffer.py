@@ -0,0 +1,221 @@
+from antlr4.Token import Token
+
+INSERT_BEFORE = 0
+INSERT_AFTER = 1
+REPLACE = 2
+
+
+class _PositionCounts:
+    """Fenwick tree counting the live inserts before an instruction position."""
+    def __init__(self, flags):
+        self.size = len(flags)
+        self.tree = [0] * (self.size + 1)
+        for position, flag in enumerate(flags):
+            if flag:
+                self.add(position, 1)
+
+    def add(self, position, delta):
+        position += 1
+        while position <= self.size:
+            self.tree[position] += delta
+            position += position & -position
+
+    def before(self, position):
+        total = 0
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+
+class EditBuffer:
+    """
+    Array-backed stand-in for antlr4's TokenStreamRewriter, for the calls the visitors make.
+
+    Edits are only recorded until getDefaultText(), which resolves them with the
+    runtime rewriter's rules and renders the text in one pass over the tokens.
+    The runtime compares every instruction with every earlier one, which is
+    quadratic in the number of edits; here each instruction only looks at the
+    tokens it covers.
+
+    The rules are the Python runtime's, quirks included, so the output (and the
+    ValueErrors for conflicting edits) is exactly what TokenStreamRewriter gives.
+    In particular, merging two inserts at the same token removes the instruction
+    at the earlier insert's rank among the inserts, not the insert itself.
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        # (kind, first token index, last token index, text) in the order they were made
+        self.operations = []
+
+    def getTokenStream(self):
+        return self.tokens
+
+    def insertBeforeToken(self, token, text):
+        self.operations.append((INSERT_BEFORE, token.tokenIndex, token.tokenIndex, text))
+
+    def insertBeforeIndex(self, index, text):
+        self.operations.append((INSERT_BEFORE, index, index, text))
+
+    def insertAfterToken(self, token, text):
+        self.insertAfter(token.tokenIndex, text)
+
+    def insertAfter(self, index, text):
+        self.operations.append((INSERT_AFTER, index + 1, index + 1, text))
+
+    def replaceIndex(self, index, text):
+        self.replaceRange(index, index, text)
+
+    def replaceSingleToken(self, token, text):
+        self.replaceRange(token.tokenIndex, token.tokenIndex, text)
+
+    def replaceRangeTokens(self, from_token, to_token, text):
+        self.replaceRange(from_token.tokenIndex, to_token.tokenIndex, text)
+
+    def replaceRange(self, from_index, to_index, text):
+        size = len(self.tokens.tokens)
+        if from_index > to_index or from_index < 0 or to_index < 0 or to_index >= size:
+            raise ValueError(f"replace: range invalid: {from_index}..{to_index}(size={size})")
+        self.operations.append((REPLACE, from_index, to_index, text))
+
+    def deleteToken(self, token):
+        # Like the runtime's, this takes a token index as well
+        index = token.tokenIndex if isinstance(token, Token) else token
+        self.replaceRange(index, index, "")
+
+    def deleteIndex(self, index):
+        self.replaceRange(index, index, "")
+
+    def _describe(self, position, kinds, firsts, lasts, texts):
+        if kinds[position] == REPLACE:
+            return f'<ReplaceOp@{self.tokens.get(firsts[position])}..{self.tokens.get(lasts[position])}:"{texts[position]}">'
+        name = "InsertAfterOp" if kinds[position] == INSERT_AFTER else "InsertBeforeOp"
+        return f'<{name}@{self.tokens.get(firsts[position])}:"{texts[position]}">'
+
+    def _reduce(self):
+        """Resolves the edits to at most one per token index: {token index: instruction position}."""
+        count = len(self.operations)
+        kinds = [operation[0] for operation in self.operations]
+        firsts = [operation[1] for operation in self.operations]
+        lasts = [operation[2] for operation in self.operations]
+        texts = [operation[3] for operation in self.operations]
+        alive = [True] * count
+
+        # Replaces, in order: absorb the earlier inserts at their first token and drop those
+        # inside them, drop earlier replaces they contain, and reject partial overlaps
+        inserts_at = {}
+        covering = {}
+        for position in range(count):
+            first = firsts[position]
+            if kinds[position] != REPLACE:
+                inserts_at.setdefault(first, []).append(position)
+                continue
+            last = lasts[position]
+            for index in range(first, last + 1):
+                inserts = inserts_at.pop(index, None)
+                if not inserts:
+                    continue
+                for insert in inserts:
+                    alive[insert] = False
+                    if index == first:
+                        texts[position] = texts[insert] + texts[position]
+            previous = sorted({covering[index] for index in range(first, last + 1) if index in covering})
+            for replace in previous:
+                if firsts[replace] >= first and lasts[replace] <= last:
+                    alive[replace] = False
+                else:
+                    raise ValueError(f"replace op boundaries of {self._describe(position, kinds, firsts, lasts, texts)} "
+                                     f"overlap with previous {self._describe(replace, kinds, firsts, lasts, texts)}")
+            for index in range(first, last + 1):
+                covering[index] = position
+
+        # Inserts, in order: merge with the earlier inserts at the same token, then into a replace starting there
+        live_inserts = _PositionCounts([alive[position] and kinds[position] != REPLACE for position in range(count)])
+        inserts_at = {}
+        for position in range(count):
+            if not alive[position] or kinds[position] == REPLACE:
+                continue
+            index = firsts[position]
+            earlier = inserts_at.get(index, [])
+            ranks = [live_inserts.before(insert) for insert in earlier]
+            for insert in earlier:
+                if kinds[insert] == INSERT_BEFORE:
+                    texts[position] = texts[position] + texts[insert]
+                else:
+                    texts[position] = texts[insert] + texts[position]
+            for rank in ranks:
+                if not alive[rank]:
+                    continue
+                alive[rank] = False
+                if kinds[rank] == REPLACE:
+                    for covered in range(firsts[rank], lasts[rank] + 1):
+                        if covering.get(covered) == rank:
+                            del covering[covered]
+                else:
+                    live_inserts.add(rank, -1)
+                    inserts_at[firsts[rank]].remove(rank)
+
+            replace = covering.get(index)
+            if replace is not None and replace < position:
+                if firsts[replace] == index:
+                    texts[replace] = texts[position] + texts[replace]
+                    alive[position] = False
+                    live_inserts.add(position, -1)
+                    continue
+                raise ValueError(f"insert op {self._describe(position, kinds, firsts, lasts, texts)} "
+                                 f"within boundaries of previous {self._describe(replace, kinds, firsts, lasts, texts)}")
+            inserts_at.setdefault(index, []).append(position)
+
+        reduced = {}
+        for position in range(count):
+            if not alive[position]:
+                continue
+            if firsts[position] in reduced:
+                raise ValueError('should be only one op per index')
+            reduced[firsts[position]] = position
+        return reduced, kinds, lasts, texts
+
+    def getDefaultText(self):
+        return "".join(self.getParts())
+
+    def getParts(self, owners=None):
+        """
+        The rendered text as a list of pieces. If owners is a list, it gets the index of
+        the token each piece is the unedited text of, or None for edited text.
+        """
+        tokens = self.tokens.tokens
+        size = len(tokens)
+        reduced, kinds, lasts, texts = self._reduce()
+        parts = []
+        index = 0
+        while index < size:
+            position = reduced.pop(index, None)
+            token = tokens[index]
+            if position is None:
+                if token.type != Token.EOF:
+                    parts.append(token.text)
+                    if owners is not None:
+                        owners.append(index)
+                index += 1
+            elif kinds[position] == REPLACE:
+                if texts[position]:
+                    parts.append(texts[position])
+                    if owners is not None:
+                        owners.append(None)
+                index = lasts[position] + 1
+            else:
+                parts.append(texts[position])
+                if owners is not None:
+                    owners.append(None)
+                if token.type != Token.EOF:
+                    parts.append(token.text)
+                    if owners is not None:
+                        owners.append(index)
+                index += 1
+        # Inserts after the last token
+        for index, position in reduced.items():
+            if index >= size - 1:
+                parts.append(texts[position])
+                if owners is not None:
+                    owners.append(None)
+        return parts
@@ -1,35 +1,32 @@
+from antlr4 import ParserRuleContext
 from CodeStyle.JavaParser import JavaParser
 from CodeStyle.JavaParserVisitor import JavaParserVisitor
-from CodeStyle.StandardNamingConventions import StandardNamingConventions
+from CodeStyle.NamingRules import compile_convention
 from CodeStyle.ConfigClass import ConfigClass
-import re
 
 class ErrorLogger(JavaParserVisitor):
     def __init__(self, configs: ConfigClass):
         self.configs = configs
+        # (kind, rule, identifier token, name) of every identifier to check
+        self.candidates = []
         self.error_log = []
 
-    def visitClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
-        class_name = ctx.identifier().getText()
-        class_config = self.configs.naming_conventions["class"]
-        error = self.check_convention(class_name, class_config)
-        if error:
-            position_text = f"Line {ctx.identifier().start.line}, Column {ctx.identifier().start.column}:"
-            self.error_log.append(position_text + "Class " + error)
+    def visitChildren(self, node):
+        # Names are only declared in rule contexts, and no visit returns anything
+        if node.children:
+            for child in node.children:
+                if isinstance(child, ParserRuleContext):
+                    child.accept(self)
 
+    def visitClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
+        identifier = ctx.identifier()
+        self.candidates.append(("class", "class", identifier.start, identifier.getText()))
 
         return self.visitChildren(ctx)
 
     def visitMethodDeclaration(self, ctx: JavaParser.MethodDeclarationContext):
-        method_name = ctx.identifier().getText()
-
-        method_config = self.configs.naming_conventions["method"]
-        error = self.check_convention(method_name, method_config)
-
-        if error:
-            position_text = f"Line {ctx.identifier().start.line}, Column {ctx.identifier().start.column}:"
-            self.error_log.append(position_text + "Method " + error)
-
+        identifier = ctx.identifier()
+        self.candidates.append(("method", "method", identifier.start, identifier.getText()))
 
         return self.visitChildren(ctx)
 
@@ -38,72 +35,42 @@ class ErrorLogger(JavaParserVisitor):
         modifiers = [mod.getText() for mod in ctx.parentCtx.parentCtx.modifier()]
         is_static = "static" in modifiers
         is_final = "final" in modifiers
-
-        variable_config = self.configs.naming_conventions["variable"]
-        constant_config = self.configs.naming_conventions["constant"]
+        rule = "constant" if is_static and is_final else "variable"
 
         for declarator in declarators.variableDeclarator():
-            field_name = declarator.variableDeclaratorId().getText()
-
-            error = None
-
-            if is_static and is_final:
-                error = self.check_convention(field_name, constant_config)
-            else:
-                error = self.check_convention(field_name, variable_config)
-
-            if error:
-                position_text = f"Line {declarator.variableDeclaratorId().start.line}, Column {declarator.variableDeclaratorId().start.column}:"
-                self.error_log.append(position_text + "Field " + error)
-
+            identifier = declarator.variableDeclaratorId()
+            self.candidates.append(("field", rule, identifier.start, identifier.getText()))
 
         return self.visitChildren(ctx)
 
     def visitLocalVariableDeclaration(self, ctx: JavaParser.LocalVariableDeclarationContext):
         declarators = ctx.variableDeclarators()
 
-        variable_config = self.configs.naming_conventions["variable"]
-
         for declarator in declarators.variableDeclarator():
-            variable_name = declarator.variableDeclaratorId().getText()
-
-            error = self.check_convention(variable_name, variable_config)
-            if error:
-                position_text = f"Line {declarator.variableDeclaratorId().start.line}, Column {declarator.variableDeclaratorId().start.column}:"
-                self.error_log.append(position_text + "Local variable " + error)
-
+            identifier = declarator.variableDeclaratorId()
+            self.candidates.append(("local_variable", "variable", identifier.start, identifier.getText()))
 
         return self.visitChildren(ctx)
 
     def visitFormalParameter(self, ctx: JavaParser.FormalParameterContext):
-        parameter_name = ctx.variableDeclaratorId().getText()
-
-        parameter_config = self.configs.naming_conventions["parameter"]
-
-        error = self.check_convention(parameter_name, parameter_config)
-        if error:
-            position_text = f"Line {ctx.variableDeclaratorId().start.line}, Column {ctx.variableDeclaratorId().start.column}:"
-            self.error_log.append(position_text + "Parameter " + error)
-
+        identifier = ctx.variableDeclaratorId()
+        self.candidates.append(("parameter", "parameter", identifier.start, identifier.getText()))
 
         return self.visitChildren(ctx)
 
     @staticmethod
     def check_convention(name, convention) -> bool:
-        patterns = {
-            StandardNamingConventions.PASCAL_CASE.value: r"[A-Z][a-zA-Z0-9]*",
-            StandardNamingConventions.CAMEL_CASE.value: r"[a-z][a-zA-Z0-9]*",
-            StandardNamingConventions.UPPER_CASE.value: r"[A-Z][A-Z0-9_]*"
-        }
-
-        pattern = patterns.get(convention, convention)
-
-        if not bool(re.fullmatch(pattern, name)):
+        if not compile_convention(convention).fullmatch(name):
             return f"'{name}' does not match the naming convention '{convention}'"
 
         return None
 
-    def find_errors(self, tree) -> list:
-        self.error_log = []
+    def find_diagnostics(self, tree) -> list:
+        """Checks every declared name in tree, returning a NamingDiagnostic for each that breaks its convention."""
+        self.candidates = []
         self.visit(tree)
-        return self.error_log
\ No newline at end of file
+        return self.configs.naming_rules.check_all(self.candidates)
+
+    def find_errors(self, tree) -> list:
+        self.error_log = [diagnostic.message() for diagnostic in self.find_diagnostics(tree)]
+        return self.error_log
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _formatter_fingerprint():
+    # Any change to the formatter's sources changes its output, so it invalidates persisted entries
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            with open(os.path.join(directory, name), "rb") as source:
+                digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+class FormatCache:
+    """
+    Bounded LRU cache of formatting results keyed by the code and the settings.
+
+    Keys are content hashes, so the same file formatted with the same settings is
+    served without running the pipeline again. When a path is given the cache is
+    loaded from it with load() and written back with save().
+    """
+    def __init__(self, max_entries=1024, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.fingerprint = _formatter_fingerprint()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def settings_hash(settings):
+        canonical = json.dumps(settings, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key(code, settings_hash):
+        code_hash = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        return f"{code_hash}:{settings_hash}"
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load format cache from {self.path}: {e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            logger.info("Format cache was written by a different formatter version, ignoring it")
+            return
+        for key, value in data.get("entries", []):
+            self.put(key, tuple(value))
+        logger.info(f"Loaded {len(self._entries)} format cache entries from {self.path}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = list(self._entries.items())
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as cache_file:
+                json.dump({"fingerprint": self.fingerprint, "entries": entries}, cache_file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save format cache to {self.path}: {e}")
@@ -0,0 +1,215 @@
+import gc
+import logging
+import os
+import time
+from CodeStyle.ConfigClass import ConfigClass, compile_config
+
+logger = logging.getLogger(__name__)
+
+# Small corpus covering the constructs real files hit most often. Formatting it once
+# fills JavaParser/JavaLexer decisionsToDFA so the first real requests don't pay for it.
+WARMUP_CORPUS = [
+    """package com.example.warmup;
+import java.util.List;
+import java.util.ArrayList;
+import java.util.Map;
+import static java.lang.Math.max;
+
+@SuppressWarnings("unchecked")
+public final class Warmup<T extends Comparable<T>> extends Base implements Runnable {
+    private static final int LIMIT = 10;
+    private final List<T> items = new ArrayList<>();
+    protected Map<String, List<Integer>> index;
+    private int[] counts = new int[] {1, 2, 3};
+
+    public Warmup(List<T> items) {
+        super();
+        this.items.addAll(items);
+    }
+
+    @Override
+    public void run() {
+        for (int i = 0; i < LIMIT; i++) {
+            if (i % 2 == 0 && i != 4 || i > 8) {
+                counts[0] += i;
+            } else if (i == 3) {
+                continue;
+            } else {
+                counts[1]--;
+            }
+        }
+        for (T item : items) {
+            System.out.println(item.toString() + " " + max(1, 2));
+        }
+        int total = 0;
+        while (total < 100) {
+            total = total * 2 + 1;
+        }
+        do {
+            total -= 3;
+        } while (total > 50);
+    }
+
+    public static <K, V> V lookup(Map<K, V> map, K key, V fallback) throws IllegalStateException {
+        V value = map.get(key);
+        return value != null ? value : fallback;
+    }
+
+    private String describe(Object value) {
+        switch (value.hashCode() % 3) {
+            case 0:
+                return "zero";
+            case 1: {
+                break;
+            }
+            default:
+                return "other";
+        }
+        try {
+            Object copy = (String) value;
+            return copy.toString();
+        } catch (ClassCastException | NullPointerException e) {
+            throw new IllegalArgumentException("bad value", e);
+        } finally {
+            items.clear();
+        }
+    }
+
+    public void streams() {
+        items.stream().filter(item -> item != null).map(Object::toString).forEach(System.out::println);
+        Runnable task = () -> {
+            synchronized (this) {
+                notifyAll();
+            }
+        };
+        new Thread(task).start();
+    }
+}
+""",
+    """public interface Shape {
+    double area();
+
+    default String name() {
+        return getClass().getSimpleName();
+    }
+}
+
+enum Color {
+    RED, GREEN, BLUE;
+
+    Color next() {
+        return values()[(ordinal() + 1) % values().length];
+    }
+}
+
+abstract class Base {
+    protected abstract void reset();
+
+    static class Nested {
+        long value = 0L;
+        boolean flag = !true;
+        char letter = 'a';
+        double ratio = 1.5e3;
+    }
+}
+""",
+]
+
+
+def _new_formatter():
+    # The parser is imported on first use: with process workers the server process never formats
+    from CodeStyle.CodeStyle import CodeStyleFormatter
+    return CodeStyleFormatter()
+
+
+def warm_up(formatter=None):
+    """Formats the built-in corpus once to populate the parser's shared DFA cache."""
+    if formatter is None:
+        formatter = _new_formatter()
+    if formatter.configs is None:
+        formatter.configs = ConfigClass(None)
+    start = time.perf_counter()
+    for code in WARMUP_CORPUS:
+        try:
+            formatter.start_formatting(code)
+        except Exception as e:
+            logger.warning(f"Formatter warm-up failed: {e}")
+    logger.info(f"Formatter warm-up took {time.perf_counter() - start:.2f}s in process {os.getpid()}")
+
+
+# Only set inside process pool workers, which run one job at a time
+_worker_formatter = None
+
+
+def init_worker():
+    """Process pool initializer: imports the parser once and warms its DFA cache."""
+    global _worker_formatter
+    _worker_formatter = _new_formatter()
+    warm_up(_worker_formatter)
+
+
+def format_job(code, settings):
+    """Formats one (code, settings) job on a pool worker."""
+    if _worker_formatter is None:
+        # Thread pools share this module between workers, so each job needs its own formatter
+        return _new_formatter().start_formatting(code, settings)
+    return _worker_formatter.start_formatting(code, settings)
+
+
+def check_job(code, settings):
+    """Checks whether code already matches the style of settings on a pool worker, returning a StyleCheck."""
+    formatter = _worker_formatter if _worker_formatter is not None else _new_formatter()
+    return formatter.check_formatting(code, settings)
+
+
+def format_range_job(code, settings, start, end):
+    """Formats the members enclosing the range start-end of code on a pool worker."""
+    from CodeStyle.RangeFormatter import RangeFormatter
+    formatter = _worker_formatter if _worker_formatter is not None else _new_formatter()
+    return RangeFormatter(formatter).format_range(code, start, end, settings)
+
+
+def format_chunk_job(text, settings, stubbed, indent_level=0):
+    """Formats one chunk of a document split by ParallelFormatter on a pool worker."""
+    from CodeStyle.ParallelFormatter import format_chunk
+    formatter = _worker_formatter if _worker_formatter is not None else _new_formatter()
+    return format_chunk(formatter, text, settings, stubbed, indent_level)
+
+
+def format_stream_job(memory_limit, part, job, *args):
+    """
+    Runs the format job(*args) for a part of a document streamed by StreamFormatter on
+    a pool worker, stopping it with MemoryLimitExceeded once it takes more than
+    memory_limit bytes, then frees its parse trees.
+    """
+    from CodeStyle.StreamFormatter import run_within_memory
+    try:
+        return run_within_memory(memory_limit, part, job, *args)
+    finally:
+        # Parse tree nodes point back at their parents, so without a collection they pile up chunk after chunk
+        gc.collect()
+
+
+def save_dfa_snapshot():
+    """Saves this worker's DFAs, warmed by real traffic, for the next workers to start from."""
+    from CodeStyle import DFASnapshot
+    path = DFASnapshot.default_path()
+    if path:
+        DFASnapshot.save(path)
+
+
+def format_members_job(texts, settings):
+    """Formats each top-level member text on its own, for IncrementalFormatter, on a pool worker."""
+    from CodeStyle.RangeFormatter import RangeFormatter
+    formatter = _worker_formatter if _worker_formatter is not None else _new_formatter()
+    configs = settings if isinstance(settings, ConfigClass) else compile_config(settings)
+    range_formatter = RangeFormatter(formatter)
+    results = []
+    for text in texts:
+        try:
+            results.append(range_formatter.format_members(text, 1, configs))
+        except Exception as e:
+            # The whole document is formatted instead, which reports the problem the usual way
+            logger.info(f"Could not format a member on its own: {e}")
+            results.append(None)
+    return results
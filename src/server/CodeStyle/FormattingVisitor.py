@@ -3,13 +3,15 @@ from typing import Optional
 from antlr4.tree.TokenTagToken import TokenTagToken
 from CodeStyle.JavaParser import JavaParser
 from CodeStyle.JavaParserVisitor import JavaParserVisitor
-from antlr4.TokenStreamRewriter import TokenStreamRewriter
+from CodeStyle.EditBuffer import EditBuffer
+from CodeStyle.TokenPositions import TokenPositions
 from functools import wraps
 from CodeStyle.ConfigClass import ConfigClass
 
 class FormattingVisitor(JavaParserVisitor):
     def __init__(self, tokens, config: ConfigClass):
-        self.rewriter : TokenStreamRewriter = TokenStreamRewriter(tokens)
+        self.rewriter : EditBuffer = EditBuffer(tokens)
+        self.positions: TokenPositions = TokenPositions(tokens)
         self.config:ConfigClass = config
         self.indent_level: int = 0
         self.method_type: bool = False
@@ -19,6 +21,8 @@ class FormattingVisitor(JavaParserVisitor):
             'end_index': -1,
             'exists': False
         }
+        # Index of the first token whose modifiers or imports are put in another order
+        self.first_reordered: Optional[int] = None
 
     def visitImportDeclaration(self, ctx: JavaParser.ImportDeclarationContext):
         self.imports['exists'] = True
@@ -45,6 +49,8 @@ class FormattingVisitor(JavaParserVisitor):
     
     def _order_imports(self):
         if self.imports['items']:
+            if self.imports['items'] != sorted(self.imports['items']):
+                self._reordered(self.imports['start_index'])
             self.rewriter.replaceRange(self.imports['start_index'], self.imports['end_index'], "\n".join(sorted(self.imports['items'])))
         
         # Used to help with the lack of a newline in the last import
@@ -69,7 +75,7 @@ class FormattingVisitor(JavaParserVisitor):
         if isinstance(parent, JavaParser.TypeDeclarationContext):
             if parent.classOrInterfaceModifier():
                 modifiers = [mod.getText() for mod in parent.classOrInterfaceModifier()]
-                modifiers = self._sort_modifiers(modifiers, self.config.class_modifier_order)
+                modifiers = self._sort_modifiers(modifiers, self.config.class_modifier_ranks, parent.start)
         
         class_signature = f"{' '.join(modifiers)} class {class_name}".strip()
         self.rewriter.replaceRangeTokens(parent.start, ctx.identifier().stop, class_signature)
@@ -126,7 +132,7 @@ class FormattingVisitor(JavaParserVisitor):
             if isinstance(grandparent, JavaParser.ClassBodyDeclarationContext):
                 if grandparent.modifier():
                     modifiers = [mod.getText() for mod in grandparent.modifier()]
-                    modifiers = self._sort_modifiers(modifiers, self.config.method_modifier_order)
+                    modifiers = self._sort_modifiers(modifiers, self.config.method_modifier_ranks, grandparent.start)
 
         method_signature = f"{' '.join(modifiers)} {return_type} {method_name}".strip()
 
@@ -259,13 +265,7 @@ class FormattingVisitor(JavaParserVisitor):
                     self.rewriter.insertBeforeToken(parameter.start, f"\n{align_spaces}")
 
     def _get_align_spaces(self, open_paren):
-        token_stream = self.rewriter.getTokenStream()
-        token_index = open_paren.tokenIndex
-        spacer_length = 0
-        while token_stream.get(token_index).type != JavaParser.WS:
-            spacer_length += len(token_stream.get(token_index).text)
-            token_index -= 1
-
+        spacer_length = self.positions.width_since_whitespace(open_paren.tokenIndex)
         return " " * (spacer_length + (self.indent_level * self.config.indents['size']))         
 
     def _remove_whitespace(self, pos):
@@ -273,20 +273,29 @@ class FormattingVisitor(JavaParserVisitor):
             self.rewriter.deleteToken(pos)
             pos -=1
 
-    def _sort_modifiers(self, modifiers, order):
+    def _sort_modifiers(self, modifiers, ranks, first_token):
         """
         Sorts a list of modifiers according to a specified order.
         
-        Modifiers not present in the order list are placed at the end in their original order.
+        Modifiers not present in the order are placed at the end in their original order.
         
         Args:
             modifiers: List of modifier strings to sort.
-            order: List defining the desired order of modifiers.
+            ranks: Rank of each modifier in the desired order, from the config.
+            first_token: The first token of the declaration, noted when the order changes.
         
         Returns:
             A new list of modifiers sorted according to the specified order.
         """
-        return sorted(modifiers, key=lambda x: order.index(x) if x in order else len(order))
+        unknown = len(ranks)
+        sorted_modifiers = sorted(modifiers, key=lambda x: ranks.get(x, unknown))
+        if sorted_modifiers != modifiers:
+            self._reordered(first_token.tokenIndex)
+        return sorted_modifiers
+
+    def _reordered(self, index):
+        if self.first_reordered is None or index < self.first_reordered:
+            self.first_reordered = index
     
     def _get_indent(self, additional_ident =0):
         """
@@ -298,13 +307,7 @@ class FormattingVisitor(JavaParserVisitor):
         Returns:
             A string of spaces or tabs representing the current indentation.
         """
-        match self.config.indents['type']:
-            case "spaces":
-                return " " * ((self.indent_level +additional_ident) * self.config.indents['size'])
-            # may it appear as 8 spaces but it is actually configurable
-            # in text editors so it should be as a size of indent_size
-            case "tabs":
-                return "\t" * (self.indent_level + additional_ident)
+        return self.config.indent(self.indent_level + additional_ident)
     
     
     def visitVariableDeclarator(self, ctx: JavaParser.VariableDeclaratorContext):
@@ -444,7 +447,7 @@ class FormattingVisitor(JavaParserVisitor):
             if isinstance(grandparent, JavaParser.ClassBodyDeclarationContext):
                 if grandparent.modifier():
                     modifiers = [mod.getText() for mod in grandparent.modifier()]
-                    modifiers = self._sort_modifiers(modifiers, self.config.method_modifier_order)
+                    modifiers = self._sort_modifiers(modifiers, self.config.method_modifier_ranks, grandparent.start)
 
         constructor_signature = f"{' '.join(modifiers)} {constructor_name}".strip()
 
@@ -468,12 +471,17 @@ class FormattingVisitor(JavaParserVisitor):
     
 
     def get_formatted_code(self, tree):
+        return "".join(self.get_formatted_parts(tree))
+
+    def get_formatted_parts(self, tree, owners=None):
+        """The formatted code as the EditBuffer's getParts() gives it, with owners filled in the same way."""
         self.imports = {
             'items': [],
             'start_index': -1,
             'end_index': -1,
             'exists': False
         }
+        self.first_reordered = None
 
         self.visit(tree)
 
@@ -481,6 +489,4 @@ class FormattingVisitor(JavaParserVisitor):
         if self.config.imports['order'] == "sort":
             self._order_imports()
 
-            
-        formatted_text: str = self.rewriter.getDefaultText()
-        return formatted_text
+        return self.rewriter.getParts(owners)
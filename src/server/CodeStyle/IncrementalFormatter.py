@@ -0,0 +1,305 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from CodeStyle.RangeFormatter import scan_members, ERROR_POSITION_PATTERN, SCAN_PATTERN, SKIPPED_PATTERN, WHITESPACE_PATTERN
+import Metrics
+
+COMMENT_PATTERN = re.compile(r'//[^\n]*|/\*[\s\S]*?\*/')
+# clean_code() drops indentation and collapses runs of spaces, so they never change the output
+IGNORED_SPACES_PATTERN = re.compile(r'(?<=\n) +| (?= )')
+
+members_total = Metrics.registry.counter(
+    "codegator_format_incremental_members_total", "Top-level members of incremental format requests", ("outcome",))
+documents_total = Metrics.registry.counter(
+    "codegator_format_incremental_documents_total", "Incremental format requests by how they were served", ("outcome",))
+
+
+def member_key(text, settings_hash, context=None):
+    """
+    Hash of a member's text as the formatter sees it: strings and comments verbatim,
+    code without ignored spaces, and the comment context of a member with comments.
+    """
+    parts = []
+    position = 0
+    for match in SKIPPED_PATTERN.finditer(text):
+        parts.append(IGNORED_SPACES_PATTERN.sub("", text[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(IGNORED_SPACES_PATTERN.sub("", text[position:]))
+    digest = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+    return f"{digest}:{settings_hash}" if context is None else f"{digest}:{settings_hash}:{context}"
+
+
+def comment_contexts(gaps, members):
+    """
+    The comment context of every member of a split_document() split: the braces
+    opened since the comment before the member, which clean_code() indents the
+    member's first comment by, or None for a member without comments.
+    """
+    contexts = []
+    braces = 0
+    for index, gap in enumerate(gaps):
+        if index:
+            context = braces
+            commented = False
+            for match in SCAN_PATTERN.finditer(members[index - 1]):
+                token = match.group(0)
+                if token == "{":
+                    braces += 1
+                elif token == "}":
+                    braces -= 1
+                elif token.startswith(("//", "/*")):
+                    braces = 0
+                    commented = True
+            # clean_code() indents by no fewer than zero braces
+            contexts.append(max(0, context) if commented else None)
+        for match in SCAN_PATTERN.finditer(gap):
+            token = match.group(0)
+            if token == "{":
+                braces += 1
+            elif token == "}":
+                braces -= 1
+            elif token.startswith(("//", "/*")):
+                braces = 0
+    return contexts
+
+
+def member_shape(text):
+    """
+    What the whole-document format of the text around a member depends on: whether
+    it starts with a comment, which takes the place of the blank line before it, and
+    whether it ends with a body, after which a field loses its indentation.
+    """
+    code = text.strip()
+    return code.startswith(("//", "/*")), COMMENT_PATTERN.sub("", code).rstrip().endswith("}")
+
+
+def split_document(code):
+    """
+    Splits code into the text between top-level class members and the members themselves.
+
+    Returns (gaps, members) with len(gaps) == len(members) + 1, so that joining them
+    in turn gives code back. Each member covers whole lines, with its leading
+    comments and a trailing comment on its last line. Returns None when a member
+    shares a line with other code, or when there is no member to split on.
+    """
+    bounds = []
+    for member in scan_members(code):
+        if member.depth != 1 or not member.formattable:
+            continue
+        # What follows the previous member (or the '{') on its line belongs to it
+        line_end = code.find("\n", member.start)
+        if line_end == -1 or COMMENT_PATTERN.sub("", code[member.start:line_end]).strip():
+            return None
+        content_start = WHITESPACE_PATTERN.match(code, line_end).end()
+        start = code.rfind("\n", 0, content_start) + 1
+        end = code.find("\n", member.end)
+        end = len(code) if end == -1 else end
+        if COMMENT_PATTERN.sub("", code[member.end:end]).strip():
+            return None
+        bounds.append((start, end))
+    if not bounds:
+        return None
+
+    gaps = []
+    members = []
+    position = 0
+    for start, end in bounds:
+        gaps.append(code[position:start])
+        members.append(code[start:end])
+        position = end
+    gaps.append(code[position:])
+    return gaps, members
+
+
+class DocumentState:
+    def __init__(self, settings_hash, gaps, gap_errors, shapes, members):
+        self.settings_hash = settings_hash
+        # Formatted text between the members, with the naming errors found in it
+        self.gaps = gaps
+        self.gap_errors = gap_errors
+        # member_shape() of every formatted member, in order
+        self.shapes = shapes
+        # Member key -> (formatted member, its naming errors)
+        self.members = members
+
+
+class IncrementalPlan:
+    def __init__(self, document_id, state, gaps, texts, keys, contexts, members):
+        self.document_id = document_id
+        self.state = state
+        self.gaps = gaps
+        self.texts = texts
+        self.keys = keys
+        # comment_contexts() of the members, which formatting keeps as they are
+        self.contexts = contexts
+        # None where the member has to be formatted
+        self.members = members
+
+    @property
+    def pending(self):
+        """Texts of the members that changed since the document was last formatted."""
+        return [text for text, cached in zip(self.texts, self.members) if cached is None]
+
+
+class IncrementalFormatter:
+    """
+    Per-document cache of formatted top-level class members.
+
+    After a document is formatted as a whole, seed() stores its formatted members
+    keyed by their text and the settings. On the next request plan() splits the
+    document the same way: members with a known key are served from the cache,
+    and only the others are formatted on their own, the way range formatting
+    formats them. Anything else that changed (imports, class headers, members
+    added or removed, settings) needs a whole-document format again.
+
+    How the whole-document format indents a member's comments, and the text
+    between members, depends on the code around the member. So members with
+    comments are cached for their comment context, and a change to one, or to
+    the kind of member at a place, needs a whole-document format.
+    """
+    def __init__(self, max_documents=64):
+        self.max_documents = max_documents
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, document_id, code, settings_hash):
+        """Returns what it takes to format code from the cache, or None if it must be formatted whole."""
+        with self._lock:
+            state = self._documents.get(document_id)
+            if state is not None:
+                self._documents.move_to_end(document_id)
+        split = split_document(code) if state is not None and "\r" not in code else None
+        if split is None or state.settings_hash != settings_hash or split[0] != state.gaps:
+            documents_total.inc(outcome="full")
+            return None
+
+        gaps, texts = split
+        contexts = comment_contexts(gaps, texts)
+        keys = [member_key(text, settings_hash, context) for text, context in zip(texts, contexts)]
+        members = [state.members.get(key) for key in keys]
+        shapes = [member_shape(text) for text in texts]
+        for index, cached in enumerate(members):
+            if cached is not None:
+                continue
+            # A member formatted on its own would indent its comments by what the range wrapper puts before them,
+            # would change the text the whole-document format puts around it, or would keep the indentation a
+            # field after a body loses, so only the whole document comes out the same
+            if (contexts[index] is not None or shapes[index] != state.shapes[index]
+                    or (index and shapes[index - 1][1] and not shapes[index][1])):
+                documents_total.inc(outcome="full")
+                return None
+        return IncrementalPlan(document_id, state, gaps, texts, keys, contexts, members)
+
+    def complete(self, plan, results):
+        """
+        Splices the cached members and results, the (text, errors) of each pending
+        member from RangeFormatter.format_members(), into the formatted document.
+
+        Returns (formatted_code, errors) like CodeStyleFormatter.start_formatting(),
+        or None when a member could not be formatted on its own.
+        """
+        results = iter(results)
+        members = []
+        for cached in plan.members:
+            if cached is None:
+                cached = next(results)
+                if cached is None:
+                    documents_total.inc(outcome="full")
+                    return None
+                members_total.inc(outcome="formatted")
+            else:
+                members_total.inc(outcome="reused")
+            members.append(cached)
+        documents_total.inc(outcome="incremental")
+
+        parts = []
+        errors = []
+        line = 0
+        for index, gap in enumerate(plan.gaps):
+            if index:
+                text, member_errors = members[index - 1]
+                errors.extend(f"Line {line + relative + 1}{position}" for relative, position in member_errors)
+                parts.append(text)
+                line += text.count("\n")
+            errors.extend(f"Line {line + relative + 1}{position}" for relative, position in plan.state.gap_errors[index])
+            parts.append(gap)
+            line += gap.count("\n")
+
+        # Keys of both the submitted and the formatted text, so the next request hits either way
+        entries = {}
+        for key, context, (text, member_errors) in zip(plan.keys, plan.contexts, members):
+            entries[key] = (text, member_errors)
+            entries[member_key(text, plan.state.settings_hash, context)] = (text, member_errors)
+        self._store(plan.document_id, DocumentState(plan.state.settings_hash, plan.gaps, plan.state.gap_errors,
+                                                    plan.state.shapes, entries))
+        return "".join(parts), errors
+
+    def seed(self, document_id, code, formatted_code, errors, settings_hash):
+        """Caches the members of formatted_code, the whole-document format of code."""
+        formatted = split_document(formatted_code)
+        if formatted is None:
+            self.forget(document_id)
+            return
+        gaps, texts = formatted
+
+        # Every error goes to the gap or member holding its line, relative to where that starts
+        pieces = [gaps[0]]
+        for text, gap in zip(texts, gaps[1:]):
+            pieces.extend((text, gap))
+        piece_errors = [[] for _ in pieces]
+        starts = []
+        line = 0
+        for piece in pieces:
+            starts.append(line)
+            line += piece.count("\n")
+        for error in errors:
+            position = ERROR_POSITION_PATTERN.match(error)
+            if not position:
+                self.forget(document_id)
+                return
+            error_line = int(position.group(1)) - 1
+            for index, piece in enumerate(pieces):
+                # Gaps end with the newline before a member, which is not on the member's first line
+                last_line = starts[index] + piece.count("\n") - piece.endswith("\n")
+                if starts[index] <= error_line <= last_line:
+                    piece_errors[index].append((error_line - starts[index], error[position.end(1):]))
+                    break
+
+        # The submitted members map onto the formatted ones when formatting kept them apart the same way.
+        # When it did not, a comment took in the code after it, and formatting the output would change it again
+        submitted = split_document(code) if "\r" not in code else None
+        if submitted is None or len(submitted[1]) != len(texts):
+            self.forget(document_id)
+            return
+        entries = {}
+        formatted_keys = [member_key(text, settings_hash, context)
+                          for text, context in zip(texts, comment_contexts(gaps, texts))]
+        for index, key in enumerate(formatted_keys):
+            entries[key] = (texts[index], piece_errors[2 * index + 1])
+        for text, context, key in zip(submitted[1], comment_contexts(*submitted), formatted_keys):
+            entries.setdefault(member_key(text, settings_hash, context), entries[key])
+        shapes = [member_shape(text) for text in texts]
+        self._store(document_id, DocumentState(settings_hash, gaps, piece_errors[::2], shapes, entries))
+
+    def forget(self, document_id):
+        with self._lock:
+            self._documents.pop(document_id, None)
+
+    def _store(self, document_id, state):
+        if self.max_documents <= 0:
+            return
+        with self._lock:
+            self._documents[document_id] = state
+            self._documents.move_to_end(document_id)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "max_documents": self.max_documents,
+                "members": sum(len(state.members) for state in self._documents.values()),
+            }
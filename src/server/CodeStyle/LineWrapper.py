@@ -0,0 +1,175 @@
+from antlr4.Token import Token
+from CodeStyle.JavaParser import JavaParser
+
+# Continuation lines are indented this many levels past the line they continue
+CONTINUATION_LEVELS = 2
+
+
+class LineWrapper:
+    """
+    Breaks lines longer than max_line_length while rendering an EditBuffer.
+
+    The AlignmentVisitor marks break points in the parse tree: before the
+    arguments, parameters and types after a comma, before binary operators,
+    before the dots of calls on what another call returns and before the extends, implements, permits
+    and throws of declarations. Every break has the depth of the group it
+    belongs to, where nested argument lists and tighter binding operators are
+    deeper.
+
+    This is Oppen's pretty printer over the rendered pieces, in two linear passes.
+    The first measures each break: the width up to the next break at the same
+    or a lower depth, or to the end of the line. The second breaks the line at a
+    break point when that width no longer fits, so outer groups break before the
+    groups inside them, and the rest stays on the line. A continuation line is
+    indented past the one the group around it broke onto, and tabs count as
+    tab_width columns.
+
+    String literals that still run past the end of the line are split into a
+    concatenation at spaces. Lines without break points stay as they are.
+    """
+    def __init__(self, tokens, max_line_length, indent_unit, tab_width=4):
+        self.tokens = tokens
+        self.max_line_length = max_line_length
+        self.indent_unit = indent_unit
+        self.tab_width = tab_width
+        # Token index -> depth of the break point before that token
+        self.breaks = {}
+
+    def add_break(self, token, depth):
+        self.breaks[token.tokenIndex] = depth
+
+    def _width(self, text):
+        """Columns text takes on a line."""
+        if "\t" in text:
+            return len(text) + text.count("\t") * (self.tab_width - 1)
+        return len(text)
+
+    def _measure(self, parts, owners):
+        """Width from every break point to the next one at the same or a lower depth, or the end of its line."""
+        widths = {}
+        # (part index, depth, position) of the breaks still being measured, by increasing depth
+        open_breaks = []
+        position = 0
+        for index, text in enumerate(parts):
+            depth = self.breaks.get(owners[index])
+            if depth is not None:
+                while open_breaks and open_breaks[-1][1] >= depth:
+                    start, _, start_position = open_breaks.pop()
+                    widths[start] = position - start_position
+                open_breaks.append((index, depth, position))
+            newline = text.find("\n")
+            if newline != -1:
+                line_end = position + self._width(text[:newline])
+                for start, _, start_position in open_breaks:
+                    widths[start] = line_end - start_position
+                open_breaks.clear()
+            position += self._width(text)
+        for start, _, start_position in open_breaks:
+            widths[start] = position - start_position
+        return widths
+
+    def wrap(self, parts, owners):
+        if self.max_line_length == -1 or not parts:
+            return "".join(parts)
+        widths = self._measure(parts, owners)
+        tokens = self.tokens.tokens
+        output = []
+        column = 0
+        line_indent = ""
+        indent_width = 0
+        # (depth, indentation) of the breaks taken on the current line, outermost first
+        taken = []
+        # Spaces after the last text on the line, dropped when the line breaks right after them
+        blank = ""
+        for index, text in enumerate(parts):
+            width = widths.get(index)
+            if width is not None:
+                depth = self.breaks[owners[index]]
+                # Groups deeper than this break have ended
+                while taken and taken[-1][0] > depth:
+                    taken.pop()
+                if column > indent_width and column + len(blank) + width > self.max_line_length:
+                    enclosing = [indent for break_depth, indent in taken if break_depth < depth]
+                    indent = (enclosing[-1] if enclosing else line_indent) + self.indent_unit * CONTINUATION_LEVELS
+                    if self._width(indent) < column:
+                        self._strip_line_end(output)
+                        output.append("\n" + indent)
+                        column = self._width(indent)
+                        blank = ""
+                        if taken and taken[-1][0] == depth:
+                            taken.pop()
+                        taken.append((depth, indent))
+
+            owner = owners[index]
+            newline = text.rfind("\n")
+            if newline != -1:
+                output.append(blank + text)
+                blank = ""
+                taken.clear()
+                rest = text[newline + 1:]
+                column = self._width(rest)
+                # Lines broken by the visitor's alignment continue the indentation of the line they break
+                if owner is not None:
+                    line_indent = rest[:len(rest) - len(rest.lstrip(" \t"))]
+                    indent_width = self._width(line_indent)
+                continue
+            if not text.strip(" \t"):
+                if column == indent_width:
+                    # Indentation, not space between texts
+                    output.append(text)
+                    column += self._width(text)
+                    line_indent += text
+                    indent_width = column
+                else:
+                    blank += text
+                continue
+
+            if owner is not None and tokens[owner].type == JavaParser.STRING_LITERAL \
+                    and column + len(blank) + len(text) > self.max_line_length and self._can_split(owner):
+                indent = line_indent + self.indent_unit * CONTINUATION_LEVELS
+                text = self._split_string(text, column + len(blank), indent)
+                output.append(blank + text)
+                blank = ""
+                column = self._width(text[text.rfind("\n") + 1:]) if "\n" in text else column + len(text)
+                continue
+            output.append(blank + text)
+            column += len(blank) + self._width(text)
+            blank = ""
+        output.append(blank)
+        return "".join(output)
+
+    @staticmethod
+    def _strip_line_end(output):
+        """Drops the spaces and tabs at the end of the line a break ends."""
+        while output:
+            stripped = output[-1].rstrip(" \t")
+            if stripped:
+                output[-1] = stripped
+                return
+            output.pop()
+
+    def _can_split(self, index):
+        """Whether the string literal at index can become a concatenation without changing what it means."""
+        tokens = self.tokens.tokens
+        for following in range(index + 1, len(tokens)):
+            if tokens[following].channel == Token.DEFAULT_CHANNEL:
+                # "a b".length() would only call length() on the last part
+                return tokens[following].type != JavaParser.DOT
+        return True
+
+    def _split_string(self, literal, column, indent):
+        """Splits literal at spaces into parts that fit the line, joined by '+' on continuation lines."""
+        words = literal[1:-1].split(" ")
+        chunks = []
+        current = ""
+        available = self.max_line_length - column - 2
+        for position, word in enumerate(words):
+            # The spaces stay at the end of their chunk, so the string stays the same
+            piece = word if position == len(words) - 1 else word + " "
+            if current and len(current) + len(piece) > available:
+                chunks.append(current)
+                current = ""
+                available = self.max_line_length - self._width(indent) - 4
+            current += piece
+        chunks.append(current)
+        return '"' + f'"\n{indent}+ "'.join(chunks) + '"'
@@ -0,0 +1,96 @@
+import re
+from functools import lru_cache
+from CodeStyle.StandardNamingConventions import StandardNamingConventions
+
+STANDARD_PATTERNS = {
+    StandardNamingConventions.PASCAL_CASE.value: r"[A-Z][a-zA-Z0-9]*",
+    StandardNamingConventions.CAMEL_CASE.value: r"[a-z][a-zA-Z0-9]*",
+    StandardNamingConventions.UPPER_CASE.value: r"[A-Z][A-Z0-9_]*"
+}
+
+# How each kind of identifier is named in diagnostic messages
+KIND_LABELS = {
+    "class": "Class",
+    "method": "Method",
+    "field": "Field",
+    "local_variable": "Local variable",
+    "parameter": "Parameter",
+}
+
+
+@lru_cache(maxsize=256)
+def compile_convention(convention):
+    """Compiles a naming convention, either a standard one or a custom regex that has to match whole names."""
+    return re.compile(STANDARD_PATTERNS.get(convention, convention))
+
+
+class NamingDiagnostic:
+    def __init__(self, line, column, kind, name, rule, convention):
+        self.line = line
+        self.column = column
+        # What the identifier names, a key of KIND_LABELS
+        self.kind = kind
+        self.name = name
+        # The namingConventions entry it was checked against, and its value
+        self.rule = rule
+        self.convention = convention
+
+    def message(self):
+        """The diagnostic in the 'Line X, Column Y:...' form clients parse."""
+        return (f"Line {self.line}, Column {self.column}:{KIND_LABELS[self.kind]} "
+                f"'{self.name}' does not match the naming convention '{self.convention}'")
+
+    def to_dict(self):
+        return {
+            "line": self.line,
+            "column": self.column,
+            "kind": self.kind,
+            "name": self.name,
+            "rule": self.rule,
+            "convention": self.convention,
+        }
+
+
+class NamingRules:
+    """
+    The naming conventions of a config, each compiled once, on first use.
+
+    A custom regex that does not compile only fails when a name is checked
+    against it, as before.
+    """
+    def __init__(self, naming_conventions):
+        self.conventions = dict(naming_conventions)
+        self._matchers = {}
+
+    def precompile(self):
+        """Compiles every convention now, leaving those that do not compile to fail when used."""
+        for rule in self.conventions:
+            try:
+                self.matcher(rule)
+            except (re.error, TypeError):
+                pass
+
+    def matcher(self, rule):
+        """The fullmatch function of the convention for rule."""
+        matcher = self._matchers.get(rule)
+        if matcher is None:
+            matcher = self._matchers[rule] = compile_convention(self.conventions[rule]).fullmatch
+        return matcher
+
+    def check(self, kind, rule, token, name):
+        """Returns the NamingDiagnostic for name at token, or None when it follows the convention for rule."""
+        if self.matcher(rule)(name):
+            return None
+        return NamingDiagnostic(token.line, token.column, kind, name, rule, self.conventions[rule])
+
+    def check_all(self, candidates):
+        """Checks (kind, rule, token, name) candidates in order, returning the diagnostics of those that fail."""
+        diagnostics = []
+        matchers = {}
+        for kind, rule, token, name in candidates:
+            matcher = matchers.get(rule)
+            if matcher is None:
+                matcher = matchers[rule] = self.matcher(rule)
+            if not matcher(name):
+                diagnostics.append(NamingDiagnostic(token.line, token.column, kind, name, rule, self.conventions[rule]))
+        return diagnostics
@@ -0,0 +1,228 @@
+import logging
+import re
+from CodeStyle.RangeFormatter import scan_types, ERROR_POSITION_PATTERN
+import Metrics
+
+logger = logging.getLogger(__name__)
+
+STUB_NAME = "CodegatorParallelStub"
+# The stub's last class, which stands in for the class before the chunk
+LAST_STUB_NAME = STUB_NAME + "Last"
+# Stub classes have a member, so their closing brace gets a line of its own like in real classes
+STUB_CLASS = f"class {STUB_NAME} {{;}}"
+LINE_BREAK_SPACES_PATTERN = re.compile(r'\n[ \t]*')
+
+documents_total = Metrics.registry.counter(
+    "codegator_format_parallel_documents_total", "Large documents by how their top-level types were formatted", ("outcome",))
+
+
+def _stub(previous, padding):
+    """
+    A class that leaves the formatter where the document leaves it after the class
+    previous, once formatting starts at the indent level of the classes before it.
+    The visitors indent every class one level deeper than the classes before it,
+    and clean_code() indents a comment by the braces since the comment before it,
+    so the stub class has as many classes in it and the last comment as deep in braces.
+    """
+    declarations = []
+    # A class whose first member is an enum or interface trips up the formatter
+    members = [";"] + [STUB_CLASS] * (previous.classes - 1)
+    depth = previous.comment_depth
+    if depth is not None:
+        # Long enough that clean_code() never cuts whitespace before a later comment for being near the start
+        comment = "/*" + " " * padding + "*/"
+        if depth == 0:
+            declarations.append(comment)
+        elif depth == 1:
+            members.append(comment)
+        else:
+            members.append(f"enum {STUB_NAME} {{;" + "{" * (depth - 2) + comment + "}" * (depth - 2) + "}")
+    declarations.append(f"class {LAST_STUB_NAME} {{{''.join(members)}}}")
+    return "\n".join(declarations)
+
+
+def stub_size(previous):
+    """Rough length of the stub for the types before a chunk that starts after previous."""
+    return (previous.classes + 1) * (len(STUB_CLASS) + 1)
+
+
+def stub_tokens(previous):
+    """Rough number of tokens of the stub for the types before a chunk that starts after previous."""
+    # class, the name, '{', ';' and '}'
+    return (previous.classes + 1) * 5
+
+
+def _stub_end(formatted):
+    """Offset right after the closing brace of the stub's last declaration in formatted, or -1."""
+    start = formatted.find(LAST_STUB_NAME)
+    if start == -1:
+        return -1
+    depth = 0
+    for offset in range(formatted.find("{", start), len(formatted)):
+        if formatted[offset] == "{":
+            depth += 1
+        elif formatted[offset] == "}":
+            depth -= 1
+            if depth == 0:
+                return offset + 1
+    return -1
+
+
+def format_chunk(formatter, text, settings, stubbed, indent_level=0):
+    """
+    Formats one chunk of a ParallelFormatter plan with formatter, from indent_level on.
+
+    Returns (lead, formatted, errors): the formatted text after the stub, the text
+    before it on its first line, and the naming errors found in it as (line, column,
+    message) with the line relative to the first one and, on the first line, the
+    column relative to the end of lead. Returns None when the chunk cannot be
+    formatted, does not parse or its stub cannot be found.
+    """
+    try:
+        formatted, errors = formatter.start_formatting(text, settings, indent_level)
+    except Exception as e:
+        # Formatting the whole document reports the problem the usual way
+        logger.info(f"Could not format a chunk on its own: {e}")
+        return None
+    if formatter.input_syntax_errors:
+        return None
+    cut = _stub_end(formatted) if stubbed else 0
+    if cut == -1:
+        return None
+    cut_line = formatted.count("\n", 0, cut)
+    lead = formatted[formatted.rfind("\n", 0, cut) + 1:cut]
+
+    chunk_errors = []
+    for error in errors:
+        position = ERROR_POSITION_PATTERN.match(error)
+        if not position:
+            return None
+        line = int(position.group(1)) - 1 - cut_line
+        column = int(position.group(2))
+        if line == 0:
+            column -= len(lead)
+        # What is left are the stub's own errors
+        if line > 0 or (line == 0 and column >= 0):
+            chunk_errors.append((line, column, error[position.end():]))
+    return lead, formatted[cut:], chunk_errors
+
+
+def splittable(code):
+    """Whether code can be split into chunks at all."""
+    return "\r" not in code and STUB_NAME not in code
+
+
+def chunk_boundaries(types):
+    """The scan_types() types a chunk can end after."""
+    # The visitors leave other kinds of types as they are, on the line the type before them ends
+    return [previous for previous in types[:-1] if previous.kind == "class" and not previous.open_method]
+
+
+def chunk_texts(code, header_end, ends):
+    """
+    Yields (text, indent_level) for the chunks of code that end after the types ends,
+    and the last one, one at a time: the text to format and the level to format it
+    from. Every chunk after the first starts with code[:header_end], the package and
+    import declarations, and a stub for the types before it.
+    """
+    header = code[:header_end]
+    yield code[:ends[0].end] if ends else code, 0
+    for index, previous in enumerate(ends):
+        end = ends[index + 1].end if index + 1 < len(ends) else len(code)
+        text = code[previous.end:end]
+        padding = max((len(spaces) for spaces in LINE_BREAK_SPACES_PATTERN.findall(text)), default=0)
+        yield f"{header}\n\n{_stub(previous, padding)}{text}", previous.classes_before
+
+
+class ChunkStitcher:
+    """Puts format_chunk() results together in document order, one chunk at a time."""
+    def __init__(self):
+        # Lines of the document before the next chunk, and the text of the last of them
+        self.line = 0
+        self.last_line = ""
+
+    def add(self, result):
+        """
+        Returns (formatted, errors) for the next chunk: its part of the formatted
+        document and its naming errors at document positions, or None when it does
+        not continue the chunks before it the way the whole document would.
+        """
+        if result is None:
+            return None
+        lead, formatted, chunk_errors = result
+        # The chunk continues a line the same way only after the same text, unless it starts a new line
+        if lead != self.last_line and not formatted.startswith("\n"):
+            return None
+        errors = []
+        for relative, column, message in chunk_errors:
+            if relative == 0:
+                column += len(self.last_line)
+            errors.append(f"Line {self.line + relative + 1}, Column {column}:{message}")
+        newlines = formatted.count("\n")
+        self.line += newlines
+        self.last_line = formatted[formatted.rfind("\n") + 1:] if newlines else self.last_line + formatted
+        return formatted, errors
+
+
+class ParallelFormatter:
+    """
+    Splits large documents between their top-level type declarations, so that
+    pool workers can format a few types each, and stitches the results together.
+
+    Every chunk after the first starts with the package and import declarations,
+    for imports to be formatted the way they change the types after them, and a
+    stub standing in for the class before the chunk, and is formatted from the
+    indent level the classes before that one leave. The formatted chunk is
+    kept from the end of the stub on, so the import block comes from the first
+    chunk only. Chunks only end after classes the stub can stand in for, and the
+    result is the same as formatting the whole document, or complete() returns
+    None for the document to be formatted as a whole.
+    """
+    def __init__(self, min_size=65536):
+        # Documents shorter than this are formatted as a whole
+        self.min_size = min_size
+
+    def split(self, code, workers):
+        """
+        Returns (text, indent_level) for the chunks to format code in, as chunk_texts()
+        gives them, first one first, or None to format it as a whole.
+        """
+        if workers < 2 or len(code) < self.min_size or not splittable(code):
+            return None
+        types = scan_types(code)
+        if not types or len(types) < 2:
+            documents_total.inc(outcome="whole")
+            return None
+
+        target = len(code) / workers
+        ends = []
+        chunk_start = 0
+        for previous in chunk_boundaries(types):
+            if previous.end - chunk_start < target:
+                continue
+            ends.append(previous)
+            chunk_start = previous.end
+        if not ends:
+            documents_total.inc(outcome="whole")
+            return None
+        return list(chunk_texts(code, types[0].start, ends))
+
+    def complete(self, results):
+        """
+        Stitches the format_chunk() results of every chunk into the formatted document.
+
+        Returns (formatted_code, errors) like CodeStyleFormatter.start_formatting(),
+        or None when a chunk could not be formatted the way the whole document would be.
+        """
+        stitcher = ChunkStitcher()
+        parts = []
+        errors = []
+        for result in results:
+            part = stitcher.add(result)
+            if part is None:
+                documents_total.inc(outcome="fallback")
+                return None
+            parts.append(part[0])
+            errors.extend(part[1])
+        documents_total.inc(outcome="parallel")
+        return "".join(parts), errors
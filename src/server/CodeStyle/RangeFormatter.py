@@ -0,0 +1,310 @@
+import re
+from CodeStyle.ConfigClass import ConfigClass, compile_config
+
+# Everything the member scanner has to see or skip: text blocks, strings, chars, comments and braces
+SCAN_PATTERN = re.compile(r'"""[\s\S]*?"""|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*[\s\S]*?\*/|[{};]')
+SKIPPED_PATTERN = re.compile(r'"""[\s\S]*?"""|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*[\s\S]*?\*/')
+PARENTHESES_PATTERN = re.compile(r'\([^()]*\)')
+TYPE_KEYWORD_PATTERN = re.compile(r'(?<![\w@])(class|interface|enum|record)\b|@interface\b')
+ERROR_POSITION_PATTERN = re.compile(r'^Line (\d+), Column (\d+):')
+WHITESPACE_PATTERN = re.compile(r'\s*')
+TYPE_KINDS = ("class", "interface", "enum", "record", "annotation")
+# A class declaration, or with the dot a class literal
+CLASS_KEYWORD_PATTERN = re.compile(r'(\.\s*)?(?<![\w$])class(?![\w$])')
+BODILESS_MODIFIER_PATTERN = re.compile(r'(?<![\w$])(abstract|native)(?![\w$])')
+# What comes before the body of a method or constructor, or of an initializer
+METHOD_BODY_HEADER_PATTERN = re.compile(r'\)\s*(throws\s+[\w$.<>,\s]+)?$|^(static)?$')
+
+# A field rather than a comment: clean_code() indents a comment by the braces since the previous comment
+RANGE_START_MARKER = "int codegatorRangeStart;"
+RANGE_END_MARKER = "/*CODEGATOR_RANGE_END*/"
+
+
+class Member:
+    def __init__(self, code, start, end, depth, parent, formattable):
+        # start is right after the previous member, content_start at the member's first character
+        self.start = start
+        self.content_start = WHITESPACE_PATTERN.match(code, start).end()
+        self.end = end
+        self.depth = depth
+        self.parent = parent
+        # Only members of plain (possibly nested) classes can be formatted on their own
+        self.formattable = formattable
+
+
+def _body_kind(header):
+    """What the brace after header opens: a type body, a member body or part of an expression."""
+    header = SKIPPED_PATTERN.sub(" ", header)
+    while PARENTHESES_PATTERN.search(header):
+        header = PARENTHESES_PATTERN.sub("", header)
+    if "=" in header:
+        return "expression"
+    match = TYPE_KEYWORD_PATTERN.search(header)
+    if match:
+        return match.group(1) or "annotation"
+    return "member"
+
+
+def scan_members(code):
+    """
+    Finds the members of every class body in code without parsing it.
+
+    A member runs from the end of the previous one (or the opening brace) to its
+    ';' or closing brace. Returns them in order of their end.
+    """
+    members = []
+    # Each frame is [kind, member start, depth, formattable]; the file frame tracks top-level types
+    stack = [["file", 0, 0, True]]
+    for match in SCAN_PATTERN.finditer(code):
+        token = match.group(0)
+        if token not in "{};":
+            continue
+        frame = stack[-1]
+        if token == ";":
+            if frame[0] in TYPE_KINDS:
+                members.append(Member(code, frame[1], match.end(), frame[2], id(frame), frame[3]))
+            if frame[0] in TYPE_KINDS or frame[0] == "file":
+                frame[1] = match.end()
+        elif token == "{":
+            kind = _body_kind(code[frame[1]:match.start()]) if frame[0] in TYPE_KINDS or frame[0] == "file" else "block"
+            if kind in TYPE_KINDS:
+                stack.append([kind, match.end(), frame[2] + 1, frame[3] and kind == "class"])
+            else:
+                stack.append([kind, None, frame[2], frame[3]])
+        elif len(stack) > 1:
+            closed = stack.pop()
+            frame = stack[-1]
+            # A closed member body or nested type ends a member; a closed initializer
+            # expression (e.g. an anonymous class) still needs its ';'
+            if frame[0] in TYPE_KINDS and closed[0] != "expression":
+                members.append(Member(code, frame[1], match.end(), frame[2], id(frame), frame[3]))
+                frame[1] = match.end()
+            elif frame[0] == "file":
+                frame[1] = match.end()
+    return members
+
+
+class TopLevelType:
+    def __init__(self, kind, start, end, classes_before, classes, comment_depth, open_method):
+        self.kind = kind
+        # start is right after the previous top-level ';' or '}', end right after the closing brace
+        self.start = start
+        self.end = end
+        # Class declarations before the type and in it, itself included, counting nested and local ones
+        self.classes_before = classes_before
+        self.classes = classes
+        # Brace depth of the last comment before end, or None when there is none
+        self.comment_depth = comment_depth
+        # Whether a method without a body (abstract or native) may be the last method declared before end
+        self.open_method = open_method
+
+
+def scan_types(code):
+    """
+    Finds the top-level type declarations of code without parsing it, along with
+    what the formatting visitors carry over from one into the next.
+
+    Returns them in order, or None when braces at the top level open anything
+    other than a type, or do not balance.
+    """
+    types = []
+    classes = 0
+    comment_depth = None
+    open_method = False
+    # Each frame is [kind, member start, enum constants done, type start, classes before the type]
+    stack = [["file", 0, False, 0, 0]]
+    position = 0
+    for match in SCAN_PATTERN.finditer(code):
+        between = code[position:match.start()]
+        position = match.end()
+        classes += sum(1 for keyword in CLASS_KEYWORD_PATTERN.finditer(between) if not keyword.group(1))
+        if BODILESS_MODIFIER_PATTERN.search(between):
+            open_method = True
+        token = match.group(0)
+        if token not in "{};":
+            if token[:2] in ("//", "/*"):
+                comment_depth = len(stack) - 1
+            continue
+        frame = stack[-1]
+        if token == ";":
+            if frame[0] in TYPE_KINDS or frame[0] == "file":
+                frame[1] = match.end()
+                frame[2] = True
+        elif token == "{":
+            if frame[0] == "file":
+                kind = _body_kind(code[frame[1]:match.start()])
+                if kind not in TYPE_KINDS:
+                    return None
+                stack.append([kind, match.end(), False, frame[1], classes - (kind == "class")])
+            elif frame[0] in TYPE_KINDS:
+                header = code[frame[1]:match.start()]
+                kind = _body_kind(header)
+                if kind in TYPE_KINDS:
+                    stack.append([kind, match.end(), False, None, None])
+                    continue
+                # Method, constructor and initializer bodies are blocks, visited after every method before them.
+                # Enum constant bodies are class bodies, and annotation element defaults no blocks at all.
+                if kind == "member" and frame[0] != "annotation" and (frame[0] != "enum" or frame[2]) \
+                        and METHOD_BODY_HEADER_PATTERN.search(SKIPPED_PATTERN.sub(" ", header).strip()):
+                    open_method = False
+                stack.append([kind, None, False, None, None])
+            else:
+                stack.append(["block", None, False, None, None])
+        else:
+            if len(stack) == 1:
+                return None
+            closed = stack.pop()
+            frame = stack[-1]
+            if frame[0] == "file":
+                types.append(TopLevelType(closed[0], closed[3], match.end(), closed[4], classes - closed[4],
+                                          comment_depth, open_method))
+                frame[1] = match.end()
+            elif frame[0] in TYPE_KINDS and closed[0] != "expression":
+                frame[1] = match.end()
+    if len(stack) > 1:
+        return None
+    return types
+
+
+class RangeFormatter:
+    """
+    Formats only the class members that enclose a range of a document.
+
+    The members are formatted inside synthetic classes nested as deep as the
+    originals, so the regular pipeline gives them the indentation they have in
+    the document. Work grows with the members, not with the document. Ranges
+    that are not inside members of plain classes (imports, class headers, enums,
+    interfaces) fall back to formatting the whole document.
+    """
+    def __init__(self, formatter=None):
+        if formatter is None:
+            # Imported here so the member scanner can be used without loading the parser
+            from CodeStyle.CodeStyle import CodeStyleFormatter
+            formatter = CodeStyleFormatter()
+        self.formatter = formatter
+
+    @staticmethod
+    def _line_offsets(code):
+        offsets = [0]
+        for match in re.finditer("\n", code):
+            offsets.append(match.end())
+        return offsets
+
+    @staticmethod
+    def _offset(line_offsets, code, line, character):
+        if line >= len(line_offsets):
+            return len(code)
+        return min(line_offsets[line] + character, len(code))
+
+    @staticmethod
+    def _enclosing_members(code, start, end):
+        # A range touching a member's first or last character (e.g. right after a typed '}') belongs to it
+        overlapping = [member for member in scan_members(code)
+                       if member.end >= start and member.content_start <= end]
+        groups = {}
+        for member in overlapping:
+            groups.setdefault(member.parent, []).append(member)
+        # The deepest class body whose members cover the whole range wins
+        for group in sorted(groups.values(), key=lambda group: -group[0].depth):
+            group.sort(key=lambda member: member.start)
+            if group[0].start <= start and end <= group[-1].end:
+                return group if all(member.formattable for member in group) else None
+        return None
+
+    def _whole_document(self, code, configs):
+        formatted_code, errors = self.formatter.start_formatting(code, configs)
+        line_offsets = self._line_offsets(code)
+        edit = {
+            "range": {
+                "start": {"line": 0, "character": 0},
+                "end": {"line": len(line_offsets) - 1, "character": len(code) - line_offsets[-1]},
+            },
+            "new_text": formatted_code,
+        }
+        return ([edit] if formatted_code != code else []), errors
+
+    def format_members(self, text, depth, configs):
+        """
+        Formats text, whole members of a class body depth classes deep, on its own.
+
+        Returns the formatted members without surrounding blank lines, and their
+        naming errors as (0-based line in the formatted text, ", Column N:message")
+        pairs. Returns None when the members could not be told apart from the
+        synthetic classes around them in the output.
+        """
+        wrapper = "".join(f"class CodegatorRange{level} {{\n" for level in range(depth))
+        # Indented: a field right after an unindented '{' trips up the rewriter
+        fragment = f"{wrapper}    {RANGE_START_MARKER}\n{text}\n{RANGE_END_MARKER}\n" + "}\n" * depth
+        formatted, errors = self.formatter.start_formatting(fragment, configs)
+
+        start_marker = formatted.find(RANGE_START_MARKER)
+        end_marker = formatted.find(RANGE_END_MARKER)
+        if start_marker == -1 or end_marker == -1:
+            return None
+        body_start = formatted.find("\n", start_marker) + 1
+        body_end = formatted.rfind("\n", 0, end_marker)
+        lines = formatted[body_start:body_end].split("\n")
+        # Line numbers in the formatted fragment of the first line kept
+        first_kept = formatted.count("\n", 0, body_start) + 1
+        while lines and not lines[0].strip():
+            lines.pop(0)
+            first_kept += 1
+        while lines and not lines[-1].strip():
+            lines.pop()
+
+        member_errors = []
+        for error in errors:
+            position = ERROR_POSITION_PATTERN.match(error)
+            if not position:
+                continue
+            line = int(position.group(1)) - first_kept
+            if 0 <= line < len(lines):
+                member_errors.append((line, error[position.end(1):]))
+        return "\n".join(lines), member_errors
+
+    def format_range(self, code, start, end, settings=None):
+        """
+        Formats the members enclosing the (line, character) range start-end, 0-based.
+
+        Returns the edits as {"range": {"start", "end"}, "new_text"} dicts, and the
+        naming errors found in the formatted members, positioned as in the document
+        after the edits.
+        """
+        configs = settings if isinstance(settings, ConfigClass) else compile_config(settings) if settings else self.formatter.configs or ConfigClass(None)
+        code = code.replace("\r\n", "\n")
+        line_offsets = self._line_offsets(code)
+        start_offset = self._offset(line_offsets, code, *start)
+        end_offset = self._offset(line_offsets, code, *end)
+
+        members = self._enclosing_members(code, start_offset, end_offset)
+        if members is None:
+            return self._whole_document(code, configs)
+
+        # Members are replaced as whole lines, which must not hold anything else
+        region_start = members[0].content_start
+        region_end = members[-1].end
+        first_line = code.rfind("\n", 0, region_start) + 1
+        last_line_end = code.find("\n", region_end)
+        last_line_end = len(code) if last_line_end == -1 else last_line_end
+        if code[first_line:region_start].strip() or code[region_end:last_line_end].strip():
+            return self._whole_document(code, configs)
+
+        formatted = self.format_members(code[region_start:region_end], members[0].depth, configs)
+        if formatted is None:
+            return self._whole_document(code, configs)
+        new_text, errors = formatted
+
+        document_line = code.count("\n", 0, first_line)
+        region_errors = [f"Line {document_line + line + 1}{position}" for line, position in errors]
+
+        old_text = code[first_line:last_line_end]
+        if new_text == old_text:
+            return [], region_errors
+        edit = {
+            "range": {
+                "start": {"line": document_line, "character": 0},
+                "end": {"line": code.count("\n", 0, last_line_end), "character": last_line_end - code.rfind("\n", 0, last_line_end) - 1},
+            },
+            "new_text": new_text,
+        }
+        return [edit], region_errors
@@ -0,0 +1,173 @@
+import ctypes
+import os
+import re
+import threading
+from CodeStyle.RangeFormatter import scan_types, CLASS_KEYWORD_PATTERN
+from CodeStyle.ParallelFormatter import splittable, chunk_boundaries, chunk_texts, stub_size, stub_tokens
+
+# Roughly the tokens of Java code: strings, comments, words and numbers, and single other characters
+TOKEN_PATTERN = re.compile(r'"""[\s\S]*?"""|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*[\s\S]*?\*/|\w+|[^\w\s]')
+# Peak memory formatting takes per token, its parse tree and token streams included, per character,
+# which long comments and strings add, and per character of indentation it adds. Measured at up to
+# 1500 to 2000 bytes per token and 40 bytes per character, from dense expressions to mostly comments,
+# and 30 bytes per character of indentation, see benchmarks/stream_format.py, and kept above that so
+# that estimates err on the large side
+BYTES_PER_TOKEN = 2200
+BYTES_PER_CHARACTER = 80
+BYTES_PER_INDENT_CHARACTER = 40
+# How often run_within_memory() looks at the memory of the process, in seconds
+MEMORY_POLL_INTERVAL = 0.005
+
+
+class MemoryLimitExceeded(Exception):
+    def __init__(self, part, needed, memory_limit):
+        super().__init__(f"Formatting {part} takes about {needed / 1048576:.1f} MiB, "
+                         f"over the memory limit of {memory_limit / 1048576:.1f} MiB")
+        self.part = part
+        self.needed = needed
+        self.memory_limit = memory_limit
+
+    def __reduce__(self):
+        # Process workers send it back pickled, which would otherwise call __init__ with the message alone
+        return MemoryLimitExceeded, (self.part, self.needed, self.memory_limit)
+
+
+class _MemoryLimitReached(BaseException):
+    # Raised in the formatting thread from outside it, so nothing that catches Exception on the way stops it
+    pass
+
+
+def resident_memory():
+    """Bytes of memory this process has resident, or None where /proc cannot tell."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def run_within_memory(memory_limit, part, function, *args):
+    """
+    Returns function(*args), unless the resident memory of the process grows by more
+    than memory_limit bytes while it runs: a watcher thread then interrupts it, and
+    MemoryLimitExceeded for part is raised instead. Process workers run one job at
+    a time, so that is the memory of the job; with thread workers the jobs running
+    alongside count too. Where resident_memory() cannot tell, function just runs.
+    """
+    start = resident_memory()
+    if start is None:
+        return function(*args)
+    thread_id = threading.get_ident()
+    lock = threading.Lock()
+    done = threading.Event()
+    state = {"interrupted": False, "grown": 0}
+
+    def watch():
+        while not done.wait(MEMORY_POLL_INTERVAL):
+            grown = resident_memory() - start
+            state["grown"] = max(state["grown"], grown)
+            if grown > memory_limit:
+                with lock:
+                    if not done.is_set():
+                        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id),
+                                                                   ctypes.py_object(_MemoryLimitReached))
+                        state["interrupted"] = True
+                return
+
+    watcher = threading.Thread(target=watch, name="memory-watch", daemon=True)
+    try:
+        watcher.start()
+        try:
+            return function(*args)
+        finally:
+            with lock:
+                done.set()
+            if state["interrupted"]:
+                # Takes back the interruption if function finished before it was raised
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+            watcher.join()
+    except _MemoryLimitReached:
+        raise MemoryLimitExceeded(part, state["grown"], memory_limit) from None
+
+
+class StreamFormatter:
+    """
+    Plans formatting documents a few top-level classes at a time, for their parts
+    to be formatted and sent one after the other, so that only one part's token
+    streams and parse trees are in memory at once.
+
+    Parts are ParallelFormatter chunks, each as large as the memory limit allows
+    by estimate(). Every class indents the code after it one level deeper, so
+    later chunks take more memory for as much code. Each chunk also formats the
+    package and import declarations and a stub again, which makes streaming a
+    little slower than formatting the document whole, so documents whose estimate
+    fits the limit are formatted whole. The estimate only plans the chunks: each
+    one is formatted within run_within_memory(), which stops it once it takes more.
+    """
+    def __init__(self, memory_limit):
+        # Bytes formatting one chunk may take
+        self.memory_limit = memory_limit
+
+    @staticmethod
+    def estimate(size, tokens, lines, depth, configs):
+        """
+        Rough peak memory formatting size characters of code of tokens tokens on lines
+        lines, at most depth levels deep, takes. Errs on the large side.
+        """
+        return (BYTES_PER_TOKEN * tokens + BYTES_PER_CHARACTER * size
+                + BYTES_PER_INDENT_CHARACTER * lines * depth * len(configs.indent_unit))
+
+    def chunks(self, code, configs):
+        """
+        Returns (text, indent_level) for the chunks to format code in with configs,
+        as a chunk_texts() generator that builds each one when it is needed, or None when code fits in a single
+        chunk and is best formatted as a whole. Raises MemoryLimitExceeded when code
+        cannot be split into chunks that fit.
+        """
+        types = scan_types(code) if splittable(code) else None
+        if types:
+            total_depth = types[-1].classes_before + types[-1].classes
+        else:
+            total_depth = sum(1 for keyword in CLASS_KEYWORD_PATTERN.finditer(code) if not keyword.group(1))
+        needed = self.estimate(len(code), len(TOKEN_PATTERN.findall(code)), code.count("\n"), total_depth, configs)
+        if needed <= self.memory_limit:
+            return None
+        if not types:
+            raise MemoryLimitExceeded("the document, which cannot be split between its top-level classes",
+                                      needed, self.memory_limit)
+
+        header_end = types[0].start
+        header_lines = code.count("\n", 0, header_end)
+        header_tokens = len(TOKEN_PATTERN.findall(code, 0, header_end))
+        ends = []
+        # Where the current chunk starts in code, on which line and after how many tokens, and what its
+        # header and stub add
+        chunk_start = chunk_line = chunk_token = 0
+        overhead = overhead_lines = overhead_tokens = 0
+        line = token = position = 0
+        candidate = candidate_line = candidate_token = None
+        for previous in chunk_boundaries(types) + [None]:
+            end = previous.end if previous is not None else len(code)
+            line += code.count("\n", position, end)
+            token += len(TOKEN_PATTERN.findall(code, position, end))
+            position = end
+            depth = previous.classes_before + previous.classes if previous is not None else total_depth
+            needed = self.estimate(end - chunk_start + overhead, token - chunk_token + overhead_tokens,
+                                   line - chunk_line + overhead_lines, depth, configs)
+            if needed > self.memory_limit and candidate is not None:
+                ends.append(candidate)
+                chunk_start = candidate.end
+                chunk_line = candidate_line
+                chunk_token = candidate_token
+                overhead = header_end + stub_size(candidate)
+                overhead_tokens = header_tokens + stub_tokens(candidate)
+                # Every stub class ends up on a line of its own
+                overhead_lines = header_lines + candidate.classes + 2
+                needed = self.estimate(end - chunk_start + overhead, token - chunk_token + overhead_tokens,
+                                       line - chunk_line + overhead_lines, depth, configs)
+            if needed > self.memory_limit:
+                raise MemoryLimitExceeded("a top-level class", needed, self.memory_limit)
+            candidate = previous
+            candidate_line = line
+            candidate_token = token
+        return chunk_texts(code, header_end, ends)
@@ -0,0 +1,87 @@
+import re
+
+# Most of the changed line StyleCheck quotes, from the first changed character on
+EXCERPT_LENGTH = 40
+# Formatting its own output again only adds spaces at the end of some lines, so those never count
+TRAILING_WHITESPACE_PATTERN = re.compile(r'[ \t]+(?=\n|$)')
+
+
+def first_difference(a, b):
+    """Offset of the first character where a and b differ, or None when they are the same."""
+    if a == b:
+        return None
+    # Comparing halves of what is left runs in C, instead of a loop over every character
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def changes_within(code, settled_code):
+    """
+    Whether code differs from settled_code, whole lines at the start of what formatting
+    makes of it, in those lines, apart from whitespace at the end of lines.
+    """
+    end = 0
+    for _ in range(settled_code.count("\n")):
+        end = code.find("\n", end) + 1
+        if not end:
+            return True
+    if not settled_code.endswith("\n"):
+        # All of the formatted code, so all of code
+        end = len(code)
+    return TRAILING_WHITESPACE_PATTERN.sub("", code[:end]) != TRAILING_WHITESPACE_PATTERN.sub("", settled_code)
+
+
+def _excerpt(code, offset):
+    end = code.find("\n", offset)
+    return code[offset:len(code) if end == -1 else end][:EXCERPT_LENGTH]
+
+
+class StyleCheck:
+    """
+    Whether code already matches the style: where formatting it would first change it,
+    and its naming errors. Whitespace at the end of lines is not compared, so the output
+    of formatting conforms although formatting it again puts spaces after some lines.
+    """
+    def __init__(self, code, formatted_code, errors, final=True):
+        # None when formatted_code is only what formatting makes of the lines up to the first difference
+        self.formatted_code = formatted_code if final else None
+        # Only the ends of lines are stripped, so lines and columns stay those of code
+        code = TRAILING_WHITESPACE_PATTERN.sub("", code)
+        formatted_code = TRAILING_WHITESPACE_PATTERN.sub("", formatted_code)
+        offset = first_difference(code, formatted_code)
+        self.conforming = offset is None
+        # Line and column of the first character formatting changes, like those of naming diagnostics
+        self.line = self.column = None
+        # What is there from that character to the end of its line, and what formatting puts there instead
+        self.found = self.expected = None
+        if offset is not None:
+            line_start = code.rfind("\n", 0, offset) + 1
+            self.line = code.count("\n", 0, line_start) + 1
+            self.column = offset - line_start
+            self.found = _excerpt(code, offset)
+            self.expected = _excerpt(formatted_code, offset)
+        # Naming errors like those of CodeStyleFormatter.start_formatting(), at positions in code
+        self.errors = errors
+
+    def message(self):
+        """The first change in the 'Line X, Column Y:...' form clients parse, or None when code conforms."""
+        if self.conforming:
+            return None
+        return f"Line {self.line}, Column {self.column}:Formatting changes '{self.found}' to '{self.expected}'"
+
+    def to_dict(self):
+        return {
+            "conforming": self.conforming,
+            "line": self.line,
+            "column": self.column,
+            "found": self.found,
+            "expected": self.expected,
+            "message": self.message(),
+            "errors": self.errors,
+        }
@@ -0,0 +1,73 @@
+from CodeStyle.JavaParser import JavaParser
+
+
+class TokenPositions:
+    """
+    Position index over a token stream, built once on first use, so the visitors'
+    alignment lookups take constant time instead of walking back token by token.
+
+    For every token it keeps the width of the text before it, the token its line
+    starts at (the first token after one on an earlier line) and the first token
+    after the last whitespace before it. Widths count whole token texts, like the
+    walks they replace. Where a walk would run past the first token and wrap
+    around the stream, the walk is done instead, so the results stay the same.
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self._offsets = None
+        self._line_starts = None
+        self._word_starts = None
+
+    def _build(self):
+        tokens = self.tokens.tokens
+        offsets = [0]
+        line_starts = []
+        word_starts = []
+        line_start = 0
+        word_start = 0
+        previous_line = None
+        for index, token in enumerate(tokens):
+            offsets.append(offsets[-1] + len(token.text))
+            if token.line != previous_line:
+                line_start = index
+                previous_line = token.line
+            line_starts.append(line_start)
+            # A whitespace token ends the walk before adding anything
+            if token.type == JavaParser.WS:
+                word_start = index + 1
+            word_starts.append(word_start)
+        self._offsets = offsets
+        self._line_starts = line_starts
+        self._word_starts = word_starts
+
+    def line_start(self, index):
+        """Index of the first token on the line of the token at index."""
+        if self._offsets is None:
+            self._build()
+        return self._line_starts[index]
+
+    def line_width(self, index):
+        """Width of the tokens from the start of its line through the token at index."""
+        if self._offsets is None:
+            self._build()
+        start = self._line_starts[index]
+        tokens = self.tokens.tokens
+        if start == 0 and tokens[-1].line == tokens[index].line:
+            return self._walk(index, lambda token: token.line == tokens[index].line)
+        return self._offsets[index + 1] - self._offsets[start]
+
+    def width_since_whitespace(self, index):
+        """Width of the tokens after the last whitespace token through the token at index."""
+        if self._offsets is None:
+            self._build()
+        start = self._word_starts[index]
+        if start == 0:
+            return self._walk(index, lambda token: token.type != JavaParser.WS)
+        return self._offsets[index + 1] - self._offsets[start]
+
+    def _walk(self, index, same_run):
+        width = 0
+        while same_run(self.tokens.get(index)):
+            width += len(self.tokens.get(index).text)
+            index -= 1
+        return width
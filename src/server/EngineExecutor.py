@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from Metrics import capture_metrics, merge_metrics, executor_wait_seconds
+
+
+def _timed_call(func, args, kwargs, capture):
+    # Runs inside the worker (thread or process) and reports when the job actually started.
+    # Process workers also send back the stage timings and counts they recorded.
+    started_at = time.time()
+    if not capture:
+        return started_at, func(*args, **kwargs), None
+    with capture_metrics() as captured:
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            # What a failing job parsed before it failed still counts, and pickles along with the exception
+            e.captured_metrics = captured
+            raise
+    return started_at, result, captured
+
+
+class EngineExecutor:
+    """
+    Bounded executor dedicated to a single engine.
+
+    Every engine (format, refine, autocomplete, ...) gets its own pool so that a
+    slow job in one of them never delays the others, and so the event loop is
+    never blocked by engine work. Queue depth and wait time are tracked for
+    every submitted job.
+
+    With processes=True the pool is a ProcessPoolExecutor, which is what CPU-bound
+    pure-Python engines need to scale past the GIL. Jobs and their arguments must
+    then be picklable, and initializer runs once in every worker process.
+    """
+    def __init__(self, name, max_workers, processes=False, initializer=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.processes = processes
+        if processes:
+            # spawn keeps workers independent of the server's threads and event loop
+            self.executor = ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=initializer)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                               thread_name_prefix=f"{name}-engine",
+                                               initializer=initializer)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.last_wait_time = 0.0
+
+    def submit(self, func, *args, **kwargs):
+        """Submits func(*args, **kwargs) to the pool and returns an awaitable asyncio future."""
+        submitted_at = time.time()
+        with self._lock:
+            self.in_flight += 1
+        future = self.executor.submit(_timed_call, func, args, kwargs, self.processes)
+        future.add_done_callback(lambda done: self._on_done(done, submitted_at))
+        return asyncio.wrap_future(future)
+
+    async def run(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) on this engine's pool without blocking the event loop."""
+        _, result, _ = await self.submit(func, *args, **kwargs)
+        return result
+
+    def _on_done(self, future, submitted_at):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled():
+                # Cancelled while still queued, the job never ran
+                return
+            self.completed += 1
+            exception = future.exception()
+            if exception is not None:
+                self.failed += 1
+                captured = getattr(exception, "captured_metrics", None)
+                if captured:
+                    merge_metrics(captured)
+                return
+            started_at, _, captured = future.result()
+            if captured:
+                merge_metrics(captured)
+            wait_time = max(0.0, started_at - submitted_at)
+            self.started += 1
+            self.total_wait_time += wait_time
+            self.last_wait_time = wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+        executor_wait_seconds.observe(wait_time, engine=self.name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "process" if self.processes else "thread",
+                "max_workers": self.max_workers,
+                "queue_depth": max(0, self.in_flight - self.max_workers),
+                "running": min(self.in_flight, self.max_workers),
+                "completed": self.completed,
+                "failed": self.failed,
+                "last_wait_seconds": self.last_wait_time,
+                "max_wait_seconds": self.max_wait_time,
+                "average_wait_seconds": self.total_wait_time / self.started if self.started else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def workers_from_env(name, default):
+    """Reads the pool size for an engine from CODEGATOR_<NAME>_WORKERS."""
+    value = os.environ.get(f"CODEGATOR_{name.upper()}_WORKERS")
+    if not value:
+        return default
+    return max(1, int(value))
@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    # Increments in pool worker processes are sent back to the server process, see capture_metrics()
+    captured = True
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self.captured:
+            captured = getattr(_capture, "counts", None)
+            if captured is not None:
+                captured.append((self.name, self.documentation, self.labelnames, key, amount))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    # What a worker process measures of itself means nothing to the server process
+    captured = False
+
+    def set(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, data):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {data[-1]}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(data[-2])}")
+                lines.append(f"{self.name}_count{labels} {data[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them in the Prometheus text format."""
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        # Counts sent back by worker processes register their counter before its module may be imported here
+        with self._lock:
+            existing = self.get(name)
+            if existing is not None:
+                return existing
+            return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def get(self, name):
+        """The metric registered under name, or None."""
+        for metric in self._metrics:
+            if metric.name == name:
+                return metric
+        return None
+
+    def add_collector(self, collector):
+        """collector() is called on every render and returns extra metrics to render."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "codegator_stage_duration_seconds",
+    "Time spent in each stage of an engine",
+    ("engine", "stage")
+)
+
+executor_wait_seconds = registry.histogram(
+    "codegator_executor_wait_seconds",
+    "Time jobs spend queued before an engine worker picks them up",
+    ("engine",)
+)
+
+_capture = threading.local()
+
+
+@contextmanager
+def timed_stage(engine, stage):
+    """Times the enclosed block as one stage of an engine."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(engine, stage, time.perf_counter() - start)
+
+
+def record_stage(engine, stage, seconds):
+    stage_seconds.observe(seconds, engine=engine, stage=stage)
+    captured = getattr(_capture, "stages", None)
+    if captured is not None:
+        captured.append((engine, stage, seconds))
+
+
+@contextmanager
+def capture_metrics():
+    """
+    Collects the stages timed and the counters incremented by this thread inside
+    the block, as a (stages, counts) pair of lists.
+
+    Used by pool worker processes, whose own registry is never scraped, to send
+    their timings and counts back to the server process.
+    """
+    previous = getattr(_capture, "stages", None), getattr(_capture, "counts", None)
+    _capture.stages = []
+    _capture.counts = []
+    try:
+        yield _capture.stages, _capture.counts
+    finally:
+        _capture.stages, _capture.counts = previous
+
+
+def merge_metrics(captured):
+    """Adds what capture_metrics() collected in a worker process to this process' metrics."""
+    stages, counts = captured
+    for engine, stage, seconds in stages:
+        stage_seconds.observe(seconds, engine=engine, stage=stage)
+    for name, documentation, labelnames, key, amount in counts:
+        # The server process may never import the module of a counter only workers increment
+        counter = registry.counter(name, documentation, labelnames)
+        counter.inc(amount, **dict(zip(counter.labelnames, key)))
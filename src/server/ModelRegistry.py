@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelDisabledError(Exception):
+    pass
+
+
+class ModelRegistry:
+    """
+    Loads each model engine on first use instead of at import or startup.
+
+    Engines are registered with a factory that does its own (heavy) imports, so
+    nothing touches torch or transformers until a feature is actually used.
+    A feature is disabled with CODEGATOR_ENABLE_<NAME>=0, and
+    CODEGATOR_PRELOAD_MODELS (comma separated names, or 'all') loads engines
+    at startup instead.
+    """
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._enabled = {}
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+        self._enabled[name] = os.environ.get(f"CODEGATOR_ENABLE_{name.upper()}", "1").lower() not in ("0", "false", "no")
+
+    def is_enabled(self, name):
+        return self._enabled.get(name, False)
+
+    def is_loaded(self, name):
+        return name in self._instances
+
+    def get(self, name):
+        """Returns the engine, loading it if needed. Blocks while another thread loads it."""
+        if not self.is_enabled(name):
+            raise ModelDisabledError(f"Feature '{name}' is disabled on this server")
+
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                logger.info(f"Loaded model '{name}' in {time.perf_counter() - start:.2f}s")
+            return self._instances[name]
+
+    def preload(self):
+        value = os.environ.get("CODEGATOR_PRELOAD_MODELS", "")
+        names = self._factories.keys() if value.strip() == "all" else [name.strip() for name in value.split(",") if name.strip()]
+        for name in names:
+            if self.is_enabled(name):
+                self.get(name)
+
+    def status(self):
+        return {name: {"enabled": self.is_enabled(name), "loaded": self.is_loaded(name)} for name in self._factories}
+
+
+def load_autocomplete():
+    from AutoComplete.AutoComplete import AutoComplete
+    return AutoComplete()
+
+
+def load_smells():
+    from CodeSmell.CodeSmell import CodeSmellAnalyzer
+    return CodeSmellAnalyzer()
+
+
+def load_refinement():
+    from CodeRefinement.CodeRefinement import CodeRefiner
+    return CodeRefiner()
+
+
+models = ModelRegistry()
+models.register("autocomplete", load_autocomplete)
+models.register("smells", load_smells)
+models.register("refinement", load_refinement)
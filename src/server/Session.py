@@ -0,0 +1,115 @@
+import asyncio
+import json
+import logging
+import threading
+from Cancellation import CancellationToken
+from Admission import Overloaded
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisSession:
+    """
+    One websocket carrying many concurrent jobs, each tagged by the client's job id.
+
+    Progress reported from engine threads is coalesced: only the latest value per
+    job (and per file for workspace jobs) is kept and sent every flush_interval
+    seconds, along with queued partial results. Results, errors and cancellations
+    are sent right away, after anything still pending for that job.
+    """
+    def __init__(self, websocket, flush_interval=0.1):
+        self.websocket = websocket
+        self.flush_interval = flush_interval
+        self.jobs: dict[str, tuple[asyncio.Task, CancellationToken]] = {}
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._send_lock = asyncio.Lock()
+        self._flusher = None
+
+    def start(self):
+        self._flusher = asyncio.create_task(self._run_flusher())
+
+    def report_progress(self, job_id, percentage, path=None):
+        """Thread-safe, called by engines. Replaces any progress not sent yet for the same job and path."""
+        message = {"type": "progress", "job_id": job_id, "percentage": percentage}
+        if path is not None:
+            message["type"] = "file_progress"
+            message["path"] = path
+        with self._pending_lock:
+            self._pending[(job_id, path)] = message
+
+    def report_partial(self, job_id, path, result):
+        """Thread-safe, called by engines. Queues a partial result, sent with the next flush."""
+        with self._pending_lock:
+            self._pending[(job_id, path, "partial")] = {"type": "partial", "job_id": job_id, "path": path, "result": result}
+
+    async def send(self, message):
+        job_id = message.get("job_id")
+        if job_id is not None:
+            await self.flush(job_id)
+        await self._send(message)
+
+    async def _send(self, message):
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(json.dumps(message))
+            except Exception as e:
+                logger.error(f"Error sending session message: {e}")
+
+    async def flush(self, job_id=None):
+        with self._pending_lock:
+            if job_id is None:
+                messages = list(self._pending.values())
+                self._pending.clear()
+            else:
+                keys = [key for key in self._pending if key[0] == job_id]
+                messages = [self._pending.pop(key) for key in keys]
+        for message in messages:
+            await self._send(message)
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start_job(self, job_id, run):
+        """Starts run(cancel_token) as the job job_id and sends its result or error when done."""
+        if job_id in self.jobs:
+            raise ValueError(f"Job '{job_id}' is already running")
+        cancel_token = CancellationToken()
+        task = asyncio.create_task(self._run_job(job_id, run, cancel_token))
+        self.jobs[job_id] = (task, cancel_token)
+
+    async def _run_job(self, job_id, run, cancel_token):
+        try:
+            result = await run(cancel_token)
+            if cancel_token.cancelled:
+                await self.send({"type": "cancelled", "job_id": job_id})
+            else:
+                await self.send({"type": "result", "job_id": job_id, "result": result})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if cancel_token.cancelled:
+                await self.send({"type": "cancelled", "job_id": job_id})
+            elif isinstance(e, Overloaded):
+                await self.send({"type": "error", "job_id": job_id, "detail": str(e), "retry_after": e.retry_after})
+            else:
+                logger.error(f"Session job {job_id} failed: {e}")
+                await self.send({"type": "error", "job_id": job_id, "detail": str(e)})
+        finally:
+            self.jobs.pop(job_id, None)
+
+    def cancel_job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job:
+            job[1].cancel()
+        return job is not None
+
+    def close(self):
+        for task, cancel_token in self.jobs.values():
+            cancel_token.cancel()
+            task.cancel()
+        self.jobs.clear()
+        if self._flusher:
+            self._flusher.cancel()
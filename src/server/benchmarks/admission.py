@@ -0,0 +1,77 @@
+"""
+Check for AdmissionController: bulk work never takes the slot autocomplete and
+format are left with.
+
+Fills every slot bulk work may have with analyze and refine requests, then
+checks that one more refine and one more batch format wait while an
+autocomplete and a format start right away, and that the waiting requests
+start once the bulk work is done. Exits with status 1 when a request starts
+or waits when it should not. Run from src/server:
+
+    python benchmarks/admission.py [slots]
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Admission import AdmissionController
+
+
+async def hold(admission, endpoint, started, release):
+    async with admission.admit(endpoint):
+        started.add(endpoint)
+        await release.wait()
+
+
+async def check(slots):
+    admission = AdmissionController(slots)
+    bulk_release = asyncio.Event()
+    release = asyncio.Event()
+    started = set()
+    tasks = []
+
+    # analyze and refine between them fill every slot but the reserved one
+    for index in range(slots - 1):
+        endpoint = "analyze" if index % 2 == 0 else "refine"
+        tasks.append(asyncio.create_task(hold(admission, endpoint, set(), bulk_release)))
+    await asyncio.sleep(0)
+    filled = admission.in_use == slots - 1
+
+    for endpoint in ("refine", "format_batch", "autocomplete"):
+        tasks.append(asyncio.create_task(hold(admission, endpoint, started, release)))
+    await asyncio.sleep(0)
+    correct = filled and started == {"autocomplete"}
+    print(f"{slots} slots, {slots - 1} held by analyze and refine: started {sorted(started)}, "
+          f"waiting {sorted(waiter[2] for waiter in admission.waiting)}")
+
+    bulk_release.set()
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), 5)
+    correct = correct and started == {"autocomplete", "refine", "format_batch"} and admission.in_use == 0
+    print(f"After the bulk work: started {sorted(started)}")
+
+    # format gets the reserved slot too
+    admission = AdmissionController(slots)
+    bulk_release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(admission, "analyze", set(), bulk_release)) for _ in range(slots)]
+    await asyncio.sleep(0)
+    started = set()
+    tasks.append(asyncio.create_task(hold(admission, "format", started, bulk_release)))
+    await asyncio.sleep(0)
+    correct = correct and admission.in_use == slots and started == {"format"}
+    print(f"{slots} analyze requests: {slots - 1} started, format started {started == {'format'}}")
+    bulk_release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), 5)
+    return correct
+
+
+def main():
+    slots = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    correct = all(asyncio.run(check(count)) for count in range(2, slots + 1))
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == "__main__":
+    main()
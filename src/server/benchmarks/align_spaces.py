@@ -0,0 +1,74 @@
+"""
+Benchmark for TokenPositions against walking back token by token.
+
+Formats a builder chain of calls whose arguments are broken for alignment
+every two arguments, so every lookup walks back over the whole chain before
+it. The visitors run once with a TokenPositions index and once with a
+stand-in that walks back like they used to. The output must be identical.
+Run from src/server:
+
+    python benchmarks/align_spaces.py [calls ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeStyle.AlignmentVisitor import AlignmentVisitor
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from CodeStyle.FormattingVisitor import FormattingVisitor
+from CodeStyle.JavaParser import JavaParser
+from CodeStyle.TokenPositions import TokenPositions
+from incremental_format import SETTINGS
+
+
+class WalkingPositions(TokenPositions):
+    def line_width(self, index):
+        line = self.tokens.get(index).line
+        return self._walk(index, lambda token: token.line == line)
+
+    def width_since_whitespace(self, index):
+        return self._walk(index, lambda token: token.type != JavaParser.WS)
+
+
+def generate(calls, arguments=6):
+    values = ", ".join(f"value{index}" for index in range(arguments))
+    chain = "".join(f".with{call}({values})" for call in range(calls))
+    return f"public class Calls {{\n    public Builder build(Builder builder) {{\n        return builder{chain};\n    }}\n}}\n"
+
+
+def format_with(formatter, code, configs, positions_class):
+    """Formats code like start_formatting(), timing only the two visitor passes."""
+    tree, tokens = formatter.parse_java_code(formatter.clean_code(code))
+    start = time.perf_counter()
+    visitor = FormattingVisitor(tokens, configs)
+    visitor.positions = positions_class(tokens)
+    first_pass = visitor.get_formatted_code(tree)
+    elapsed = time.perf_counter() - start
+
+    tree, tokens = formatter.parse_java_code(first_pass)
+    start = time.perf_counter()
+    aligner = AlignmentVisitor(tokens, configs)
+    aligner.positions = positions_class(tokens)
+    second_pass = aligner.get_formatted_code(tree)
+    return second_pass, elapsed + time.perf_counter() - start
+
+
+def main():
+    sizes = [int(argument) for argument in sys.argv[1:]] or [25, 50, 100, 200]
+    configs = ConfigClass(SETTINGS)
+    formatter = CodeStyleFormatter()
+    formatter.configs = configs
+    print(f"{'calls':>9} {'walking':>10} {'TokenPositions':>15} {'speedup':>8}  identical")
+    for calls in sizes:
+        code = generate(calls)
+        expected, walking_seconds = format_with(formatter, code, configs, WalkingPositions)
+        text, index_seconds = format_with(formatter, code, configs, TokenPositions)
+        print(f"{calls:>9} {walking_seconds * 1000:>7.1f} ms {index_seconds * 1000:>12.1f} ms "
+              f"{walking_seconds / index_seconds:>7.1f}x  {text == expected}")
+
+
+if __name__ == "__main__":
+    main()
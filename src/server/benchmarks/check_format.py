@@ -0,0 +1,117 @@
+"""
+Benchmark and check for CodeStyleFormatter.check_formatting() against start_formatting().
+
+Builds a class of many methods, formats it and checks the formatted code, which
+has to conform with the same naming errors formatting it reports, then checks
+it with one extra space on a late line, which has to be found right there.
+Checks that the file of many top-level types of benchmarks/parallel_format.py
+does not conform and that its formatted code does, for every variation of the
+settings, although formatting that again adds spaces at the end of some lines,
+and that checking formatted code never fails. Times checking the conforming and
+the changed code against formatting it, and exits with status 1 when a check is
+wrong. Run from src/server:
+
+    python benchmarks/check_format.py [methods] [runs]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeStyle import FormatterPool
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from incremental_format import SETTINGS
+from parallel_format import VARIANTS, generate as generate_types
+
+METHOD = """
+    // Handles case {index}
+    public int handle{index}(int value, String Name) {{
+        int total = 0;
+        for (int i = 0; i < value; i++) {{
+            if (i % 2 == 0 && i != 4 || i > 8) {{
+                total += i;
+            }} else {{
+                total -= 1;
+            }}
+        }}
+        switch (value) {{
+            case 1:
+                total++;
+                break;
+            default:
+                total--;
+        }}
+        try {{
+            Object copy = (String) Name;
+        }} catch (RuntimeException e) {{
+            throw e;
+        }}
+        String message = "value " + value + " for " + Name;
+        System.out.println(message + lookup(Name, total * 2 + value));
+        return total;
+    }}
+"""
+
+
+def generate(methods):
+    header = ("package com.example;\n\nimport java.util.List;\nimport java.util.Map;\n\n/**\n * Sample.\n */\n"
+              "public class Sample extends Base {\n    private static final int LIMIT = 10;\n    private int Count;\n")
+    return header + "".join(METHOD.format(index=index) for index in range(methods)) + "}\n"
+
+
+def best_of(runs, function):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    methods = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    configs = ConfigClass(SETTINGS)
+    formatter = CodeStyleFormatter()
+    FormatterPool.warm_up(formatter)
+
+    code, errors = formatter.start_formatting(generate(methods), configs)
+    check = formatter.check_formatting(code, configs)
+    correct = check.conforming and check.errors == errors
+    print(f"{methods} methods, {len(code)} characters: conforming {check.conforming}, "
+          f"{len(check.errors)} naming errors, the same as formatting reports: {check.errors == errors}")
+
+    line = code.count("\n") - 5
+    offset = 0
+    for _ in range(line - 1):
+        offset = code.index("\n", offset) + 1
+    column = len(code[offset:code.index("\n", offset)]) - len(code[offset:code.index("\n", offset)].lstrip())
+    changed = code[:offset + column] + " " + code[offset + column:]
+    check = formatter.check_formatting(changed, configs)
+    found = not check.conforming and (check.line, check.column) == (line, column)
+    correct = correct and found
+    print(f"With an extra space at line {line}, column {column}: {check.message()}")
+
+    types = generate_types(10)
+    for name, settings in VARIANTS.items():
+        variant = ConfigClass(settings)
+        unformatted = formatter.check_formatting(types, variant)
+        formatted_types = formatter.start_formatting(types, variant)[0]
+        check = formatter.check_formatting(formatted_types, variant)
+        correct = correct and check.conforming and not unformatted.conforming
+        print(f"{name:<28} unformatted conforming {unformatted.conforming}, formatted conforming {check.conforming}, "
+              f"formats to itself {check.formatted_code == formatted_types}")
+
+    formatting = best_of(runs, lambda: formatter.start_formatting(code, configs))
+    checking = best_of(runs, lambda: formatter.check_formatting(code, configs))
+    stopping = best_of(runs, lambda: formatter.check_formatting(changed, configs))
+    print(f"{'format':<16} {formatting:8.1f} ms")
+    print(f"{'check':<16} {checking:8.1f} ms  ({checking / formatting:.2f}x)")
+    print(f"{'check changed':<16} {stopping:8.1f} ms  ({stopping / formatting:.2f}x)")
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == "__main__":
+    main()
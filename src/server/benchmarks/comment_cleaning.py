@@ -0,0 +1,83 @@
+"""
+Benchmark for the cost of comments when preparing code for parsing.
+
+Generates a class of plain members and one of the same members with line,
+block and Javadoc comments, and times CodeCleaner.clean_code() plus parsing
+its tokens, and the whole format, per thousand characters of input. Uses
+process time, so other load on the machine does not count. Run from
+src/server:
+
+    python benchmarks/comment_cleaning.py [members] [runs]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeStyle import CodeCleaner, FormatterPool
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from incremental_format import SETTINGS, MEMBER
+
+COMMENTED_MEMBER = """
+    /**
+     * Computes total number {index}.
+     * @param value the value
+     */
+    public int compute{index}(int value, int limit) {{ // entry
+        int result = 0; // running total
+        /* loop over the
+           whole range */
+        for (int i = 0; i < limit; i++) {{
+            // even values add, odd values subtract
+            if (i % 2 == 0) {{
+                result += value * i; // add
+            }} else {{
+                result -= i; /* subtract */
+            }}
+        }}
+        return result + total{index}; // done
+    }}
+"""
+
+
+def generate(template, members):
+    body = "".join(template.format(index=index) for index in range(members))
+    return f"package com.example.bench;\n\npublic class Large {{\n{body}}}\n"
+
+
+def fastest(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.process_time()
+        function()
+        times.append(time.process_time() - start)
+    return min(times)
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    configs = ConfigClass(SETTINGS)
+    formatter = CodeStyleFormatter()
+    FormatterPool.warm_up(formatter)
+    formatter.configs = configs
+
+    def clean_and_parse(code):
+        cleaned = CodeCleaner.clean_code(code, configs.indents)
+        formatter.parse_java_code(cleaned.code, cleaned.tokens)
+
+    print(f"{'class':<10} {'chars':>8} {'clean+parse':>12} {'per 1k':>8} {'format':>10} {'per 1k':>8}")
+    for name, template in (("plain", MEMBER), ("commented", COMMENTED_MEMBER)):
+        code = generate(template, members)
+        formatter.start_formatting(code, configs)
+        parse_seconds = fastest(lambda: clean_and_parse(code), runs)
+        format_seconds = fastest(lambda: formatter.start_formatting(code, configs), runs)
+        thousands = len(code) / 1000
+        print(f"{name:<10} {len(code):>8} {parse_seconds * 1000:>9.0f} ms {parse_seconds * 1000 / thousands:>5.1f} ms "
+              f"{format_seconds * 1000:>7.0f} ms {format_seconds * 1000 / thousands:>5.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark for EditBuffer against antlr4's TokenStreamRewriter.
+
+Runs FormattingVisitor over generated classes of growing size, once recording
+its edits in each, and times rendering them with getDefaultText(). The texts
+must be identical. Run from src/server:
+
+    python benchmarks/edit_buffer.py [members ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antlr4.TokenStreamRewriter import TokenStreamRewriter
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from CodeStyle.EditBuffer import EditBuffer
+from CodeStyle.FormattingVisitor import FormattingVisitor
+from incremental_format import SETTINGS, generate
+
+
+def render(formatter, code, configs, rewriter_class):
+    tree, tokens = formatter.parse_java_code(formatter.clean_code(code))
+    visitor = FormattingVisitor(tokens, configs)
+    visitor.rewriter = rewriter_class(tokens)
+    visitor.visit(tree)
+    start = time.perf_counter()
+    text = visitor.rewriter.getDefaultText()
+    return text, time.perf_counter() - start, len(tokens.tokens)
+
+
+def main():
+    sizes = [int(argument) for argument in sys.argv[1:]] or [25, 50, 100, 200, 400]
+    configs = ConfigClass(SETTINGS)
+    formatter = CodeStyleFormatter()
+    formatter.configs = configs
+    print(f"{'members':>8} {'tokens':>8} {'TokenStreamRewriter':>20} {'EditBuffer':>12} {'speedup':>8}  identical")
+    for members in sizes:
+        code = generate(members)
+        expected, rewriter_seconds, token_count = render(formatter, code, configs, TokenStreamRewriter)
+        text, buffer_seconds, _ = render(formatter, code, configs, EditBuffer)
+        print(f"{members:>8} {token_count:>8} {rewriter_seconds * 1000:>17.1f} ms {buffer_seconds * 1000:>9.1f} ms "
+              f"{rewriter_seconds / buffer_seconds:>7.1f}x  {text == expected}")
+
+
+if __name__ == "__main__":
+    main()
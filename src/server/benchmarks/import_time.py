@@ -0,0 +1,60 @@
+"""
+Import-time benchmark for the generated CodeStyle lexer and parser.
+
+Every sample imports the modules in a fresh interpreter, so nothing is shared
+between runs but the .pyc files on disk. Times importing the generated lexer
+and parser, which deserializes their ATNs, against importing FormatterPool,
+which the server imports and which only imports the parser when a worker
+formats. Run from src/server:
+
+    python benchmarks/import_time.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every server process has the runtime loaded already, so it is not timed
+IMPORT_PARSER = """
+import time
+import antlr4
+start = time.perf_counter()
+import CodeStyle.JavaLexer, CodeStyle.JavaParser
+print(time.perf_counter() - start)
+"""
+
+IMPORT_FORMATTER_POOL = """
+import sys, time
+import antlr4
+start = time.perf_counter()
+from CodeStyle import FormatterPool
+print(time.perf_counter() - start)
+assert "CodeStyle.JavaParser" not in sys.modules
+"""
+
+
+def sample(code):
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVER_DIRECTORY,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure(label, code, runs):
+    # The first run writes .pyc files and is not counted
+    sample(code)
+    times = [sample(code) for _ in range(runs)]
+    print(f"{label:<42} median {statistics.median(times) * 1000:7.1f} ms   min {min(times) * 1000:7.1f} ms")
+    return statistics.median(times)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    parser = measure("JavaLexer + JavaParser", IMPORT_PARSER, runs)
+    pool = measure("FormatterPool (parser imported lazily)", IMPORT_FORMATTER_POOL, runs)
+    print(f"The server process saves {(parser - pool) * 1000:.1f} ms by not importing the parser")
+
+
+if __name__ == "__main__":
+    main()
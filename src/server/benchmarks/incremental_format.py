@@ -0,0 +1,109 @@
+"""
+Benchmark for incremental formatting of a one-line edit in a large class.
+
+Formats a class of generated members once as a whole, edits one statement in
+the formatted output, and times formatting the edited document as a whole
+against IncrementalFormatter reformatting only the edited member. Checks that
+the edit, and one that adds a comment, come out the same as /format of the
+edited text, and exits with status 1 when they do not. Run from src/server:
+
+    python benchmarks/incremental_format.py [members] [runs]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeStyle import FormatterPool
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from CodeStyle.FormatCache import FormatCache
+from CodeStyle.IncrementalFormatter import IncrementalFormatter
+
+SETTINGS = {
+    "braceStyle": "attach",
+    "spaceAroundOperators": True,
+    "maxLineLength": 100,
+    "modifierOrder": {"class": ["public", "abstract", "final"], "method": ["public", "static", "final"]},
+    "namingConventions": {"class": "pascalcase", "method": "camelcase", "variable": "camelcase",
+                          "parameter": "camelcase", "constant": "uppercase"},
+    "imports": {"order": "sort", "merge": False},
+    "indents": {"size": 4, "type": "spaces", "switchCaseLabels": "no_indent"},
+    "aligns": {"afterOpenBracket": "align", "parametersBeforeAlignment": 2},
+}
+
+MEMBER = """
+    private int total{index} = {index};
+
+    public int compute{index}(int value, int limit) {{
+        int result = 0;
+        for (int i = 0; i < limit; i++) {{
+            if (i % 2 == 0) {{
+                result += value * i;
+            }} else {{
+                result -= i;
+            }}
+        }}
+        return result + total{index};
+    }}
+"""
+
+
+def generate(members):
+    body = "".join(MEMBER.format(index=index) for index in range(members))
+    return f"package com.example.bench;\n\npublic class Large {{\n{body}}}\n"
+
+
+def timed(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    configs = ConfigClass(SETTINGS)
+    settings_hash = FormatCache.settings_hash(SETTINGS)
+    formatter = CodeStyleFormatter()
+    FormatterPool.warm_up(formatter)
+
+    code = generate(members)
+    formatted_code, errors = formatter.start_formatting(code, configs)
+    middle = members // 2
+    statement = f"return result + total{middle};"
+    edited = formatted_code.replace(statement, f"return result - total{middle};")
+    commented = formatted_code.replace(statement, f"// the total of the edited member\n        {statement}")
+
+    incremental = IncrementalFormatter()
+
+    def format_incrementally(text=edited):
+        incremental.seed("Large.java", code, formatted_code, errors, settings_hash)
+        plan = incremental.plan("Large.java", text, settings_hash)
+        if plan is not None:
+            result = incremental.complete(plan, FormatterPool.format_members_job(plan.pending, configs))
+            if result is not None:
+                return result
+        return formatter.start_formatting(text, configs)
+
+    identical = True
+    print(f"{members} members, {code.count(chr(10))} lines")
+    for name, text in (("edited statement", edited), ("added comment", commented)):
+        same = format_incrementally(text) == formatter.start_formatting(text, configs)
+        identical = identical and same
+        print(f"{name:<24} identical to /format of the edited text: {same}")
+    whole = timed(lambda: formatter.start_formatting(edited, configs), runs)
+    only_edited = timed(format_incrementally, runs)
+    print(f"{'whole document':<24} median {whole * 1000:8.1f} ms")
+    print(f"{'edited member only':<24} median {only_edited * 1000:8.1f} ms")
+    print(f"Incremental formatting is {whole / only_edited:.1f}x faster")
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark for LineWrapper on long lines.
+
+Renders a statement of one call with many arguments, each a sum, through the
+AlignmentVisitor with maxLineLength 80, and times rendering and wrapping the
+text. The time per rendered piece should stay flat as the line grows. Also
+formats long class, constructor and method headers and a call chain with
+indented and with tab indentation, and exits with status 1 when a line of them
+is longer than maxLineLength, tabs counted as the indent size, or a line breaks
+inside System.out.println. Run from src/server:
+
+    python benchmarks/line_wrapping.py [arguments ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeStyle.AlignmentVisitor import AlignmentVisitor
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from incremental_format import SETTINGS
+
+
+HEADERS = """package com.example;
+
+public class AVeryLongServiceImplementationName extends AbstractBaseServiceImplementation implements FirstListener, SecondListener {
+    public AVeryLongServiceImplementationName(int first) throws IllegalStateException, IllegalArgumentException, UnsupportedOperationException {
+        this.first = first;
+    }
+
+    public void run() throws IllegalStateException, IllegalArgumentException, UnsupportedOperationException, CloneNotSupportedException {
+        System.out.println(message + String.valueOf(countOfEverything) + lookup("key" + countOfEverything, countOfEverything * 2));
+    }
+}
+"""
+
+
+def generate(arguments):
+    values = ", ".join(f"first{index} + second{index}" for index in range(arguments))
+    return f"public class Calls {{\n    public int total() {{\n        return sum({values});\n    }}\n}}\n"
+
+
+def main():
+    sizes = [int(argument) for argument in sys.argv[1:]] or [250, 1000, 4000]
+    settings = dict(SETTINGS, maxLineLength=80, aligns={"afterOpenBracket": False, "parametersBeforeAlignment": 2})
+    configs = ConfigClass(settings)
+    formatter = CodeStyleFormatter()
+    fits = True
+    for indent_type in ("spaces", "tabs"):
+        indents = dict(SETTINGS["indents"], type=indent_type)
+        code = formatter.start_formatting(HEADERS, ConfigClass(dict(settings, indents=indents)))[0]
+        longest = max(len(line.expandtabs(indents["size"])) for line in code.split("\n"))
+        # Only calls on what another call returns break before their dot, never a qualified name
+        whole = "System.out.println(" in code
+        fits = fits and longest <= 80 and whole
+        print(f"Headers indented with {indent_type}: longest line {longest} of at most 80, "
+              f"System.out.println kept whole: {whole}")
+    formatter.configs = configs
+    print(f"{'arguments':>9} {'pieces':>8} {'lines':>6} {'wrap':>10} {'per piece':>10}")
+    for arguments in sizes:
+        tree, tokens = formatter.parse_java_code(formatter.clean_code(generate(arguments)))
+        aligner = AlignmentVisitor(tokens, configs)
+        aligner.visit(tree)
+        start = time.perf_counter()
+        owners = []
+        parts = aligner.rewriter.getParts(owners)
+        text = aligner.wrapper.wrap(parts, owners)
+        elapsed = time.perf_counter() - start
+        print(f"{arguments:>9} {len(parts):>8} {text.count(chr(10)):>6} {elapsed * 1000:>7.1f} ms "
+              f"{elapsed * 1e6 / len(parts):>7.2f} us")
+    sys.exit(0 if fits else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark and check for ParallelFormatter on a file of many top-level types.
+
+Generates a file of classes, abstract classes, interfaces and enums after a
+block of imports, with comments at every depth, after the closing braces of
+types and between them, and names that break the naming conventions. Splits it
+into every number of chunks from two to one per worker and checks, for several
+variations of the settings, that the stitched chunks are byte-identical to
+formatting the file as a whole, naming errors included, and that the formatted
+file still parses. Then times formatting it as a whole against one chunk per
+worker: the work of all chunks, the longest chunk (what formatting takes with a
+worker per chunk) and a process pool of that many workers. Exits with status 1
+when an output differs or does not parse. Run from src/server:
+
+    python benchmarks/parallel_format.py [types] [workers]
+"""
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeStyle import FormatterPool
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from CodeStyle.ParallelFormatter import ParallelFormatter, format_chunk
+from incremental_format import SETTINGS
+
+VARIANTS = {
+    "attach, sorted imports": SETTINGS,
+    "break, tabs, merged imports": dict(SETTINGS, braceStyle="break", imports={"order": "preserve", "merge": True},
+                                        indents={"size": 4, "type": "tabs", "switchCaseLabels": "indent"}),
+    "short lines": dict(SETTINGS, maxLineLength=60, aligns={"afterOpenBracket": "dont_align", "parametersBeforeAlignment": 3}),
+    "no line length": dict(SETTINGS, maxLineLength=-1, aligns={"afterOpenBracket": "block_indent", "parametersBeforeAlignment": 2}),
+}
+
+TYPES = [
+    """/**
+ * Service number {index}.
+ */
+public class Service{index} extends Base implements Runnable {{
+    private static final int max_retries = {index};
+    private int Count;
+
+    public Service{index}(int Count) {{
+        this.Count = Count;
+    }}
+
+    @Override
+    public void run() {{
+        for (int i = 0; i < max_retries; i++) {{
+            // retry until it works
+            if (i % 2 == 0 && i != 4 || i > 8) {{
+                Count += i;
+            }}
+        }}
+        String message = "a message that is long enough to run past the end of the line it starts on";
+        System.out.println(message + String.valueOf(Count) + lookup("key" + Count, Count * 2 + max_retries));
+    }}
+
+    static class Entry{index} {{
+        int value = {index};
+    }}
+}}
+""",
+    """abstract class Shape{index} {{
+    abstract double Area();
+
+    public int scale(int value, int limit, int offset, int factor, int base) {{
+        Runnable task = new Runnable() {{
+            public void run() {{ System.out.println(Shape{index}.class.getName()); }}
+        }};
+        return value * limit + offset - factor / base;
+    }}
+}}
+""",
+    """interface Listener{index} {{
+    int LIMIT = {index};
+    void changed(String property);
+    default String describe() {{ return getClass().getSimpleName(); }}
+}} // listens for changes {index}
+""",
+    """enum State{index} {{
+    ACTIVE {{ int code() {{ return 1; }} }},
+    PAUSED,
+    STOPPED;
+
+    int code() {{ return ordinal(); }}
+}}
+/* end of State{index} */
+""",
+    """// Handlers for case {index}
+class Handler{index} {{
+    /* values that are
+       handled */
+    int[] values = {{1, 2, 3}};
+
+    void handle_case(int Selector) {{
+        switch (Selector) {{
+            case 1:
+                values[0]++;
+                break;
+            default: {{
+                values[1]--;
+            }}
+        }}
+        try {{
+            Object copy = (String) null;
+        }} catch (RuntimeException e) {{
+            throw e;
+        }} finally {{
+            values[2] = 0;
+        }}
+    }}
+}}
+""",
+]
+
+
+def generate(types):
+    header = "package com.example.generated;\n\nimport java.util.List;\nimport java.util.ArrayList;\nimport java.util.Map;\n\n"
+    # Sorted imports before anything but a class trip up the formatter
+    body = "\n".join(TYPES[0 if index == 0 else index % len(TYPES)].format(index=index) for index in range(types))
+    return header + body
+
+
+def main():
+    types = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    code = generate(types)
+    parallel = ParallelFormatter(min_size=0)
+    chunks = parallel.split(code, workers)
+    if chunks is None:
+        print("The file was not split")
+        sys.exit(1)
+    print(f"{types} top-level types, {len(code)} characters, {len(chunks)} chunks")
+
+    formatter = CodeStyleFormatter()
+    FormatterPool.warm_up(formatter)
+    identical = True
+    for name, settings in VARIANTS.items():
+        configs = ConfigClass(settings)
+        expected = formatter.start_formatting(code, configs)
+        # Naming errors come from parsing the formatted file, which only has syntax errors when formatting broke it
+        parses = formatter.syntax_errors == 0
+        differing = []
+        for count in range(2, workers + 1):
+            split = parallel.split(code, count)
+            result = split and parallel.complete([format_chunk(formatter, text, configs, index > 0, indent_level)
+                                                  for index, (text, indent_level) in enumerate(split)])
+            if not result or result[0] != expected[0] or result[1] != expected[1]:
+                differing.append(count)
+        identical = identical and parses and not differing
+        print(f"{name:<28} {len(expected[1]):>4} naming errors, formatted file parses: {parses}, "
+              f"identical to formatting the file as a whole: {not differing}"
+              + (f" (not in {differing} chunks)" if differing else ""))
+
+    configs = ConfigClass(SETTINGS)
+    start = time.process_time()
+    formatter.start_formatting(code, configs)
+    whole = time.process_time() - start
+    chunk_times = []
+    for index, (text, indent_level) in enumerate(chunks):
+        start = time.process_time()
+        format_chunk(formatter, text, configs, index > 0, indent_level)
+        chunk_times.append(time.process_time() - start)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=FormatterPool.init_worker) as pool:
+        # Waits for every worker to finish warming up
+        list(pool.map(time.sleep, [0.5] * workers))
+        start = time.perf_counter()
+        results = list(pool.map(FormatterPool.format_chunk_job, [text for text, _ in chunks], [configs] * len(chunks),
+                                [index > 0 for index in range(len(chunks))], [level for _, level in chunks]))
+        parallel.complete(results)
+        pooled = time.perf_counter() - start
+
+    print(f"{'whole file':<24} {whole * 1000:8.1f} ms")
+    print(f"{'all chunks':<24} {sum(chunk_times) * 1000:8.1f} ms")
+    print(f"{'longest chunk':<24} {max(chunk_times) * 1000:8.1f} ms  ({whole / max(chunk_times):.1f}x with a worker per chunk)")
+    print(f"{f'{workers} process workers':<24} {pooled * 1000:8.1f} ms  on {os.cpu_count()} CPUs")
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
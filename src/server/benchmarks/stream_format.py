@@ -0,0 +1,129 @@
+"""
+Benchmark and check for StreamFormatter: peak memory of formatting a large file
+a few top-level classes at a time against formatting it as a whole.
+
+Formats the generated file of benchmarks/parallel_format.py as a whole and in
+the chunks a memory limit allows, one after the other the way /format/stream
+does, and checks that the parts join into the same code and naming errors.
+Reports the peak memory tracemalloc sees for both, and their durations:
+streaming takes a little longer, since every chunk also formats the imports and
+a stub for the class before it again. Checks that no chunk takes more memory than
+StreamFormatter.estimate() gives it, nor do files of dense expressions, long
+comments or long strings formatted whole, and exits with status 1 when one
+does, the output differs, streaming goes over the limit or formatting a chunk
+is not stopped once it takes more memory than a tiny limit on a new
+pool worker. Run from src/server:
+
+    python benchmarks/stream_format.py [types] [limit MiB]
+"""
+import gc
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeStyle import FormatterPool
+from CodeStyle.CodeStyle import CodeStyleFormatter
+from CodeStyle.ConfigClass import ConfigClass
+from CodeStyle.ParallelFormatter import ChunkStitcher, format_chunk
+from CodeStyle.RangeFormatter import scan_types
+from CodeStyle.StreamFormatter import StreamFormatter, MemoryLimitExceeded, TOKEN_PATTERN, resident_memory
+from incremental_format import SETTINGS
+from parallel_format import generate
+
+DENSE = "    int f{index}(int a, int b) {{ return a + b * a - b / a + (a % b) * (a - b) + a * b * a * b - a + b; }}\n"
+COMMENTS = ("    /** Documentation of field {index}, which is described at length here so that the\n"
+            "     * comment takes up most of the file, as in heavily documented code.\n     */\n    int f{index};\n")
+STRINGS = "    String s{index} = \"a long string literal number {index} that takes most of the line up\";\n"
+
+
+def sample(member):
+    return "package p;\n\npublic class Sample {\n" + "".join(member.format(index=index) for index in range(150)) + "}\n"
+
+
+def measure(function):
+    """Runs function, returning its result, the peak memory it took in MiB and its duration in ms."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    duration = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return result, peak, duration
+
+
+def estimate(text, configs, indent_level=0):
+    types = scan_types(text)
+    depth = indent_level + (types[-1].classes_before + types[-1].classes if types else 1)
+    return StreamFormatter.estimate(len(text), len(TOKEN_PATTERN.findall(text)), text.count("\n"), depth, configs)
+
+
+def main():
+    types = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    limit = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+    code = generate(types)
+    configs = ConfigClass(SETTINGS)
+    formatter = CodeStyleFormatter()
+    FormatterPool.warm_up(formatter)
+    # The DFA states a file adds stay for good, so the first run leaves both measured runs with the same
+    formatter.start_formatting(code, configs)
+    streamer = StreamFormatter(int(limit * 1024 * 1024))
+
+    def stream():
+        stitcher = ChunkStitcher()
+        parts = []
+        errors = []
+        for index, (text, indent_level) in enumerate(streamer.chunks(code, configs)):
+            part = stitcher.add(format_chunk(formatter, text, configs, index > 0, indent_level))
+            if part is None:
+                return None
+            parts.append(part[0])
+            errors.extend(part[1])
+            gc.collect()
+        return "".join(parts), errors
+
+    print(f"{types} top-level types, {len(code)} characters, {len(list(streamer.chunks(code, configs)))} chunks")
+    expected, whole_peak, whole_time = measure(lambda: formatter.start_formatting(code, configs))
+    result, stream_peak, stream_time = measure(stream)
+    identical = result is not None and result[0] == expected[0] and result[1] == expected[1]
+
+    print(f"{'whole file':<12} {whole_peak:8.1f} MiB {whole_time:8.1f} ms")
+    print(f"{'streamed':<12} {stream_peak:8.1f} MiB {stream_time:8.1f} ms  (limit {limit} MiB)")
+    print(f"Identical to formatting the file as a whole: {identical}")
+
+    # Every measured peak against the estimate, which should never be below it
+    ratios = []
+    for index, (text, indent_level) in enumerate(streamer.chunks(code, configs)):
+        peak = measure(lambda: format_chunk(formatter, text, configs, index > 0, indent_level))[1]
+        ratios.append(peak * 1024 * 1024 / estimate(text, configs, indent_level))
+    print(f"{'chunks':<12} peak / estimate {min(ratios):.2f} to {max(ratios):.2f}")
+    for name, member in (("dense", DENSE), ("comments", COMMENTS), ("strings", STRINGS)):
+        text = sample(member)
+        formatter.start_formatting(text, configs)
+        peak = measure(lambda: formatter.start_formatting(text, configs))[1]
+        ratios.append(peak * 1024 * 1024 / estimate(text, configs))
+        print(f"{name:<12} peak / estimate {ratios[-1]:.2f}")
+
+    # A chunk that takes more than its limit is stopped, however it was planned. The limit is on how much
+    # the worker grows, so the chunk goes to a new one rather than this process, which has room left over
+    stopped = True
+    if resident_memory() is not None:
+        text, indent_level = list(streamer.chunks(code, configs))[-2]
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=FormatterPool.init_worker) as pool:
+            try:
+                pool.submit(FormatterPool.format_stream_job, 256 * 1024, "a chunk", FormatterPool.format_chunk_job,
+                            text, configs, True, indent_level).result()
+                stopped = False
+            except MemoryLimitExceeded as e:
+                print(f"{'256 KiB limit':<12} {e}")
+    sys.exit(0 if identical and stream_peak <= limit and max(ratios) <= 1 and stopped else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from CodeStyle.CodeStyle import CodeStyleFormatter
-from CodeSmell.CodeSmell import CodeSmellAnalyzer
-from CodeRefinement.CodeRefinement import CodeRefiner
-from AutoComplete.AutoComplete import AutoComplete
+from CodeStyle import FormatterPool
+from CodeStyle.ConfigClass import compile_config
+from CodeStyle.FormatCache import FormatCache
+from CodeStyle.IncrementalFormatter import IncrementalFormatter
+from CodeStyle.ParallelFormatter import ParallelFormatter, ChunkStitcher
+from CodeStyle.StreamFormatter import StreamFormatter, MemoryLimitExceeded
+from CodeStyle.StyleCheck import StyleCheck
+from EngineExecutor import EngineExecutor, workers_from_env
+from ModelRegistry import models, ModelDisabledError
+from Cancellation import AnalysisCancelled, CancellationToken
+from Session import AnalysisSession
+from Admission import AdmissionController, Overloaded
+import Metrics
 import asyncio
 import json
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import os
+import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,14 +34,70 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+requests_total = Metrics.registry.counter(
+    "codegator_requests_total", "HTTP requests handled", ("endpoint", "status"))
+requests_in_flight = Metrics.registry.gauge(
+    "codegator_requests_in_flight", "HTTP requests currently being handled", ("endpoint",))
+request_seconds = Metrics.registry.histogram(
+    "codegator_request_duration_seconds", "HTTP request latency", ("endpoint",))
+stream_documents_total = Metrics.registry.counter(
+    "codegator_format_stream_documents_total", "Documents sent to /format/stream by how they were formatted", ("outcome",))
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    endpoint = request.url.path
+    if endpoint == "/metrics":
+        return await call_next(request)
+    if not any(getattr(route, "path", None) == endpoint for route in app.routes):
+        # Keeps unknown paths from creating a label value each
+        endpoint = "other"
+    requests_in_flight.inc(endpoint=endpoint)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        requests_in_flight.dec(endpoint=endpoint)
+        request_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+        requests_total.inc(endpoint=endpoint, status=str(status))
+
 class FormatRequest(BaseModel):
     code: str
     settings: dict
+    # Lets unchanged members of the same document be reused from its previous format
+    document_id: str | None = None
+
+class Position(BaseModel):
+    line: int
+    character: int
+
+class Range(BaseModel):
+    start: Position
+    end: Position
+
+class RangeFormatRequest(BaseModel):
+    code: str
+    settings: dict
+    range: Range
+
+class BatchFile(BaseModel):
+    path: str
+    code: str
+
+class BatchFormatRequest(BaseModel):
+    files: list[BatchFile]
+    settings: dict
 
 class SmellRequest(BaseModel):
     code: str
     websocket_id: str
 
+class WorkspaceSmellRequest(BaseModel):
+    files: list[BatchFile]
+    websocket_id: str
+
 class RefinementRequest(BaseModel):
     code: str
     prompt: str
@@ -46,31 +113,78 @@ active_connections = {}
 
 main_event_loop = None
 
-analysis_tasks: dict[str, bool] = {}
+# One cancellation token per websocket client, handed to every analysis started for it
+analysis_tasks: dict[str, CancellationToken] = {}
+
+# Each engine runs on its own bounded pool, sized through CODEGATOR_<ENGINE>_WORKERS
+executors: dict[str, EngineExecutor] = {}
+
+# Units (classes, methods, prototypes) from all files of a workspace job share forward passes
+smell_batch_size = int(os.environ.get("CODEGATOR_SMELL_BATCH_SIZE", "32"))
+
+def run_model_job(name, method, *args):
+    # Resolved inside the worker, so a model's first (slow) load never blocks the event loop
+    return getattr(models.get(name), method)(*args)
+
+# Identical (code, settings) requests are answered from here instead of being formatted again
+format_cache = FormatCache(int(os.environ.get("CODEGATOR_FORMAT_CACHE_SIZE", "1024")),
+                           os.environ.get("CODEGATOR_FORMAT_CACHE_PATH"))
 
-autocomplete_instance = None
-codestyle_instance = None
-codesmell_instance = None
-coderefine_instance = None
+# Formatted top-level members of recently formatted documents, by document id
+incremental_formatter = IncrementalFormatter(int(os.environ.get("CODEGATOR_INCREMENTAL_DOCUMENTS", "64")))
+
+# Documents at least this long are split between their top-level classes across the format workers
+parallel_formatter = ParallelFormatter(int(os.environ.get("CODEGATOR_PARALLEL_FORMAT_MIN_SIZE", "65536")))
+
+# /format/stream formats documents in chunks whose parse trees fit in this many MiB, one chunk at a time
+stream_formatter = StreamFormatter(int(os.environ.get("CODEGATOR_STREAM_FORMAT_MEMORY_MB", "256")) * 1024 * 1024)
+
+# Shared, prioritized slots across endpoints; created at startup
+admission: AdmissionController = None
+
+def overloaded_error(e: Overloaded):
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# 'process' formats on a pool of pre-warmed worker processes, 'thread' stays in-process
+format_backend = os.environ.get("CODEGATOR_FORMAT_BACKEND", "process")
 
 @app.on_event("startup")
 async def startup_event():
     global main_event_loop
     main_event_loop = asyncio.get_event_loop()
-    global autocomplete_instance
-    autocomplete_instance = AutoComplete()
-    global codestyle_instance
-    codestyle_instance = CodeStyleFormatter()
-    global codesmell_instance
-    codesmell_instance = CodeSmellAnalyzer()
-    global coderefine_instance
-    coderefine_instance = CodeRefiner()
+    # Models load on first use unless listed in CODEGATOR_PRELOAD_MODELS
+    await asyncio.to_thread(models.preload)
+    format_cache.load()
+
+    if format_backend == "process":
+        executors["format"] = EngineExecutor("format", workers_from_env("format", os.cpu_count() or 1),
+                                             processes=True, initializer=FormatterPool.init_worker)
+    else:
+        executors["format"] = EngineExecutor("format", workers_from_env("format", 2))
+        executors["format"].submit(FormatterPool.warm_up)
+    executors["analyze"] = EngineExecutor("analyze", workers_from_env("analyze", 1))
+    executors["refine"] = EngineExecutor("refine", workers_from_env("refine", 1))
+    executors["autocomplete"] = EngineExecutor("autocomplete", workers_from_env("autocomplete", 1))
+
+    global admission
+    admission = AdmissionController.from_env(max(2, os.cpu_count() or 1))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    format_cache.save()
+    if "format" in executors:
+        try:
+            await executors["format"].run(FormatterPool.save_dfa_snapshot)
+        except Exception as e:
+            logger.warning(f"Could not save DFA snapshot: {e}")
+    for executor in executors.values():
+        executor.shutdown(wait=False)
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await websocket.accept()
     active_connections[client_id] = websocket
-    analysis_tasks[client_id] = False  # Initialize as not cancelled
+    analysis_tasks[client_id] = CancellationToken()
     logger.info(f"WebSocket connection established for client {client_id}")
     
     try:
@@ -84,18 +198,265 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         if client_id in active_connections:
             del active_connections[client_id]
         if client_id in analysis_tasks:
-            del analysis_tasks[client_id]
+            # Nobody is left to receive the result, so stop the work
+            analysis_tasks.pop(client_id).cancel()
         logger.info(f"Removed WebSocket connection for client {client_id}")
 
+async def run_session_job(session: AnalysisSession, job_id: str, message: dict, cancel_token: CancellationToken):
+    async with admission.admit("analyze"):
+        if message["type"] == "analyze":
+            return await executors["analyze"].run(
+                run_model_job, "smells", "start_analysis",
+                message["code"],
+                lambda percentage: session.report_progress(job_id, percentage),
+                cancel_token
+            )
+
+        files = {file["path"]: file["code"] for file in message["files"]}
+        smells, errors = await executors["analyze"].run(
+            run_model_job, "smells", "start_workspace_analysis",
+            files,
+            lambda path, percentage: session.report_progress(job_id, percentage, path),
+            smell_batch_size,
+            cancel_token,
+            lambda path, smells: session.report_partial(job_id, path, smells)
+        )
+        return {"results": smells, "errors": errors}
+
+@app.websocket("/ws/session/{session_id}")
+async def session_endpoint(websocket: WebSocket, session_id: str):
+    """
+    Multiplexed alternative to /ws/{client_id} + /analyze: one socket carries many jobs.
+
+    Client messages: {"type": "analyze", "job_id", "code"},
+    {"type": "analyze_workspace", "job_id", "files": [{"path", "code"}]} and {"type": "cancel", "job_id"}.
+    Server messages: progress, file_progress, partial, result, error and cancelled, all tagged with job_id.
+    """
+    await websocket.accept()
+    session = AnalysisSession(websocket)
+    session.start()
+    logger.info(f"Session {session_id} established")
+
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            job_id = message.get("job_id")
+            message_type = message.get("type")
+            if message_type == "cancel":
+                session.cancel_job(job_id)
+            elif message_type in ("analyze", "analyze_workspace") and job_id is not None:
+                try:
+                    session.start_job(job_id, lambda cancel_token, job_id=job_id, message=message:
+                                      run_session_job(session, job_id, message, cancel_token))
+                except ValueError as e:
+                    await session.send({"type": "error", "job_id": job_id, "detail": str(e)})
+            else:
+                await session.send({"type": "error", "job_id": job_id, "detail": f"Unsupported message type '{message_type}'"})
+    except WebSocketDisconnect:
+        logger.info(f"Session {session_id} disconnected")
+    except Exception as e:
+        logger.error(f"WebSocket error for session {session_id}: {e}")
+    finally:
+        session.close()
+        logger.info(f"Closed session {session_id}")
+
+async def format_document(code, settings, settings_hash, document_id):
+    # Only the members that changed since the document's last format are sent to the workers.
+    # Planning, splicing and seeding split the whole document, so they run off the event loop too
+    plan = await asyncio.to_thread(incremental_formatter.plan, document_id, code, settings_hash) if document_id else None
+    if plan is not None:
+        pending = plan.pending
+        results = await executors["format"].run(FormatterPool.format_members_job, pending, settings) if pending else []
+        formatted = await asyncio.to_thread(incremental_formatter.complete, plan, results)
+        if formatted is not None:
+            return formatted
+    formatted = None
+    executor = executors["format"]
+    # Threads would only take turns formatting the chunks, so only process workers split documents.
+    # Splitting scans the whole document and stitching goes over every chunk, so both run off the event loop
+    chunks = await asyncio.to_thread(parallel_formatter.split, code, executor.max_workers) if executor.processes else None
+    if chunks is not None:
+        results = await asyncio.gather(*(executor.run(FormatterPool.format_chunk_job, text, settings, index > 0, indent_level)
+                                         for index, (text, indent_level) in enumerate(chunks)))
+        formatted = await asyncio.to_thread(parallel_formatter.complete, results)
+    if formatted is None:
+        formatted = await executor.run(FormatterPool.format_job, code, settings)
+    formatted_code, errors = formatted
+    if document_id:
+        await asyncio.to_thread(incremental_formatter.seed, document_id, code, formatted_code, errors, settings_hash)
+    return formatted_code, errors
+
 @app.post("/format")
 async def format_code(request: FormatRequest):
     try:
-        formatted_code, errors = codestyle_instance.start_formatting(request.code, request.settings)
+        settings_hash = format_cache.settings_hash(request.settings)
+        cache_key = format_cache.key(request.code, settings_hash)
+        cached = format_cache.get(cache_key)
+        if cached:
+            formatted_code, errors = cached
+        else:
+            configs = compile_config(request.settings, settings_hash)
+            async with admission.admit("format"):
+                formatted_code, errors = await format_document(request.code, configs, settings_hash, request.document_id)
+            format_cache.put(cache_key, (formatted_code, errors))
         return {"formatted_code": formatted_code, "errors": errors}
+    except Overloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         logger.error(f"Format error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/format/check")
+async def check_format(request: FormatRequest):
+    """
+    Checks whether the code already matches the style, for CI: whether it conforms,
+    the first position formatting would change and the naming errors, at positions
+    in the code as sent.
+    """
+    try:
+        settings_hash = format_cache.settings_hash(request.settings)
+        cache_key = format_cache.key(request.code, settings_hash)
+        cached = format_cache.get(cache_key)
+        if cached:
+            # Naming errors are at positions in the formatted code, the same ones as in code that conforms
+            check = StyleCheck(request.code, *cached)
+            if check.conforming:
+                return check.to_dict()
+        configs = compile_config(request.settings, settings_hash)
+        async with admission.admit("format"):
+            check = await executors["format"].run(FormatterPool.check_job, request.code, configs)
+        if check.conforming:
+            format_cache.put(cache_key, (check.formatted_code, check.errors))
+        return check.to_dict()
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        logger.error(f"Format check error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/format/range")
+async def format_range(request: RangeFormatRequest):
+    """Formats the members enclosing a 0-based range and returns edits for them only."""
+    try:
+        start = (request.range.start.line, request.range.start.character)
+        end = (request.range.end.line, request.range.end.character)
+        async with admission.admit("format"):
+            edits, errors = await executors["format"].run(FormatterPool.format_range_job, request.code, request.settings, start, end)
+        return {"edits": edits, "errors": errors}
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        logger.error(f"Range format error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/format/batch")
+async def format_batch(request: BatchFormatRequest):
+    # Settings are shared by every file, so the config is built once for the whole batch
+    settings_hash = format_cache.settings_hash(request.settings)
+    try:
+        configs = compile_config(request.settings, settings_hash)
+    except Exception as e:
+        logger.error(f"Batch format settings error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def format_file(file: BatchFile):
+        try:
+            cache_key = format_cache.key(file.code, settings_hash)
+            cached = format_cache.get(cache_key)
+            if cached:
+                formatted_code, errors = cached
+            else:
+                # Files of an accepted batch wait for a slot at bulk priority instead of being shed
+                async with admission.admit("format_batch", bounded=False):
+                    formatted_code, errors = await executors["format"].run(FormatterPool.format_job, file.code, configs)
+                format_cache.put(cache_key, (formatted_code, errors))
+            return {"path": file.path, "formatted_code": formatted_code, "errors": errors}
+        except Exception as e:
+            logger.error(f"Format error in {file.path}: {e}")
+            return {"path": file.path, "formatted_code": None, "errors": [], "error": str(e)}
+
+    async def stream_results():
+        # Files fan out across the format workers and are streamed back in completion order
+        pending = [asyncio.ensure_future(format_file(file)) for file in request.files]
+        try:
+            for result in asyncio.as_completed(pending):
+                yield json.dumps(await result) + "\n"
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/format/stream")
+async def format_stream(request: FormatRequest):
+    """
+    Formats a document a few top-level classes at a time, for files too large to
+    parse at once, streaming NDJSON lines of {"formatted_code", "errors"} for each
+    part as it is done; joining the formatted_code of every line gives the document.
+    A part that cannot be formatted on its own ends the stream with an {"error"} line.
+    Documents that fit the memory limit come back whole on one line, since streaming
+    takes a little longer than formatting the document at once.
+
+    Every part is stopped once formatting it takes more memory than the limit. The
+    first part is formatted before the response starts, so that ends it with a 413,
+    and a later part ends the stream with an {"error", "status": 413} line.
+    """
+    async def format_part(part, job, *args):
+        # Parts of an accepted document wait for a slot at bulk priority instead of being shed
+        async with admission.admit("format_batch", bounded=False):
+            return await executors["format"].run(FormatterPool.format_stream_job, stream_formatter.memory_limit,
+                                                 part, job, *args)
+
+    try:
+        configs = compile_config(request.settings, format_cache.settings_hash(request.settings))
+        # Planning the chunks scans the whole document, and each chunk is built from it, so both run off the event loop
+        chunks = await asyncio.to_thread(stream_formatter.chunks, request.code, configs)
+        if chunks is None:
+            whole = await format_part("the document", FormatterPool.format_job, request.code, configs)
+            stream_documents_total.inc(outcome="whole")
+        else:
+            text, indent_level = await asyncio.to_thread(next, chunks)
+            first = await format_part("a top-level class", FormatterPool.format_chunk_job, text, configs, False, indent_level)
+    except MemoryLimitExceeded as e:
+        stream_documents_total.inc(outcome="too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Stream format error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream_parts():
+        if chunks is None:
+            formatted_code, errors = whole
+            yield json.dumps({"formatted_code": formatted_code, "errors": errors}) + "\n"
+            return
+        stitcher = ChunkStitcher()
+        result = first
+        while True:
+            part = stitcher.add(result)
+            if part is None:
+                stream_documents_total.inc(outcome="failed")
+                detail = (f"Could not format the document in parts after line {stitcher.line} of its formatted code; "
+                          f"format it with /format instead")
+                yield json.dumps({"error": detail}) + "\n"
+                return
+            yield json.dumps({"formatted_code": part[0], "errors": part[1]}) + "\n"
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            text, indent_level = chunk
+            try:
+                result = await format_part("a top-level class", FormatterPool.format_chunk_job, text, configs, True, indent_level)
+            except MemoryLimitExceeded as e:
+                stream_documents_total.inc(outcome="too_large")
+                yield json.dumps({"error": str(e), "status": 413}) + "\n"
+                return
+            except Exception as e:
+                logger.error(f"Stream format error: {e}")
+                result = None
+        stream_documents_total.inc(outcome="streamed")
+
+    return StreamingResponse(stream_parts(), media_type="application/x-ndjson")
+
 async def send_progress_update(websocket: WebSocket, percentage: int):
     try:
         await websocket.send_text(json.dumps({
@@ -105,17 +466,25 @@ async def send_progress_update(websocket: WebSocket, percentage: int):
     except Exception as e:
         logger.error(f"Error sending progress update: {e}")
 
+async def send_file_progress_update(websocket: WebSocket, path: str, percentage: int):
+    try:
+        await websocket.send_text(json.dumps({
+            "type": "file_progress",
+            "path": path,
+            "percentage": percentage
+        }))
+    except Exception as e:
+        logger.error(f"Error sending progress update: {e}")
+
 @app.post("/analyze")
 async def analyze_smells(request: SmellRequest):
     try:
         if request.websocket_id not in active_connections:
             raise HTTPException(status_code=400, detail="WebSocket connection not found")
 
+        cancel_token = analysis_tasks[request.websocket_id]
+
         def progress_callback(percentage):
-            # Check if analysis was cancelled
-            if analysis_tasks.get(request.websocket_id, True):
-                raise Exception("Analysis cancelled")
-                
             if request.websocket_id in active_connections:
                 websocket = active_connections[request.websocket_id]
                 asyncio.run_coroutine_threadsafe(
@@ -124,37 +493,116 @@ async def analyze_smells(request: SmellRequest):
                 )
             
         logger.info(f"Starting analysis for client {request.websocket_id}")
-        smells = await asyncio.to_thread(
-            codesmell_instance.start_analysis,
-            request.code,
-            progress_callback
-        )
+        async with admission.admit("analyze"):
+            smells = await executors["analyze"].run(
+                run_model_job, "smells", "start_analysis",
+                request.code,
+                progress_callback,
+                cancel_token
+            )
         logger.info(f"Analysis completed for client {request.websocket_id}")
         logger.info(f"Detected smells: {smells}")
         return smells
+    except ModelDisabledError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AnalysisCancelled:
+        raise HTTPException(status_code=499, detail="Analysis cancelled")
+    except Overloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         logger.error(f"Analysis error: {e}")
-        if str(e) == "Analysis cancelled":
-            raise HTTPException(status_code=499, detail="Analysis cancelled")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze/workspace")
+async def analyze_workspace(request: WorkspaceSmellRequest):
+    try:
+        if request.websocket_id not in active_connections:
+            raise HTTPException(status_code=400, detail="WebSocket connection not found")
+
+        cancel_token = analysis_tasks[request.websocket_id]
+
+        def progress_callback(path, percentage):
+            if request.websocket_id in active_connections:
+                websocket = active_connections[request.websocket_id]
+                asyncio.run_coroutine_threadsafe(
+                    send_file_progress_update(websocket, path, percentage),
+                    main_event_loop
+                )
+
+        files = {file.path: file.code for file in request.files}
+        logger.info(f"Starting workspace analysis of {len(files)} files for client {request.websocket_id}")
+        async with admission.admit("analyze"):
+            smells, errors = await executors["analyze"].run(
+                run_model_job, "smells", "start_workspace_analysis",
+                files,
+                progress_callback,
+                smell_batch_size,
+                cancel_token
+            )
+        logger.info(f"Workspace analysis completed for client {request.websocket_id}")
+        return {"results": smells, "errors": errors}
+    except HTTPException:
+        raise
+    except ModelDisabledError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AnalysisCancelled:
+        raise HTTPException(status_code=499, detail="Analysis cancelled")
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        logger.error(f"Workspace analysis error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def run_until_disconnected(http_request: Request, cancel_token: CancellationToken, job):
+    # Cancels the engine work as soon as the client goes away (e.g. an aborted axios request)
+    task = asyncio.ensure_future(job)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=0.1)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                cancel_token.cancel()
+                return await task
+    except asyncio.CancelledError:
+        cancel_token.cancel()
+        raise
+
 @app.post("/refine")
-async def refine_code(request: RefinementRequest):
+async def refine_code(request: RefinementRequest, http_request: Request):
     try:
-        refined_code = coderefine_instance.start_refinement(request.code, request.prompt)
+        cancel_token = CancellationToken()
+        async with admission.admit("refine"):
+            refined_code = await run_until_disconnected(http_request, cancel_token, executors["refine"].run(
+                run_model_job, "refinement", "start_refinement", request.code, request.prompt, cancel_token))
         logger.info(f"Refined code: {refined_code}")
         return {"refined_code": refined_code}
+    except AnalysisCancelled:
+        raise HTTPException(status_code=499, detail="Refinement cancelled")
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except ModelDisabledError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Refinement error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/autocomplete")
-async def autocomplete_code(request: CompletionRequest):
+async def autocomplete_code(request: CompletionRequest, http_request: Request):
     try:
-        completed_code = autocomplete_instance.predict_completion(request.code, request.context)
+        cancel_token = CancellationToken()
+        async with admission.admit("autocomplete"):
+            completed_code = await run_until_disconnected(http_request, cancel_token, executors["autocomplete"].run(
+                run_model_job, "autocomplete", "predict_completion", request.code, request.context, cancel_token))
         logger.info(f"Autocomplete prediction:")
         logger.info(f"{completed_code}")
         return {"completion": completed_code}
+    except AnalysisCancelled:
+        raise HTTPException(status_code=499, detail="Completion cancelled")
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except ModelDisabledError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Completion error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -163,8 +611,9 @@ async def autocomplete_code(request: CompletionRequest):
 async def cancel_analysis(request: CancelRequest):
     try:
         for websocket_id in request.websocket_ids:
-            # Mark the analysis as cancelled
-            analysis_tasks[websocket_id] = True
+            # Only the analyses of this client are cancelled
+            if websocket_id in analysis_tasks:
+                analysis_tasks[websocket_id].cancel()
             
             # Close the WebSocket connection if it exists
             if websocket_id in active_connections:
@@ -177,6 +626,48 @@ async def cancel_analysis(request: CancelRequest):
         logger.error(f"Error cancelling analysis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/models")
+async def model_status():
+    return models.status()
+
+def collect_engine_metrics():
+    queue_depth = Metrics.Gauge("codegator_executor_queue_depth", "Jobs waiting for an engine worker", ("engine",))
+    running = Metrics.Gauge("codegator_executor_running", "Jobs currently running on an engine", ("engine",))
+    completed = Metrics.Counter("codegator_executor_jobs_total", "Jobs finished by an engine", ("engine", "outcome"))
+    for name, executor in executors.items():
+        stats = executor.stats()
+        queue_depth.set(stats["queue_depth"], engine=name)
+        running.set(stats["running"], engine=name)
+        completed.inc(stats["completed"] - stats["failed"], engine=name, outcome="success")
+        completed.inc(stats["failed"], engine=name, outcome="failure")
+
+    cache_stats = format_cache.stats()
+    cache_entries = Metrics.Gauge("codegator_format_cache_entries", "Entries in the format result cache")
+    cache_entries.set(cache_stats["entries"])
+    cache_events = Metrics.Counter("codegator_format_cache_events_total", "Format cache lookups and evictions", ("event",))
+    for event in ("hits", "misses", "evictions"):
+        cache_events.inc(cache_stats[event], event=event)
+
+    model_loaded = Metrics.Gauge("codegator_model_loaded", "Whether a model is loaded (1) or not (0)", ("model",))
+    for name, status in models.status().items():
+        model_loaded.set(int(status["loaded"]), model=name)
+
+    return [queue_depth, running, completed, cache_entries, cache_events, model_loaded]
+
+Metrics.registry.add_collector(collect_engine_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(Metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/format/cache")
+async def format_cache_stats():
+    return dict(format_cache.stats(), incremental=incremental_formatter.stats())
+
+@app.get("/executors")
+async def executor_stats():
+    return {name: executor.stats() for name, executor in executors.items()}
+
 
 if __name__ == "__main__":
     import uvicorn